@@ -0,0 +1,4 @@
+## add libraries
+from .ttl_cache import *
+from .recent_set import *
+from .single_flight import *
\ No newline at end of file
@@ -0,0 +1,51 @@
+import threading
+import time
+
+class RecentSet:
+    """
+    Thread safe set of recently seen keys with fixed memory. Keys are kept in a ring of
+    maxsize slots, the oldest key is forgotten when the ring is full or after ttl seconds.
+    Each slot holds a reference to the key, its time and a dict entry, about 250 bytes for a
+    36 character uuid string, so the default 4096 slots use about 1 MB
+    """
+    def __init__(self, maxsize: int = 4096, ttl: float = None):
+        """
+        maxsize: number of slots in the ring, if 0 nothing is remembered
+        ttl: seconds a key is remembered, if None keys are only forgotten when the ring is full
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.ring = [None] * maxsize #(key, seen at) per slot
+        self.slots = {} #key -> slot in the ring
+        self.next = 0 #slot the next key is written to
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.slots)
+
+    def seen(self, key) -> bool:
+        """
+        Return True if the key was seen recently, else remember it and return False
+        """
+        if self.maxsize <= 0:
+            self.misses += 1
+            return False
+        now = time.monotonic()
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is not None and (self.ttl is None or now - self.ring[slot][1] < self.ttl):
+                self.hits += 1
+                return True
+            self.misses += 1
+            if slot is not None: #expired, free its slot
+                self.ring[slot] = None
+                del self.slots[key]
+            old = self.ring[self.next]
+            if old is not None:
+                del self.slots[old[0]]
+            self.ring[self.next] = (key, now)
+            self.slots[key] = self.next
+            self.next = (self.next + 1) % self.maxsize
+        return False
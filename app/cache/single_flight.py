@@ -0,0 +1,43 @@
+import threading
+from concurrent.futures import Future
+
+class SingleFlight:
+    """
+    Concurrent calls for the same key wait on the one in flight and share its result
+    or exception instead of making the same call again
+    """
+    def __init__(self):
+        self.calls = {} #key -> Future of the call in flight
+        self.lock = threading.Lock()
+        self.calls_made = 0
+        self.calls_shared = 0
+
+    def __len__(self):
+        return len(self.calls)
+
+    def do(self, key, fn, *args, **kwargs):
+        """
+        Return fn(*args, **kwargs), if a call for key is in flight wait for its result instead.
+        key: identifies the call, calls with the same key must return the same result
+        """
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+                self.calls_made += 1
+            else:
+                self.calls_shared += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self.lock:
+                del self.calls[key]
@@ -0,0 +1,101 @@
+import threading
+import time
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Thread safe cache where entries expire after a time to live (ttl).
+    When maxsize is reached the least recently used entry is evicted
+    """
+    def __init__(self, maxsize: int = None, ttl: float = None):
+        """
+        maxsize: max number of entries, if None the cache is unbounded
+        ttl: default seconds an entry lives, if None entries do not expire
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict() #key -> (expires at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return self._live(key) is not None
+
+    def _live(self, key):
+        """
+        Return the key's (expires at, value) if it has not expired, else None.
+        Caller must hold the lock
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.monotonic():
+            del self.entries[key]
+            return None
+        return entry
+
+    def get(self, key, default=None):
+        """
+        Return the key's value or default if it is missing or expired
+        """
+        with self.lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_stale(self, key, default=None) -> tuple:
+        """
+        Like get() but an expired entry is kept and returned so it can be refreshed.
+        Returns (value, expired) or (default, True) if the key is missing, only unexpired entries count as hits
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default, True
+            self.entries.move_to_end(key)
+            expired = entry[0] is not None and entry[0] <= time.monotonic()
+            if expired:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry[1], expired
+
+    def set(self, key, value, ttl: float = None):
+        """
+        Set the key's value, ttl overrides the cache's default time to live
+        """
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self.lock:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+            if self.maxsize is not None:
+                while len(self.entries) > self.maxsize:
+                    self.entries.popitem(last=False)
+        return
+
+    def pop(self, key, default=None):
+        """
+        Remove the key and return its value or default if it is missing
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        """
+        Remove all entries
+        """
+        with self.lock:
+            self.entries.clear()
+        return
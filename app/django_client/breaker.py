@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+import requests
+
+class CircuitOpen(requests.exceptions.ConnectionError):
+    """
+    Raised instead of calling a server the circuit breaker considers down
+    """
+
+class CircuitBreaker:
+    """
+    Stops calls to a server after threshold consecutive failures (open). Once reset_timeout
+    passes a single probe call is let through (half open), its success closes the breaker
+    and its failure opens it again
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, threshold: int = 5, reset_timeout: float = 30):
+        """
+        name: name of the server used in logs
+        threshold: consecutive failures that open the breaker
+        reset_timeout: seconds the breaker stays open before probing the server
+        """
+        self.name = name
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0 #consecutive
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+        self.transitions = {self.CLOSED: 0, self.OPEN: 0, self.HALF_OPEN: 0} #times each state was entered
+        self.rejected = 0
+
+    def _transition(self, state: str):
+        """
+        Change state and log it. Caller must hold the lock
+        """
+        logging.warning(f"CircuitBreaker: {self.name} {self.state} -> {state} after {self.failures} consecutive failures")
+        self.state = state
+        self.transitions[state] += 1
+        if state == self.OPEN:
+            self.opened_at = time.monotonic()
+        return
+
+    def allow(self) -> bool:
+        """
+        Return True if a call can be made. While half open only the probe is allowed
+        """
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.CLOSED or (self.state == self.HALF_OPEN and not self.probing):
+                self.probing = self.state == self.HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def success(self):
+        """
+        Record a call the server handled
+        """
+        with self.lock:
+            self.failures = 0
+            self.probing = False
+            if self.state != self.CLOSED:
+                self._transition(self.CLOSED)
+        return
+
+    def failure(self):
+        """
+        Record a call that failed because the server is unreachable or unavailable
+        """
+        with self.lock:
+            self.failures += 1
+            self.probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self.failures >= self.threshold):
+                self._transition(self.OPEN)
+        return
+
+    def release(self):
+        """
+        Record a call that ended without telling if the server is up, a half open breaker can probe again
+        """
+        with self.lock:
+            self.probing = False
+        return
+
+    def stats(self) -> dict:
+        """
+        Return the state, consecutive failures, times each state was entered and calls rejected
+        """
+        with self.lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "transitions": dict(self.transitions),
+                "rejected": self.rejected
+            }
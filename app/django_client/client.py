@@ -1,21 +1,57 @@
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 import logging
 import argparse
 import sys
 import os
+import time
+import threading
+from contextlib import contextmanager
 from urllib.parse import urljoin
 from argparse import Namespace
 from enum import Enum
+from .outbox import *
+from .retry import *
+from .breaker import *
+from .ratelimit import *
+try:  # production # pragma: no cover
+    from cache import TTLCache, SingleFlight
+except ImportError:  # testing
+    from app.cache import TTLCache, SingleFlight
 
 class HttpMethod(Enum):
-    GET = requests.get
-    POST = requests.post
-    PATCH = requests.patch
+    GET = "GET"
+    POST = "POST"
+    PATCH = "PATCH"
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """
+    Raised when a call is made after the calling thread's deadline passed
+    """
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter that applies timeout() to requests sent without a timeout
+    """
+    def __init__(self, timeout, *args, **kwargs):
+        """
+        timeout: function that returns the (connect, read) timeout to use
+        """
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout()
+        return super().send(request, **kwargs)
 
 class DjangoClient:
     """
     Django client to call Api(s)
     """
+    #status codes that mean the server could not handle the call right now
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
 
     def __init__(self, args: Namespace):
         self.args = args
@@ -27,6 +63,212 @@ class DjangoClient:
         self.LK_ROUTER = self.args.lorawan_key_router
         self.LD_ROUTER = self.args.lorawan_device_router
         self.SH_ROUTER = self.args.sensor_hardware_router
+        #records rarely stop existing so hits live long, 404s expire quickly
+        self.exists_ttl = self.args.exists_ttl
+        self.not_exists_ttl = self.args.not_exists_ttl
+        self.exists = TTLCache(maxsize=4096) #api endpoint -> bool
+        #concurrent GETs of the same endpoint share one call, the tracker uses it for chirpstack calls too
+        self.flights = SingleFlight()
+        self.connect_timeout = self.args.connect_timeout
+        self.read_timeout = self.args.read_timeout
+        self.local = threading.local() #per thread deadline
+        self.latency = {} #"METHOD router" -> {"count", "total", "max"} in seconds
+        self.latency_lock = threading.Lock()
+        self.session = self.create_session()
+        #retries per method, a POST is only retried when it can not create a duplicate
+        self.retries = {
+            HttpMethod.GET: self.args.get_retries,
+            HttpMethod.PATCH: self.args.patch_retries,
+            HttpMethod.POST: self.args.post_retries
+        }
+        self.retry_budget = RetryBudget(self.args.retry_budget)
+        #calls fail fast while the server is down, the tracker retries the sync and mutations wait in the outbox
+        self.breaker = CircuitBreaker(self.server, self.args.breaker_threshold, self.args.breaker_reset)
+        #separate budgets so reads can not starve writes, keeps the load on the shared server predictable
+        self.read_limit = TokenBucket(self.args.read_rate, self.args.read_burst)
+        self.write_limit = TokenBucket(self.args.write_rate, self.args.write_burst)
+        #mutations that could not be sent are kept in the outbox and sent by a background flusher
+        self.outbox = Outbox(self.args.outbox) if self.args.outbox else None
+        self.outbox_stop = threading.Event()
+        self.record_locks = {} #record -> lock ordering direct mutations and the drain of its queued ones
+        self.record_locks_lock = threading.Lock()
+        self.flusher = None
+        if self.outbox is not None:
+            self.flusher = threading.Thread(target=self.flush_outbox, name="outbox-flusher", daemon=True)
+            self.flusher.start()
+
+    def create_session(self) -> requests.Session:
+        """
+        Create a session that keeps connections to the server open and reuses them
+        (skipping the TCP and TLS handshake) instead of opening a connection per call
+        """
+        session = requests.Session()
+        self.adapter = TimeoutHTTPAdapter(self.timeout, pool_connections=1, pool_maxsize=self.args.pool_size)
+        session.mount("https://", self.adapter)
+        session.mount("http://", self.adapter)
+        return session
+
+    def connection_stats(self) -> dict:
+        """
+        Return how many requests were sent and how many of them reused an open connection
+        """
+        pools = self.adapter.poolmanager.pools
+        requests_sent = 0
+        connections = 0
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests_sent += pool.num_requests
+                connections += pool.num_connections
+        return {
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": max(requests_sent - connections, 0)
+        }
+
+    def close(self):
+        """
+        Stop the outbox flusher and close the session's open connections
+        """
+        self.outbox_stop.set()
+        if self.flusher is not None:
+            self.flusher.join()
+            self.outbox.close()
+        self.session.close()
+        return
+
+    def flush_outbox(self):
+        """
+        Loop that drains the outbox every outbox_interval seconds until close()
+        """
+        while not self.outbox_stop.wait(self.args.outbox_interval):
+            try:
+                if len(self.outbox) > 0:
+                    self.drain_outbox()
+            except Exception as e:
+                logging.exception(f"DjangoClient.flush_outbox(): {e}")
+
+    def drain_outbox(self) -> int:
+        """
+        Send the queued mutations oldest first, stopping at the first one the server can not handle right now.
+        Mutations the server rejects are dropped. Returns the number of mutations sent
+        """
+        start = time.monotonic()
+        sent = 0
+        for seq, _, method, _, _ in self.outbox.peek():
+            row = self.outbox.get(seq)
+            if row is None: #superseded by a mutation sent directly since peek()
+                continue
+            #a direct mutation of the record holds its lock until it superseded the queued values,
+            # so the row is read again under the lock and older values are never sent after newer ones
+            with self.record_lock(row[1]):
+                row = self.outbox.get(seq)
+                if row is None:
+                    continue
+                version, _, endpoint, data = row
+                try:
+                    response = self.call_api(HttpMethod(method), endpoint, data, queue=False)
+                except requests.exceptions.RequestException as e:
+                    logging.warning(f"DjangoClient.drain_outbox(): server unreachable, {len(self.outbox)} mutations pending: {e}")
+                    break
+            if response['json_body'] is None and response['status_code'] in self.RETRY_STATUSES:
+                break
+            if response['json_body'] is None:
+                logging.error(f"DjangoClient.drain_outbox(): {method} {endpoint} was rejected, dropped from the outbox")
+                self.outbox.remove(seq, version, dropped=True)
+            elif self.outbox.remove(seq, version):
+                sent += 1
+        elapsed = time.monotonic() - start
+        self.outbox.drain_rate = sent / elapsed if sent and elapsed > 0 else 0.0
+        return sent
+
+    def record_lock(self, record: str) -> threading.Lock:
+        """
+        Return the lock held while a mutation of the record is sent with the outbox in use
+        record: the record's endpoint, as kept in the outbox
+        """
+        with self.record_locks_lock:
+            return self.record_locks.setdefault(record, threading.Lock())
+
+    def queue_mutation(self, method: HttpMethod, endpoint: str, data: dict, record: str, reason):
+        """
+        Keep a mutation that could not be sent in the outbox, if there is one
+        record: the record's endpoint, defaults to endpoint
+        """
+        if self.outbox is None or method == HttpMethod.GET or data is None:
+            return
+        self.outbox.put(method.value, record or endpoint, endpoint, data)
+        logging.warning(f"DjangoClient.queue_mutation(): {method.value} {endpoint} queued in the outbox: {reason}")
+        return
+
+    @contextmanager
+    def deadline(self, seconds: float):
+        """
+        Calls made by this thread inside the with block share a deadline of seconds,
+        once it passes calls raise DeadlineExceeded instead of waiting on the server
+        """
+        self.local.deadline = time.monotonic() + seconds
+        try:
+            yield
+        finally:
+            self.local.deadline = None
+
+    def with_deadline(self, fn):
+        """
+        Wrap fn so calls it makes from another thread share this thread's deadline
+        """
+        deadline = getattr(self.local, "deadline", None)
+        def run(*args, **kwargs):
+            previous = getattr(self.local, "deadline", None)
+            self.local.deadline = deadline
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.local.deadline = previous
+        return run
+
+    def timeout(self) -> tuple:
+        """
+        Return the (connect, read) timeout for the next call capped by the thread's deadline.
+        Raises DeadlineExceeded if the deadline passed
+        """
+        deadline = getattr(self.local, "deadline", None)
+        if deadline is None:
+            return (self.connect_timeout, self.read_timeout)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded("DjangoClient.timeout(): deadline exceeded")
+        return (min(self.connect_timeout, remaining), min(self.read_timeout, remaining))
+
+    def record_latency(self, method: HttpMethod, endpoint: str, seconds: float):
+        """
+        Record the latency of a call under its method and router
+        """
+        routers = [self.LC_ROUTER, self.LK_ROUTER, self.LD_ROUTER, self.SH_ROUTER]
+        router = next((r for r in routers if endpoint.startswith(r)), endpoint)
+        key = f"{method.value} {router}"
+        with self.latency_lock:
+            stats = self.latency.setdefault(key, {"count": 0, "total": 0.0, "max": 0.0})
+            stats["count"] += 1
+            stats["total"] += seconds
+            stats["max"] = max(stats["max"], seconds)
+        return
+
+    def latency_stats(self) -> dict:
+        """
+        Return the count, average and max latency in seconds per method and router
+        """
+        with self.latency_lock:
+            return {
+                key: {"count": stats["count"], "avg": stats["total"] / stats["count"], "max": stats["max"]}
+                for key, stats in self.latency.items()
+            }
+
+    def limit_stats(self) -> dict:
+        """
+        Return the read and write rate limit stats
+        """
+        return {"read": self.read_limit.stats(), "write": self.write_limit.stats()}
 
     def get_lc(self, dev_eui: str) -> dict:
         """
@@ -40,27 +282,37 @@ class DjangoClient:
         Create LoRaWAN connection
         """
         api_endpoint = f"{self.LC_ROUTER}"
-        return  self.call_api(HttpMethod.POST, api_endpoint, data)
+        record = f"{self.LC_ROUTER}{self.vsn}/{data.get('lorawan_device')}/"
+        response = self.call_api(HttpMethod.POST, api_endpoint, data, record)
+        if response['json_body']:
+            self.exists.set(f"{self.LC_ROUTER}{self.vsn}/{data.get('lorawan_device')}/", True, self.exists_ttl)
+        return response
 
-    def update_lc(self, dev_eui: str, data: dict) -> dict:
+    def update_lc(self, dev_eui: str, data: dict, low_priority: bool = False) -> dict:
         """
         Update LoRaWAN connection
+        low_priority: True if the update can be deferred when the rate limit is reached
         """
         api_endpoint = f"{self.LC_ROUTER}{self.vsn}/{dev_eui}/"
-        return  self.call_api(HttpMethod.PATCH, api_endpoint, data)
+        return  self.call_api(HttpMethod.PATCH, api_endpoint, data, low_priority=low_priority)
 
     def lc_search(self, dev_eui: str) -> bool:
         """
         Search the db for a lorawan connection return true if found
         """
         api_endpoint = f"{self.LC_ROUTER}{self.vsn}/{dev_eui}/"
+        exists = self.exists.get(api_endpoint)
+        if exists is not None: #if the answer is cached...
+            return exists
         response = self.call_api(HttpMethod.GET, api_endpoint)
 
         if response['json_body']: #if json_body is not None (record found)...
+            self.exists.set(api_endpoint, True, self.exists_ttl)
             return True
         else:  #if json_body is None...
-            status_code = response['headers'].get('status-code')
+            status_code = response['status_code']
             if status_code == 404: #if not found...
+                self.exists.set(api_endpoint, False, self.not_exists_ttl)
                 return False
             else: #if unknown status code...
                 logging.error(f"Unexpected status code in DjangoClient.lc_search() for {api_endpoint}: {status_code}")
@@ -78,27 +330,37 @@ class DjangoClient:
         Create LoRaWAN device
         """
         api_endpoint = f"{self.LD_ROUTER}"
-        return  self.call_api(HttpMethod.POST, api_endpoint, data)
+        record = f"{self.LD_ROUTER}{data.get('deveui')}/"
+        response = self.call_api(HttpMethod.POST, api_endpoint, data, record)
+        if response['json_body']:
+            self.exists.set(f"{self.LD_ROUTER}{data.get('deveui')}/", True, self.exists_ttl)
+        return response
 
-    def update_ld(self, dev_eui: str, data: dict) -> dict:
+    def update_ld(self, dev_eui: str, data: dict, low_priority: bool = False) -> dict:
         """
         Update LoRaWAN device
+        low_priority: True if the update can be deferred when the rate limit is reached
         """
         api_endpoint = f"{self.LD_ROUTER}{dev_eui}/"
-        return  self.call_api(HttpMethod.PATCH, api_endpoint, data)
+        return  self.call_api(HttpMethod.PATCH, api_endpoint, data, low_priority=low_priority)
 
     def ld_search(self, dev_eui: str) -> bool:
         """
         Search the db for a lorawan device return true if found
         """
         api_endpoint = f"{self.LD_ROUTER}{dev_eui}/"
+        exists = self.exists.get(api_endpoint)
+        if exists is not None: #if the answer is cached...
+            return exists
         response = self.call_api(HttpMethod.GET, api_endpoint)
 
         if response['json_body']: #if json_body is not None (record found)...
+            self.exists.set(api_endpoint, True, self.exists_ttl)
             return True
         else:  #if json_body is None...
-            status_code = response['headers'].get('status-code')
+            status_code = response['status_code']
             if status_code == 404: #if not found...
+                self.exists.set(api_endpoint, False, self.not_exists_ttl)
                 return False
             else: #if unknown status code...
                 logging.error(f"Unexpected status code in DjangoClient.ld_search() for {api_endpoint}: {status_code}")
@@ -111,12 +373,14 @@ class DjangoClient:
         api_endpoint = f"{self.LK_ROUTER}{self.vsn}/{dev_eui}/"
         return  self.call_api(HttpMethod.GET, api_endpoint)
 
-    def create_lk(self, data: dict) -> dict:
+    def create_lk(self, dev_eui: str, data: dict) -> dict:
         """
         Create LoRaWAN key
+        dev_eui: the key's device, its key is retrieved from the same endpoint as get_lk()
         """
         api_endpoint = f"{self.LK_ROUTER}"
-        return  self.call_api(HttpMethod.POST, api_endpoint, data)
+        record = f"{self.LK_ROUTER}{self.vsn}/{dev_eui}/"
+        return  self.call_api(HttpMethod.POST, api_endpoint, data, record)
 
     def update_lk(self, dev_eui: str, data: dict) -> dict:
         """
@@ -137,7 +401,11 @@ class DjangoClient:
         Create Sensor Hardware
         """
         api_endpoint = f"{self.SH_ROUTER}"
-        return self.call_api(HttpMethod.POST, api_endpoint, data)
+        record = f"{self.SH_ROUTER}{data.get('hw_model')}/"
+        response = self.call_api(HttpMethod.POST, api_endpoint, data, record)
+        if response['json_body']:
+            self.exists.set(f"{self.SH_ROUTER}{data.get('hw_model')}/", True, self.exists_ttl)
+        return response
 
     def update_sh(self, hw_model: str, data: dict) -> dict:
         """
@@ -151,44 +419,231 @@ class DjangoClient:
         Search the db for a sensor hardware return true if found
         """
         api_endpoint = f"{self.SH_ROUTER}{hw_model}/"
+        exists = self.exists.get(api_endpoint)
+        if exists is not None: #if the answer is cached...
+            return exists
         response = self.call_api(HttpMethod.GET, api_endpoint)
 
         if response['json_body']: #if json_body is not None (record found)...
+            self.exists.set(api_endpoint, True, self.exists_ttl)
             return True
         else:  #if json_body is None...
-            status_code = response['headers'].get('status-code')
+            status_code = response['status_code']
             if status_code == 404: #if not found...
+                self.exists.set(api_endpoint, False, self.not_exists_ttl)
                 return False
             else: #if unknown status code...
                 logging.error(f"Unexpected status code in DjangoClient.sh_search() for {api_endpoint}: {status_code}")
                 return False
 
-    def call_api(self, method: HttpMethod, endpoint: str, data: dict = None) -> dict:
+    def throttle(self, method: HttpMethod, low_priority: bool = False) -> bool:
+        """
+        Take a token from the read budget for a GET or the write budget otherwise.
+        Waits for a token within the thread's deadline, low priority calls do not wait.
+        Returns False if no token was available
+        """
+        bucket = self.read_limit if method == HttpMethod.GET else self.write_limit
+        if low_priority:
+            return bucket.acquire(0)
+        deadline = getattr(self.local, "deadline", None)
+        return bucket.acquire(None if deadline is None else max(deadline - time.monotonic(), 0))
+
+    def defer(self, method: HttpMethod, endpoint: str, data: dict, record: str, queue: bool) -> dict:
+        """
+        Keep a low priority call the rate limit did not allow in the outbox, it is dropped without one.
+        Answers like the server would when too many calls are made
+        """
+        logging.debug(f"DjangoClient.defer(): rate limited, {method.value} {endpoint} deferred")
+        if queue:
+            self.queue_mutation(method, endpoint, data, record, "rate limited")
+        return {
+            'headers': {},
+            'status_code': 429,
+            'json_body': None
+        }
+
+    def retry_delay(self, method: HttpMethod, attempt: int, backoff: float, retry_after: float = None) -> float:
+        """
+        Return the seconds to wait before retrying a failed call or None if it should not be retried;
+        the method is out of retries, retry_after is longer than retry_cap,
+        waiting would pass the thread's deadline or the retry budget is spent
+        backoff: the last wait, 0 before the first retry
+        retry_after: seconds the server asked to wait, else decorrelated jitter is used
+        """
+        if attempt >= self.retries[method]:
+            return None
+        if retry_after is None:
+            delay = decorrelated_jitter(backoff, self.args.retry_base, self.args.retry_cap)
+        elif retry_after > self.args.retry_cap:
+            return None
+        else:
+            delay = retry_after
+        deadline = getattr(self.local, "deadline", None)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        if not self.retry_budget.withdraw():
+            logging.warning(f"DjangoClient.retry_delay(): retry budget spent, not retrying {method.value}")
+            return None
+        return delay
+
+    @staticmethod
+    def unsent(error: Exception = None, response: requests.Response = None) -> bool:
         """
-        Create request based on the method and call the api
+        Return True if the server surely did not handle the call,
+        it could not be connected to or it answered 429 or 503
+        """
+        if response is not None:
+            return response.status_code in (429, 503)
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True
+        reason = getattr(error.args[0], "reason", None) if error.args else None #urllib3's MaxRetryError
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def guard_post(self, record: str) -> tuple:
+        """
+        Check if a POST that failed without a clear answer created its record by getting the record.
+        Returns (retry, response), retry is True only if the record surely does not exist
+        and response is the record's GET response if it does
+        """
+        if record is None:
+            return False, None
+        try:
+            response = self.send(HttpMethod.GET, record)
+        except requests.exceptions.RequestException:
+            return False, None
+        if response.status_code == 404:
+            return True, None
+        return False, response if response.ok else None
+
+    def send(self, method: HttpMethod, endpoint: str, data: dict = None) -> requests.Response:
+        """
+        Send one request to the api and record its latency
         """
         api_url = urljoin(self.server, endpoint)
+        send = getattr(self.session, method.value.lower()) #ex; HttpMethod.GET -> session.get
+        self.timeout() #fail fast if the deadline already passed
+        start = time.monotonic()
         try:
             if data is not None:
-                response = method(api_url, headers=self.auth_header, json=data)
-            else:
-                response = method(api_url, headers=self.auth_header)
+                return send(api_url, headers=self.auth_header, json=data)
+            return send(api_url, headers=self.auth_header)
+        finally:
+            self.record_latency(method, endpoint, time.monotonic() - start)
+
+    def call_api(self, method: HttpMethod, endpoint: str, data: dict = None, record: str = None, queue: bool = True, low_priority: bool = False) -> dict:
+        """
+        Create request based on the method and call the api.
+        While the circuit breaker is open CircuitOpen is raised without calling the api.
+        Calls wait for the read or write rate limit within the thread's deadline, low priority
+        calls do not wait and are deferred to the outbox, or dropped without one, answering 429.
+        Connection errors, timeouts and RETRY_STATUSES are retried with backoff up to the method's retries.
+        A POST is only retried if the server surely did not handle it or getting the record shows it was not created.
+        Timeouts and connection errors left after the retries are raised to the caller, mutations that
+        could not be sent are queued in the outbox first
+        record: the record's endpoint a POST creates, mutations of the same record are merged in the outbox
+        queue: if False failed mutations are not queued in the outbox
+        low_priority: True for routine refreshes that can be deferred when the rate limit is reached
+        """
+        if method == HttpMethod.GET: #concurrent GETs of the endpoint wait on the one in flight
+            return self.flights.do(("django", endpoint), self._call_api, method, endpoint, data, record, queue, low_priority)
+        if not queue or self.outbox is None:
+            return self._call_api(method, endpoint, data, record, queue, low_priority)
+        #the outbox drain must not send the record's queued values while newer ones are sent
+        lock = self.record_lock(record or endpoint)
+        deadline = getattr(self.local, "deadline", None)
+        if not lock.acquire(timeout=-1 if deadline is None else max(deadline - time.monotonic(), 0)):
+            error = DeadlineExceeded(f"DjangoClient.call_api(): outbox drain of {record or endpoint} ran past the deadline, {method.value} {endpoint} not sent")
+            self.queue_mutation(method, endpoint, data, record, error)
+            raise error
+        try:
+            return self._call_api(method, endpoint, data, record, queue, low_priority)
+        finally:
+            lock.release()
+
+    def _call_api(self, method: HttpMethod, endpoint: str, data: dict, record: str, queue: bool, low_priority: bool) -> dict:
+        """
+        call_api() without the single-flight
+        """
+        self.retry_budget.deposit()
+        attempt = 0
+        backoff = 0.0
+        while True:
+            error = response = None
+            if not self.breaker.allow(): #the server is down, defer instead of waiting on it
+                error = CircuitOpen(f"DjangoClient.call_api(): circuit open, {method.value} {endpoint} not sent")
+                break
+            if not self.throttle(method, low_priority):
+                self.breaker.release()
+                if low_priority:
+                    return self.defer(method, endpoint, data, record, queue)
+                error = DeadlineExceeded(f"DjangoClient.call_api(): rate limited past the deadline, {method.value} {endpoint} not sent")
+                break
+            try:
+                response = self.send(method, endpoint, data)
+            except DeadlineExceeded as e:
+                self.breaker.release()
+                error = e
+                break
+            except requests.exceptions.RequestException as e:
+                error = e
+            if error is None and response.status_code not in self.RETRY_STATUSES:
+                self.breaker.success()
+                break
+            self.breaker.failure()
+            retry_after = None
+            if response is not None and response.status_code in (429, 503):
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = self.retry_delay(method, attempt, backoff, retry_after)
+            if delay is not None and method == HttpMethod.POST and not self.unsent(error, response):
+                retry, created = self.guard_post(record)
+                if created is not None: #the POST went through, answer with the record it created
+                    error, response = None, created
+                    break
+                if not retry:
+                    delay = None
+            if delay is None:
+                break
+            logging.warning(
+                f"DjangoClient.call_api(): retrying {method.value} {endpoint} in {delay:.2f}s "
+                f"after {error if error is not None else response.status_code}"
+            )
+            time.sleep(delay)
+            backoff = delay
+            attempt += 1
+        if error is not None:
+            if queue:
+                self.queue_mutation(method, endpoint, data, record, error)
+            raise error
+        try:
             response.raise_for_status() # Raise an exception for bad responses (4xx or 5xx)
 
+            if queue and self.outbox is not None and method != HttpMethod.GET and data is not None:
+                #older values of the sent fields still queued must not be sent after these
+                self.outbox.supersede(method.value, record or endpoint, data)
             return {
                 'headers': dict(response.headers),
+                'status_code': response.status_code,
                 'json_body': response.json()
             }
         except requests.exceptions.HTTPError as e:
             logging.error(f"HTTP error occurred in DjangoClient.call_api() for {endpoint}: {e}")
+            if response.status_code == 404: #the record is gone, stop trusting the cached answer
+                self.exists.pop(endpoint)
+            if queue and response.status_code in self.RETRY_STATUSES:
+                self.queue_mutation(method, endpoint, data, record, e)
             try:
                 logging.error(f"    Details returned by server: {response.json()}")
             except requests.exceptions.JSONDecodeError as e:
                 logging.error(f"requests.exceptions.JSONDecodeError: {e}")
             return {
                 'headers': dict(response.headers),
+                'status_code': response.status_code,
                 'json_body': None
             }
+        except requests.exceptions.RequestException as e:
+            if queue:
+                self.queue_mutation(method, endpoint, data, record, e)
+            raise
 
 def main(): # pragma: no cover
     parser = argparse.ArgumentParser()
@@ -228,6 +683,119 @@ def main(): # pragma: no cover
         default=os.getenv("SENSORHARDWARE_ROUTER"),
         help="API server's Sensor Hardware Router.",
     )
+    parser.add_argument(
+        "--exists-ttl",
+        default=os.getenv("DJANGO_EXISTS_TTL", 3600),
+        help="Seconds to cache that a record exists in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--not-exists-ttl",
+        default=os.getenv("DJANGO_NOT_EXISTS_TTL", 30),
+        help="Seconds to cache that a record does not exist in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--pool-size",
+        default=os.getenv("DJANGO_POOL_SIZE", 4),
+        help="Max number of open connections kept to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        default=os.getenv("DJANGO_CONNECT_TIMEOUT", 5),
+        help="Seconds to wait for a connection to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-timeout",
+        default=os.getenv("DJANGO_READ_TIMEOUT", 15),
+        help="Seconds to wait for the API server to respond",
+        type=float,
+    )
+    parser.add_argument(
+        "--outbox",
+        default=os.getenv("DJANGO_OUTBOX"),
+        help="SQLite file that keeps API server mutations that could not be sent, if not set they are not kept",
+    )
+    parser.add_argument(
+        "--outbox-interval",
+        default=os.getenv("DJANGO_OUTBOX_INTERVAL", 30),
+        help="Seconds between attempts to send the mutations in the outbox",
+        type=float,
+    )
+    parser.add_argument(
+        "--get-retries",
+        default=os.getenv("DJANGO_GET_RETRIES", 2),
+        help="Times a failed GET to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--patch-retries",
+        default=os.getenv("DJANGO_PATCH_RETRIES", 2),
+        help="Times a failed PATCH to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--post-retries",
+        default=os.getenv("DJANGO_POST_RETRIES", 1),
+        help="Times a failed POST to the API server is retried, only when it can not create a duplicate record",
+        type=int,
+    )
+    parser.add_argument(
+        "--retry-base",
+        default=os.getenv("DJANGO_RETRY_BASE", 0.5),
+        help="Min seconds to wait before retrying a call to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-cap",
+        default=os.getenv("DJANGO_RETRY_CAP", 10),
+        help="Max seconds to wait before retrying a call to the API server, longer Retry-After answers are not retried",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-budget",
+        default=os.getenv("DJANGO_RETRY_BUDGET", 0.1),
+        help="Retries allowed per call made to the API server, limits retries while the server is down",
+        type=float,
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        default=os.getenv("DJANGO_BREAKER_THRESHOLD", 5),
+        help="Consecutive failed calls to the API server that stop calling it",
+        type=int,
+    )
+    parser.add_argument(
+        "--breaker-reset",
+        default=os.getenv("DJANGO_BREAKER_RESET", 30),
+        help="Seconds to stop calling the API server before probing it with a single call",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-rate",
+        default=os.getenv("DJANGO_READ_RATE", 5),
+        help="Max GETs per second to the API server, 0 for no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-burst",
+        default=os.getenv("DJANGO_READ_BURST", 10),
+        help="Max GETs sent at once to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--write-rate",
+        default=os.getenv("DJANGO_WRITE_RATE", 2),
+        help="Max POSTs and PATCHes per second to the API server, 0 for no limit. Routine refreshes are deferred when reached",
+        type=float,
+    )
+    parser.add_argument(
+        "--write-burst",
+        default=os.getenv("DJANGO_WRITE_BURST", 5),
+        help="Max POSTs and PATCHes sent at once to the API server",
+        type=int,
+    )
     args = parser.parse_args()
     #configure logging
     logging.basicConfig(
@@ -0,0 +1,160 @@
+import json
+import sqlite3
+import threading
+import time
+
+class Outbox:
+    """
+    Durable queue of django mutations that could not be sent, kept in a SQLite database in WAL mode
+    so it survives restarts. A record has at most one row per method, newer fields replace older ones
+    """
+    def __init__(self, filepath: str):
+        """
+        filepath: path of the SQLite database, created if it does not exist
+        """
+        self.filepath = filepath
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(filepath, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL") #durable across crashes of the process, WAL keeps it consistent
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS outbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                method TEXT NOT NULL,
+                record TEXT NOT NULL,
+                endpoint TEXT NOT NULL,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 1,
+                queued_at REAL NOT NULL,
+                UNIQUE (method, record)
+            )"""
+        )
+        self.queued = 0
+        self.drained = 0
+        self.dropped = 0
+        self.superseded = 0 #rows changed or removed because newer values were sent directly
+        self.drain_rate = 0.0 #rows per second of the last drain
+
+    def __len__(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def put(self, method: str, record: str, endpoint: str, data: dict):
+        """
+        Queue a mutation. If the record already has a row for the method the fields are merged into it,
+        the row keeps its place in the queue so creates stay ahead of the updates that depend on them
+        record: the record's endpoint, the same for every mutation of the record
+        endpoint: api endpoint the mutation is sent to
+        """
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute(
+                    "SELECT data FROM outbox WHERE method = ? AND record = ?", (method, record)
+                ).fetchone()
+                merged = {**json.loads(row[0]), **data} if row else data
+                self.conn.execute(
+                    """INSERT INTO outbox (method, record, endpoint, data, queued_at) VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (method, record) DO UPDATE SET
+                        endpoint = excluded.endpoint, data = excluded.data, version = version + 1""",
+                    (method, record, endpoint, json.dumps(merged), time.time())
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.queued += 1
+        return
+
+    def peek(self, limit: int = 100) -> list:
+        """
+        Return up to limit queued mutations, oldest first, as (seq, version, method, endpoint, data)
+        """
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT seq, version, method, endpoint, data FROM outbox ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+        return [(seq, version, method, endpoint, json.loads(data)) for seq, version, method, endpoint, data in rows]
+
+    def get(self, seq: int) -> tuple:
+        """
+        Return the queued mutation as it is now as (version, record, endpoint, data), None if it was removed
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT version, record, endpoint, data FROM outbox WHERE seq = ?", (seq,)
+            ).fetchone()
+        if row is None:
+            return None
+        version, record, endpoint, data = row
+        return (version, record, endpoint, json.loads(data))
+
+    def remove(self, seq: int, version: int, dropped: bool = False) -> bool:
+        """
+        Remove a mutation that was sent. Returns False if newer fields were merged into it
+        since peek(), the row is then kept to send them
+        dropped: True if the mutation was rejected by the server instead of sent
+        """
+        with self.lock:
+            removed = self.conn.execute(
+                "DELETE FROM outbox WHERE seq = ? AND version = ?", (seq, version)
+            ).rowcount == 1
+            if removed and dropped:
+                self.dropped += 1
+            elif removed:
+                self.drained += 1
+        return removed
+
+    def supersede(self, method: str, record: str, data: dict) -> int:
+        """
+        A mutation of the record was sent directly, remove its fields from the record's queued mutations
+        so their older values are not sent after it. A sent POST also removes the record's queued POST.
+        Returns the number of rows changed or removed
+        """
+        changed = 0
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute("SELECT seq, method, data FROM outbox WHERE record = ?", (record,)).fetchall()
+                for seq, queued_method, queued_data in rows:
+                    queued = json.loads(queued_data)
+                    remaining = {key: val for key, val in queued.items() if key not in data}
+                    if remaining and queued_method == method == "POST":
+                        remaining = {}
+                    if remaining == queued:
+                        continue
+                    if remaining:
+                        #a new version so a drain that peeked the old fields keeps the row
+                        self.conn.execute(
+                            "UPDATE outbox SET data = ?, version = version + 1 WHERE seq = ?", (json.dumps(remaining), seq)
+                        )
+                    else:
+                        self.conn.execute("DELETE FROM outbox WHERE seq = ?", (seq,))
+                    changed += 1
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.superseded += changed
+        return changed
+
+    def stats(self) -> dict:
+        """
+        Return the number of pending mutations and how many were queued, drained and dropped
+        """
+        return {
+            "pending": len(self),
+            "queued": self.queued,
+            "drained": self.drained,
+            "dropped": self.dropped,
+            "superseded": self.superseded,
+            "drain_rate": self.drain_rate
+        }
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self.lock:
+            self.conn.close()
+        return
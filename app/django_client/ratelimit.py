@@ -0,0 +1,54 @@
+import threading
+import time
+
+class TokenBucket:
+    """
+    Thread safe token bucket, a call takes a token and tokens refill at rate per second up to burst
+    """
+    def __init__(self, rate: float, burst: int):
+        """
+        rate: tokens added per second, if 0 or less calls are not limited
+        burst: max tokens saved up, the calls that can be made at once
+        """
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.granted = 0
+        self.throttled = 0 #granted after waiting
+        self.denied = 0
+
+    def acquire(self, wait: float = None) -> bool:
+        """
+        Take a token, waiting up to wait seconds for one. Returns False if none was available in time
+        wait: seconds to wait, if None waits until a token is available
+        """
+        if self.rate <= 0:
+            return True
+        end = None if wait is None else time.monotonic() + wait
+        waited = False
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.granted += 1
+                    if waited:
+                        self.throttled += 1
+                    return True
+                needed = (1 - self.tokens) / self.rate
+                if end is not None and now + needed > end:
+                    self.denied += 1
+                    return False
+            waited = True
+            time.sleep(needed)
+
+    def stats(self) -> dict:
+        """
+        Return how many calls were granted a token, had to wait for one and were denied one
+        """
+        with self.lock:
+            return {"granted": self.granted, "throttled": self.throttled, "denied": self.denied}
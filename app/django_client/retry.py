@@ -0,0 +1,71 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+def decorrelated_jitter(previous: float, base: float, cap: float) -> float:
+    """
+    Return the next backoff in seconds, random between base and 3 times the previous backoff, at most cap.
+    Spreads the retries of many clients instead of synchronizing them
+    previous: the last backoff, 0 before the first retry
+    """
+    return min(cap, random.uniform(base, max(base, previous * 3)))
+
+def parse_retry_after(value: str) -> float:
+    """
+    Return the seconds to wait from a Retry-After header, given in seconds or as an HTTP date.
+    None if the header is missing or invalid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+class RetryBudget:
+    """
+    Limits retries to a ratio of the calls made plus a small steady allowance, so when the server
+    is down retries stop instead of multiplying the load of every node once it comes back
+    """
+    def __init__(self, ratio: float = 0.1, min_per_sec: float = 1.0, max_tokens: float = 10.0):
+        """
+        ratio: retries allowed per call made
+        min_per_sec: retries allowed per second regardless of calls made
+        max_tokens: max retries that can be saved up
+        """
+        self.ratio = ratio
+        self.min_per_sec = min_per_sec
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def deposit(self):
+        """
+        Record a call, each one allows ratio of a retry
+        """
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+        return
+
+    def withdraw(self) -> bool:
+        """
+        Return True and use a retry if the budget allows one
+        """
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.max_tokens, self.tokens + (now - self.updated) * self.min_per_sec)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
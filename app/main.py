@@ -80,6 +80,212 @@ def main():
         default=os.getenv("SENSORHARDWARE_ROUTER"),
         help="API server's Sensor Hardware Router.",
     )
+    parser.add_argument(
+        "--workers",
+        default=os.getenv("TRACKER_WORKERS", 4),
+        help="Number of worker threads that sync devices. If 0, devices are synced in the MQTT network loop",
+        type=int,
+    )
+    parser.add_argument(
+        "--queue-size",
+        default=os.getenv("TRACKER_QUEUE_SIZE", 100),
+        help="Max number of pending messages per worker, messages are dropped when full",
+        type=int,
+    )
+    parser.add_argument(
+        "--coalesce-window",
+        default=os.getenv("TRACKER_COALESCE_WINDOW", 0),
+        help="Seconds to collapse a device's uplinks into one sync. If 0, every uplink is synced",
+        type=float,
+    )
+    parser.add_argument(
+        "--exists-ttl",
+        default=os.getenv("DJANGO_EXISTS_TTL", 3600),
+        help="Seconds to cache that a record exists in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--not-exists-ttl",
+        default=os.getenv("DJANGO_NOT_EXISTS_TTL", 30),
+        help="Seconds to cache that a record does not exist in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--pool-size",
+        default=os.getenv("DJANGO_POOL_SIZE"),
+        help="Max number of open connections kept to the API server, defaults to 3 x --workers",
+        type=int,
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        default=os.getenv("DJANGO_CONNECT_TIMEOUT", 5),
+        help="Seconds to wait for a connection to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-timeout",
+        default=os.getenv("DJANGO_READ_TIMEOUT", 15),
+        help="Seconds to wait for the API server to respond",
+        type=float,
+    )
+    parser.add_argument(
+        "--message-deadline",
+        default=os.getenv("TRACKER_MESSAGE_DEADLINE", 60),
+        help="Seconds a message's API server calls can take before the sync is retried later",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-delay",
+        default=os.getenv("TRACKER_RETRY_DELAY", 30),
+        help="Seconds to wait before retrying a failed sync",
+        type=float,
+    )
+    parser.add_argument(
+        "--manifest-flush-interval",
+        default=os.getenv("MANIFEST_FLUSH_INTERVAL", 30),
+        help="Min seconds between writes of the node manifest file. If 0, the file is written on every update",
+        type=float,
+    )
+    parser.add_argument(
+        "--manifest-fsync",
+        action="store_true",
+        help="fsync the node manifest file on every write",
+    )
+    parser.add_argument(
+        "--profile-cache-size",
+        default=os.getenv("TRACKER_PROFILE_CACHE_SIZE", 256),
+        help="Max number of device profiles cached",
+        type=int,
+    )
+    parser.add_argument(
+        "--profile-ttl",
+        default=os.getenv("TRACKER_PROFILE_TTL", 600),
+        help="Seconds a cached device profile is used before it is retrieved again",
+        type=float,
+    )
+    parser.add_argument(
+        "--profile-refresh",
+        action="store_true",
+        help="refresh stale device profiles in the background instead of blocking the uplink",
+    )
+    parser.add_argument(
+        "--key-sync-interval",
+        default=os.getenv("TRACKER_KEY_SYNC_INTERVAL", 86400),
+        help="Max seconds between lorawan key syncs of a device that did not rejoin, 0 syncs keys on every uplink",
+        type=float,
+    )
+    parser.add_argument(
+        "--last-seen-from-payload",
+        action="store_true",
+        help="take a connection's last_seen_at from the uplink's time and skip chirpstack's get_device once status events reported the device's battery level and margin",
+    )
+    parser.add_argument(
+        "--dedup-size",
+        default=os.getenv("TRACKER_DEDUP_SIZE", 4096),
+        help="Number of recent deduplicationIds remembered to drop redelivered messages (about 250 bytes each), 0 disables",
+        type=int,
+    )
+    parser.add_argument(
+        "--dedup-ttl",
+        default=os.getenv("TRACKER_DEDUP_TTL", 600),
+        help="Seconds a deduplicationId is remembered",
+        type=float,
+    )
+    parser.add_argument(
+        "--debug-sample",
+        default=os.getenv("TRACKER_DEBUG_SAMPLE", 1),
+        help="With --debug, log one of every N messages received",
+        type=int,
+    )
+    parser.add_argument(
+        "--outbox",
+        default=os.getenv("DJANGO_OUTBOX"),
+        help="SQLite file that keeps API server mutations that could not be sent, if not set they are not kept",
+    )
+    parser.add_argument(
+        "--outbox-interval",
+        default=os.getenv("DJANGO_OUTBOX_INTERVAL", 30),
+        help="Seconds between attempts to send the mutations in the outbox",
+        type=float,
+    )
+    parser.add_argument(
+        "--get-retries",
+        default=os.getenv("DJANGO_GET_RETRIES", 2),
+        help="Times a failed GET to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--patch-retries",
+        default=os.getenv("DJANGO_PATCH_RETRIES", 2),
+        help="Times a failed PATCH to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--post-retries",
+        default=os.getenv("DJANGO_POST_RETRIES", 1),
+        help="Times a failed POST to the API server is retried, only when it can not create a duplicate record",
+        type=int,
+    )
+    parser.add_argument(
+        "--retry-base",
+        default=os.getenv("DJANGO_RETRY_BASE", 0.5),
+        help="Min seconds to wait before retrying a call to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-cap",
+        default=os.getenv("DJANGO_RETRY_CAP", 10),
+        help="Max seconds to wait before retrying a call to the API server, longer Retry-After answers are not retried",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-budget",
+        default=os.getenv("DJANGO_RETRY_BUDGET", 0.1),
+        help="Retries allowed per call made to the API server, limits retries while the server is down",
+        type=float,
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        default=os.getenv("DJANGO_BREAKER_THRESHOLD", 5),
+        help="Consecutive failed calls to the API server that stop calling it",
+        type=int,
+    )
+    parser.add_argument(
+        "--breaker-reset",
+        default=os.getenv("DJANGO_BREAKER_RESET", 30),
+        help="Seconds to stop calling the API server before probing it with a single call",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-rate",
+        default=os.getenv("DJANGO_READ_RATE", 5),
+        help="Max GETs per second to the API server, 0 for no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-burst",
+        default=os.getenv("DJANGO_READ_BURST", 10),
+        help="Max GETs sent at once to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--write-rate",
+        default=os.getenv("DJANGO_WRITE_RATE", 2),
+        help="Max POSTs and PATCHes per second to the API server, 0 for no limit. Routine refreshes are deferred when reached",
+        type=float,
+    )
+    parser.add_argument(
+        "--write-burst",
+        default=os.getenv("DJANGO_WRITE_BURST", 5),
+        help="Max POSTs and PATCHes sent at once to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--stats-interval",
+        default=os.getenv("TRACKER_STATS_INTERVAL", 300),
+        help="Seconds between logs of the API server, cache and dedup stats, 0 logs them only on shutdown",
+        type=float,
+    )
 
     #get args
     args = parser.parse_args()
@@ -1,7 +1,12 @@
 import logging
 import json
+import copy
 import tempfile
 import os
+import errno
+import shutil
+import time
+import threading
 import argparse
 from pathlib import Path
 
@@ -9,8 +14,28 @@ class Manifest:
     """
     Manifest class to CRUD the file
     """
-    def __init__(self, filepath: str):
+    def __init__(self, filepath: str, flush_interval: float = 0, fsync: bool = False):
+        """
+        filepath: path to the manifest file
+        flush_interval: min seconds between writes of the manifest file by schedule_save(), 
+            if 0 every schedule_save() writes the file
+        fsync: fsync the manifest file on every write
+        """
         self.filepath = filepath
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.lock = threading.RLock() #held while the manifest is changed or written
+        self.dirty = False #true if the manifest has changes that are not written to the file
+        self.pending = {} #deveui -> lorawan connection changes not written to the file, replayed on a reload
+        self.last_flush = None #monotonic time of the last write
+        self.flush_timer = None
+        self.flushes = 0
+        self.saves_skipped = 0 #updates that did not change the manifest
+        self.in_place_warned = False #true once the in place write fallback was logged
+        self.stat = None #file stat of the loaded or saved manifest
+        self.index = {} #deveui -> index in lorawanconnections
+        self.indexed = None #the lorawanconnections list the index was built for
+        self.indexed_len = 0
         self.dict = self.load_manifest()
         self.lw_structure =  {
             "connection_name": None,
@@ -42,10 +67,39 @@ class Manifest:
     def __str__(self): # pragma: no cover
         return f'{self.dict}'
 
+    def file_stat(self) -> tuple:
+        """
+        Return the manifest file's (inode, mtime, size) or None if it can not be stat
+        """
+        try:
+            st = os.stat(self.filepath)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reload the manifest if the file changed since it was loaded or saved (ex; by update-stack.sh).
+        Returns true if the manifest was reloaded.
+        Changes that are not written to the file yet are applied again to the reloaded manifest
+        """
+        if self.file_stat() == self.stat:
+            return False
+        with self.lock:
+            try:
+                self.dict = self.load_manifest()
+            except json.JSONDecodeError as e: #file is mid write, keep the loaded manifest
+                logging.error(f"Manifest.reload_if_changed(): {e}")
+                return False
+            for data in self.pending.values():
+                self.apply_update(data)
+        return True
+
     def load_manifest(self) -> dict:
         """
         Return manifest based on filepath
         """
+        self.stat = self.file_stat()
         try:
             with open(self.filepath, 'r') as f:
                 return json.load(f)
@@ -54,13 +108,95 @@ class Manifest:
 
     def save_manifest(self):
         """
-        Save manifest file
+        Save manifest file. The manifest is written to a temp file in the same directory
+        and renamed over the manifest file, so a crash mid write leaves the old manifest.
+        Edits of the file by other processes since it was loaded are reloaded first so they are kept
         """
-        try:
-            with open(self.filepath, 'w') as manifest_file:
-                json.dump(self.dict, manifest_file, indent=3)
-        except Exception as e:
-            logging.error(f"Manifest.save_manifest(): {e}")
+        with self.lock:
+            self.last_flush = time.monotonic()
+            if self.file_stat() != self.stat and not self.reload_if_changed():
+                #the file is mid write by another process, try again later instead of overwriting it
+                self.dirty = True
+                self.schedule_flush(max(self.flush_interval, 1))
+                return
+            tmp_path = None
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.filepath)), prefix=".manifest-", suffix=".tmp")
+                with os.fdopen(fd, 'w') as manifest_file:
+                    json.dump(self.dict, manifest_file, indent=3)
+                    if self.fsync:
+                        manifest_file.flush()
+                        os.fsync(manifest_file.fileno())
+                if self.stat is not None: #keep the manifest's permissions, mkstemp creates the file as 0600
+                    shutil.copymode(self.filepath, tmp_path)
+                try:
+                    os.replace(tmp_path, self.filepath)
+                except OSError as e:
+                    if e.errno not in (errno.EBUSY, errno.EXDEV):
+                        raise
+                    #the manifest is a single file mount (ex; k8s hostPath) that can not be
+                    # replaced, fall back to writing it in place
+                    if not self.in_place_warned:
+                        logging.warning(
+                            f"Manifest.save_manifest(): {self.filepath} can not be replaced ({e}), writing it in place. "
+                            "A crash mid write can corrupt it, mount the manifest's directory instead of the file"
+                        )
+                        self.in_place_warned = True
+                    shutil.copyfile(tmp_path, self.filepath)
+                self.stat = self.file_stat() #our own write is not a change to reload
+                self.dirty = False
+                self.pending.clear()
+                self.flushes += 1
+            except Exception as e:
+                logging.error(f"Manifest.save_manifest(): {e}")
+            finally:
+                if tmp_path is not None and os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        return
+
+    def schedule_save(self):
+        """
+        Mark the manifest dirty and save it, at most once per flush interval.
+        Saves inside the interval are written together when the interval ends
+        """
+        with self.lock:
+            self.dirty = True
+            wait = 0 if self.last_flush is None else self.last_flush + self.flush_interval - time.monotonic()
+            if wait <= 0:
+                self.save_manifest()
+            else:
+                self.schedule_flush(wait)
+        return
+
+    def schedule_flush(self, wait: float):
+        """
+        Call flush() in wait seconds unless a flush is already scheduled
+        """
+        with self.lock:
+            if self.flush_timer is None:
+                self.flush_timer = threading.Timer(wait, self.flush)
+                self.flush_timer.daemon = True
+                self.flush_timer.start()
+        return
+
+    def flush(self):
+        """
+        Save the manifest if it has changes that are not written to the file
+        """
+        with self.lock:
+            self.flush_timer = None
+            if self.dirty:
+                self.save_manifest()
+        return
+
+    def close(self):
+        """
+        Cancel the scheduled save and write any unsaved changes, used on shutdown
+        """
+        with self.lock:
+            if self.flush_timer is not None:
+                self.flush_timer.cancel()
+            self.flush()
         return
 
     def lc_check(self) -> bool:
@@ -69,20 +205,39 @@ class Manifest:
         """
         return "lorawanconnections" in self.dict
 
+    def build_index(self):
+        """
+        Build the deveui -> index map of the lorawan connections
+        """
+        lcs = self.dict.get("lorawanconnections", [])
+        self.index = {}
+        for i, lc in enumerate(lcs):
+            self.index.setdefault(lc.get("lorawandevice", {}).get("deveui"), i)
+        self.indexed = lcs
+        self.indexed_len = len(lcs)
+        return
+
+    def ld_index(self, deveui: str) -> int:
+        """
+        Return the index of the deveui's lorawan connection or None if not found.
+        The index map is rebuilt if the lorawan connections were replaced or changed outside of Manifest
+        """
+        lcs = self.dict.get("lorawanconnections")
+        if lcs is None:
+            return None
+        if lcs is not self.indexed or len(lcs) != self.indexed_len:
+            self.build_index()
+        i = self.index.get(deveui)
+        if i is not None and lcs[i].get("lorawandevice", {}).get("deveui") != deveui:
+            self.build_index()
+            i = self.index.get(deveui)
+        return i
+
     def ld_search(self, deveui: str) -> bool:
         """
         Search the manifest for a lorawan device return true if found
         """
-        #TODO: consider using a bloom filter: if the count of lorawan connections gets to be a 
-        # huge number the computation will be too high - Francisco Lozano 01/09/2024
-        if self.lc_check():
-            for lc in self.dict["lorawanconnections"]:
-                ld = lc["lorawandevice"]
-                if ld["deveui"] == deveui:
-                    return True 
-        else:
-            return False
-        return False
+        return self.ld_index(deveui) is not None
 
     @staticmethod
     def is_valid_json(data: dict) -> bool:
@@ -162,19 +317,34 @@ class Manifest:
             return False
 
     #if you need to do more complex merges consider deepmerge
-    def update_dict_rec(self, current: dict, new: dict):
+    def update_dict_rec(self, current: dict, new: dict) -> bool:
         """
         A recursive function that updates values in the dictionary.
         If a key is a dict, it recursively updates the values in that dictionary.
+        Returns true if any value in current changed.
         current: current dictionary that will be updated
         new: new dictionary that will update
         """
+        changed = False
         for key, val in new.items():
             if isinstance(new[key], dict):
-                self.update_dict_rec(current[key],new[key])
-            else:
+                changed = self.update_dict_rec(current[key],new[key]) or changed
+            elif key not in current or current[key] != new[key]:
                 current[key] = new[key]
+                changed = True
         
+        return changed
+
+    @staticmethod
+    def merge_dict(current: dict, new: dict):
+        """
+        Merge new into current recursively, nested dictionaries missing in current are copied
+        """
+        for key, val in new.items():
+            if isinstance(val, dict) and isinstance(current.get(key), dict):
+                Manifest.merge_dict(current[key], val)
+            else:
+                current[key] = copy.deepcopy(val)
         return
 
     def update_manifest(self, data: dict):
@@ -184,7 +354,22 @@ class Manifest:
         if not self.is_valid_struc(data):
             logging.error("Manifest.update_manifest(): lorawan connection data does not conform to manifest structure")
             return
-        
+
+        with self.lock:
+            if not self.apply_update(data):
+                return
+            #kept until written so a reload of the file does not lose it
+            self.merge_dict(self.pending.setdefault(data["lorawandevice"]["deveui"], {}), data)
+
+            # Save the updated manifest
+            self.schedule_save()
+
+        return
+
+    def apply_update(self, data: dict) -> bool:
+        """
+        Apply lorawan connection data to the manifest, returns true if the manifest changed
+        """
         if not self.lc_check():
             # If "lorawanconnections" is not present, create it as an empty list
             self.dict["lorawanconnections"] = []
@@ -193,23 +378,23 @@ class Manifest:
         new_lc = data
 
         # Find the index of the connection based on a uid
-        index_to_update = next((i for i, existing_lc in enumerate(existing_lcs) 
-                                if existing_lc.get("lorawandevice", {}).get("deveui") == new_lc.get("lorawandevice", {}).get("deveui")), None)
+        index_to_update = self.ld_index(new_lc.get("lorawandevice", {}).get("deveui"))
 
         if index_to_update is not None:
-            # Update the existing connection
-            self.update_dict_rec(existing_lcs[index_to_update], new_lc)
+            # Update the existing connection, nothing to save if no value changed
+            if not self.update_dict_rec(existing_lcs[index_to_update], new_lc):
+                self.saves_skipped += 1
+                return False
         else:
             # If not found, check for required keys and add the new connection
             if not self.has_requiredKeys(data):
                 logging.error("Manifest.update_manifest(): lorawan connection data does not have required keys")
-                return
-            existing_lcs.append(new_lc)
-
-        # Save the updated manifest
-        self.save_manifest()
+                return False
+            existing_lcs.append(copy.deepcopy(new_lc))
+            self.index[new_lc["lorawandevice"]["deveui"]] = len(existing_lcs) - 1
+            self.indexed_len = len(existing_lcs)
 
-        return
+        return True
 
 def main(): # pragma: no cover
     parser = argparse.ArgumentParser()
@@ -220,6 +405,17 @@ def main(): # pragma: no cover
         type=Path,
         help="path to node manifest file",
     )
+    parser.add_argument(
+        "--manifest-flush-interval",
+        default=os.getenv("MANIFEST_FLUSH_INTERVAL", 30),
+        help="Min seconds between writes of the node manifest file. If 0, the file is written on every update",
+        type=float,
+    )
+    parser.add_argument(
+        "--manifest-fsync",
+        action="store_true",
+        help="fsync the node manifest file on every write",
+    )
     args = parser.parse_args()
     #configure logging
     logging.basicConfig(
@@ -227,7 +423,7 @@ def main(): # pragma: no cover
         format="%(asctime)s %(message)s",
         datefmt="%Y/%m/%d %H:%M:%S",
     )
-    manifest = Manifest(args.manifest)
+    manifest = Manifest(args.manifest, args.manifest_flush_interval, args.manifest_fsync)
 
 if __name__ == "__main__":
     main() # pragma: no cover
\ No newline at end of file
@@ -3,16 +3,31 @@ import argparse
 import os
 import paho.mqtt.client as mqtt
 import time
+import re
+import signal
+import threading
 from .parse import *
 
+#chirpstack event topic: application/{application id}/device/{devEui}/event/{event type}
+EVENT_TOPIC = re.compile(r"^application/(?P<app>[^/]+)/device/(?P<deveui>[^/]+)/event/(?P<event>[^/]+)$")
+
 class MqttClient:
     """
     Mqtt Client to subcribe to data streams
     """
     def __init__(self, args):
         self.args = args
+        self.handlers = self.event_handlers()
+        self.events = {} #event type -> messages received
+        self.dropped = 0 #messages without a handler
         self.client = self.configure_client()
 
+    def event_handlers(self) -> dict:
+        """
+        Return the handler per chirpstack event type, messages of other event types are dropped
+        """
+        return {"up": self.on_message}
+
     def configure_client(self):
         """
         Configures the client
@@ -25,7 +40,7 @@ class MqttClient:
         # delay is the number of seconds to wait between successive reconnect attempts(default=1).
         # delay_max is the maximum number of seconds to wait between reconnection attempts(default=1)
         client.reconnect_delay_set(min_delay=5, max_delay=60)
-        client.on_message = lambda client, userdata, message: self.on_message(client, userdata, message)
+        client.on_message = lambda client, userdata, message: self.route_message(client, userdata, message)
         client.on_log = self.on_log
 
         return client
@@ -65,9 +80,32 @@ class MqttClient:
         logging.debug(string) #prints if args.debug = true
         return
 
+    @staticmethod
+    def parse_topic(topic: str) -> dict:
+        """
+        Parse a chirpstack event topic into its app, deveui and event, None if it is not an event topic
+        """
+        match = EVENT_TOPIC.match(topic)
+        return match.groupdict() if match else None
+
+    def route_message(self, client, userdata, message):
+        """
+        Method to run when any message is received. Dispatches the message to the handler
+        of its event type, messages without a handler are dropped before their payload is decoded
+        """
+        topic = self.parse_topic(message.topic)
+        handler = self.handlers.get(topic["event"]) if topic else None
+        if handler is None:
+            self.dropped += 1
+            logging.debug(f"MqttClient.route_message(): dropped message on {message.topic}")
+            return
+        self.events[topic["event"]] = self.events.get(topic["event"], 0) + 1
+        handler(client, userdata, message)
+        return
+
     def on_message(self, client, userdata, message):
         """
-        Method to run when message is received. This method runs 
+        Method to run when an uplink message is received. This method runs 
         in the same thread as the MQTT client's network loop
         """
         #log message if debug flag was passed
@@ -75,12 +113,14 @@ class MqttClient:
 
         return
 
-    def log_message(self, message):
+    def log_message(self, message, result: tuple = None):
         """
         Log message received from mqtt broker for debugging
+        result: the output of parse_message() if the message was already parsed
         """
         #parse message for metadata and deviceInfo. 
-        result = self.parse_message(message)
+        if result is None:
+            result = self.parse_message(message)
         if result is not None:
             try:
                 metadata, deviceInfo = result
@@ -91,20 +131,20 @@ class MqttClient:
             return
 
         Performance_vals = Get_Signal_Performance_values(metadata)
-            
-        data = (
-            "LORAWAN Message received by device " + deviceInfo['deviceName'] + 
-            " with deveui " + deviceInfo['devEui']  + ":" + message.payload.decode("utf-8")
+
+        #formatted only if the debug level is enabled
+        logging.debug(
+            "LORAWAN Message received by device %s with deveui %s:%s",
+            deviceInfo['deviceName'], deviceInfo['devEui'], message.payload.decode("utf-8")
         )
-        logging.debug(data)
 
         if Performance_vals['rxInfo']: #if rxInfo was returned then...
             logging.debug("Signal Performance:")
             for val in Performance_vals['rxInfo']:
-                logging.debug("gatewayId: " + str(val["gatewayId"]))
-                logging.debug("  rssi: " + str(val["rssi"]))
-                logging.debug("  snr: " + str(val["snr"]))
-            logging.debug("spreading factor: " + str(Performance_vals["spreadingFactor"]))
+                logging.debug("gatewayId: %s", val["gatewayId"])
+                logging.debug("  rssi: %s", val["rssi"])
+                logging.debug("  snr: %s", val["snr"])
+            logging.debug("spreading factor: %s", Performance_vals["spreadingFactor"])
 
         return
 
@@ -121,14 +161,27 @@ class MqttClient:
 
         return (metadata, deviceInfo)
 
+    def stop(self, signum=None, frame=None):
+        """
+        Disconnect from the MQTT broker so run() returns, installed as the SIGTERM handler by run()
+        """
+        logging.info(f"MqttClient.stop(): stopping on signal {signum}")
+        self.client.disconnect()
+
     def run(self):
         """
-        Connect to MQTT broker
+        Connect to MQTT broker. SIGTERM (ex; a pod stop) ends the network loop so run() returns
         """
         logging.info(f"connecting [{self.args.mqtt_server_ip}:{self.args.mqtt_server_port}]...")
         self.client.connect(host=self.args.mqtt_server_ip, port=self.args.mqtt_server_port, bind_address="0.0.0.0")
         logging.info("waiting for callback...")
-        self.client.loop_forever()
+        main_thread = threading.current_thread() is threading.main_thread() #signal handlers can only be set there
+        previous = signal.signal(signal.SIGTERM, self.stop) if main_thread else None
+        try:
+            self.client.loop_forever()
+        finally:
+            if main_thread:
+                signal.signal(signal.SIGTERM, previous)
 
 def main(): # pragma: no cover
     parser = argparse.ArgumentParser()
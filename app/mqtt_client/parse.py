@@ -1,5 +1,7 @@
 import json
 import logging
+import sys
+from dataclasses import dataclass
 
 def parse_message_payload(payload_data):
 
@@ -25,6 +27,43 @@ def Get_device(message_dict):
 
     return tmp_dict
 
+@dataclass(frozen=True)
+class Uplink:
+    """
+    The fields of a chirpstack device event the tracker syncs with. Queued in place of
+    the decoded message so the payload, rxInfo and tags are freed once the message is parsed
+    """
+    __slots__ = ("deveui", "device_name", "device_profile_id", "dev_addr", "time", "join")
+    deveui: str
+    device_name: str #replaces get_device()'s name when the sync skips it
+    device_profile_id: str
+    dev_addr: str #None if the event has no devAddr
+    time: str #ISO 8601, None if the event has no time
+    join: bool #True if the event is a join
+
+    @classmethod
+    def from_message(cls, message_dict: dict, join: bool = False) -> "Uplink":
+        """
+        Build the record in one pass over the decoded message. Device identifiers repeat
+        for every message of a device so they are interned and shared between queued records
+        """
+        deviceInfo_dict = message_dict.get('deviceInfo', None)
+        try:
+            return cls(
+                deveui=sys.intern(deviceInfo_dict['devEui']),
+                device_name=sys.intern(deviceInfo_dict['deviceName']),
+                device_profile_id=sys.intern(deviceInfo_dict['deviceProfileId']),
+                dev_addr=message_dict.get('devAddr'),
+                time=message_dict.get('time'),
+                join=join
+            )
+        except TypeError as e:
+            logging.error(f"Uplink.from_message(): {e}")
+            raise TypeError(f"Uplink.from_message(): {e}")
+        except KeyError as e:
+            logging.error(f"Uplink.from_message(): {e}")
+            raise KeyError(f"Uplink.from_message(): {e}")
+
 def Get_Signal_Performance_values(message_dict):
     tmp_dict = {}
 
@@ -0,0 +1,90 @@
+import logging
+import heapq
+import threading
+import time
+
+class Coalescer:
+    """
+    Collapses work for the same key that arrives inside a time window.
+    The first work for a key runs right away and opens a window, work that arrives
+    while the window is open replaces the key's pending work. When the window
+    closes the latest pending work runs and a new window is opened.
+    """
+    def __init__(self, window: float, fn, merge=None):
+        """
+        window: length of the window in seconds, if 0 work is never coalesced
+        fn: function called as fn(key, *args) to run the work
+        merge: function called as merge(pending_args, args) that returns the args replacing
+            the key's pending work, if None the latest args replace it
+        """
+        self.window = window
+        self.fn = fn
+        self.merge = merge
+        self.pending = {} #key -> args of the pending work, None if there is none
+        self.heap = [] #(window end, key) of open windows
+        self.cond = threading.Condition()
+        self.stopped = False
+        self.submitted = 0
+        self.coalesced = 0
+        self.thread = None
+        if self.window > 0:
+            self.thread = threading.Thread(target=self.close_windows, name="coalescer", daemon=True)
+            self.thread.start()
+
+    def submit(self, key: str, *args):
+        """
+        Run fn(key, *args) now if the key has no open window,
+        else keep it as the key's pending work
+        """
+        with self.cond:
+            self.submitted += 1
+            if self.window > 0 and not self.stopped:
+                if key in self.pending:
+                    if self.pending[key] is not None:
+                        self.coalesced += 1
+                        if self.merge is not None:
+                            args = self.merge(self.pending[key], args)
+                    self.pending[key] = args
+                    return
+                self.pending[key] = None
+                heapq.heappush(self.heap, (time.monotonic() + self.window, key))
+                self.cond.notify()
+        self.fn(key, *args)
+        return
+
+    def close_windows(self):
+        """
+        Loop that closes windows as they end and runs the pending work
+        """
+        while True:
+            with self.cond:
+                while not self.stopped and (not self.heap or self.heap[0][0] > time.monotonic()):
+                    self.cond.wait(self.heap[0][0] - time.monotonic() if self.heap else None)
+                if self.stopped:
+                    return
+                _, key = heapq.heappop(self.heap)
+                args = self.pending.pop(key)
+                if args is not None: #reopen the window for the work that is about to run
+                    self.pending[key] = None
+                    heapq.heappush(self.heap, (time.monotonic() + self.window, key))
+            if args is not None:
+                try:
+                    self.fn(key, *args)
+                except Exception as e:
+                    logging.exception(f"Coalescer.close_windows(): {e}")
+
+    def stop(self):
+        """
+        Run all pending work now and stop closing windows
+        """
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+            pending = [(key, args) for key, args in self.pending.items() if args is not None]
+            self.pending.clear()
+            self.heap.clear()
+        if self.thread is not None:
+            self.thread.join()
+        for key, args in pending:
+            self.fn(key, *args)
+        return
@@ -1,6 +1,10 @@
 import datetime
+import re
 import pytz
 
+#ISO 8601 timestamp with any fraction of a second, ex; 2022-07-18T09:34:15.775023242+00:00
+ISO_TIMESTAMP = re.compile(r"^(\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2})(?:\.\d+)?(Z|[+-]\d{2}:\d{2})$")
+
 def epoch_to_UTC(sec: int, nanos: int) -> datetime:
     """
     Convert seconds since epoch to a UTC datetime object
@@ -18,4 +22,18 @@ def UTC_to_Timezone(datetime_obj_utc: datetime ,timezone: str) -> datetime:
     timezone_obj = pytz.timezone(timezone)
     # Convert UTC datetime to timezone
     datetime_obj = datetime_obj_utc.replace(tzinfo=pytz.utc).astimezone(timezone_obj)
-    return datetime_obj
\ No newline at end of file
+    return datetime_obj
+
+def ISO_to_UTC_str(timestamp: str) -> str:
+    """
+    Convert an ISO 8601 timestamp like the time in chirpstack's messages to a '%Y-%m-%dT%H:%M:%SZ' string.
+    UTC timestamps are only sliced, other offsets are converted to UTC
+    """
+    match = ISO_TIMESTAMP.match(timestamp)
+    if match is None:
+        raise ValueError(f"ISO_to_UTC_str(): {timestamp} is not an ISO 8601 timestamp")
+    seconds, offset = match.groups()
+    if offset in ("Z", "+00:00", "-00:00"):
+        return seconds + "Z"
+    datetime_obj = datetime.datetime.strptime(seconds + offset, '%Y-%m-%dT%H:%M:%S%z')
+    return datetime_obj.astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -0,0 +1,80 @@
+import logging
+import queue
+import threading
+import zlib
+
+class Dispatcher:
+    """
+    Hands work to a bounded pool of worker threads. Each worker owns a lane (queue),
+    work is assigned to a lane by hashing its key so work for the same key
+    (ex; devEui) runs in the order it was submitted.
+    """
+    def __init__(self, workers: int, queue_size: int):
+        """
+        workers: number of worker threads, if 0 work runs in the caller's thread
+        queue_size: max number of pending work items per lane
+        """
+        self.workers = workers
+        self.lanes = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.threads = []
+        for i, lane in enumerate(self.lanes):
+            thread = threading.Thread(target=self.work, args=(lane,), name=f"dispatcher-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def lane_for(self, key: str) -> queue.Queue:
+        """
+        Return the lane the key is assigned to
+        """
+        #crc32 instead of hash() so the lane is stable across processes
+        return self.lanes[zlib.crc32(key.encode("utf-8")) % self.workers]
+
+    def submit(self, key: str, fn, *args) -> bool:
+        """
+        Queue fn(*args) on the key's lane without blocking.
+        Returns false if the lane is full and the work was dropped
+        """
+        if self.workers == 0: #no workers, run in the caller's thread
+            fn(*args)
+            return True
+        try:
+            self.lane_for(key).put_nowait((fn, args))
+        except queue.Full:
+            logging.error(f"Dispatcher.submit(): lane for {key} is full, work dropped")
+            return False
+        return True
+
+    @staticmethod
+    def work(lane: queue.Queue):
+        """
+        Worker loop that runs the lane's work in order until it gets a stop sentinel (None)
+        """
+        while True:
+            item = lane.get()
+            try:
+                if item is None:
+                    return
+                fn, args = item
+                fn(*args)
+            except Exception as e:
+                logging.exception(f"Dispatcher.work(): {e}")
+            finally:
+                lane.task_done()
+
+    def join(self):
+        """
+        Block until all queued work is done
+        """
+        for lane in self.lanes:
+            lane.join()
+        return
+
+    def stop(self, timeout: float = None):
+        """
+        Let the workers finish the queued work then stop them
+        """
+        for lane in self.lanes:
+            lane.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        return
@@ -0,0 +1,50 @@
+import threading
+
+class Snapshots:
+    """
+    Keeps the fields last synced to django per record type and deveui
+    so only fields that changed are sent
+    """
+    def __init__(self):
+        self.records = {} #(record, deveui) -> {field: value}
+        self.lock = threading.Lock()
+        self.patches_sent = 0
+        self.patches_avoided = 0
+
+    def diff(self, record: str, deveui: str, data: dict) -> dict:
+        """
+        Return the fields in data that are different from the last synced values.
+        An empty dict means the PATCH can be skipped
+        record: record type (ex; "ld", "lc", "lk")
+        """
+        with self.lock:
+            last = self.records.get((record, deveui), {})
+            changed = {key: val for key, val in data.items() if key not in last or last[key] != val}
+            if changed:
+                self.patches_sent += 1
+            else:
+                self.patches_avoided += 1
+        return changed
+
+    def get(self, record: str, deveui: str, field: str):
+        """
+        Return the field's last synced value, None if it was not synced
+        """
+        with self.lock:
+            return self.records.get((record, deveui), {}).get(field)
+
+    def update(self, record: str, deveui: str, data: dict):
+        """
+        Record the fields in data as synced
+        """
+        with self.lock:
+            self.records.setdefault((record, deveui), {}).update(data)
+        return
+
+    def invalidate(self, record: str, deveui: str):
+        """
+        Forget the synced fields so the next sync sends the full record
+        """
+        with self.lock:
+            self.records.pop((record, deveui), None)
+        return
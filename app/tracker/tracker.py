@@ -1,67 +1,291 @@
 import logging
 import argparse
+import threading
+import itertools
+import time
 import os
+import dataclasses
+import requests
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, wait
 from pathlib import Path
 from argparse import Namespace
 from .parse import *
 from .convert_date import *
+from .dispatcher import *
+from .coalesce import *
+from .snapshot import *
 from chirpstack_api_wrapper import ChirpstackClient
 try:  # production # pragma: no cover
     from django_client import DjangoClient
-    from mqtt_client import MqttClient
+    from mqtt_client import MqttClient, Uplink
     from manifest import Manifest
+    from cache import TTLCache, RecentSet
 except ImportError:  # testing
     from app.django_client import DjangoClient
-    from app.mqtt_client import MqttClient
+    from app.mqtt_client import MqttClient, Uplink
     from app.manifest import Manifest
+    from app.cache import TTLCache, RecentSet
 
 class Tracker(MqttClient):
     """
     A class that ties all clients together to track lorawan records
     """
+    #fields refreshed by every uplink or status, a PATCH of only these can be deferred
+    LOW_PRIORITY_FIELDS = {"last_seen_at", "margin", "battery_level"}
+
     def __init__(self, args: Namespace):
         super().__init__(args)
+        #each sync fans out up to 3 chirpstack or django calls besides the one it makes itself
+        fanout = 3 * max(args.workers, 1)
+        if args.pool_size is None: #keep a django connection for every call that can run at once
+            args.pool_size = fanout
         self.c_client = ChirpstackClient(args.chirpstack_account_email,args.chirpstack_account_password,args.chirpstack_api_interface)
         self.d_client = DjangoClient(args)
+        self.dispatcher = Dispatcher(args.workers, args.queue_size)
+        self.executor = ThreadPoolExecutor(max_workers=fanout, thread_name_prefix="tracker-fanout")
+        self.coalescer = Coalescer(args.coalesce_window, self.queue_sync, self.merge_uplinks)
+        self.manifest = Manifest(args.manifest, args.manifest_flush_interval, args.manifest_fsync)
+        self.snapshots = Snapshots()
+        self.device_lookups_skipped = 0 #get_device() calls replaced by the uplink and status event values
+        #device profiles are shared by many devices and rarely change
+        self.profiles = TTLCache(maxsize=args.profile_cache_size, ttl=args.profile_ttl)
+        #devices sharing a profile fetch it once when the cache is cold
+        self.flights = self.d_client.flights
+        self.profiles_refreshing = set() #profile ids being refreshed in the background
+        self.profiles_lock = threading.Lock()
+        self.retry_timers = {} #deveui -> timer of the pending retry
+        self.retry_uplinks = {} #deveui -> uplink the pending retry syncs, the device's newest
+        self.retry_lock = threading.Lock()
+        self.key_syncs = {} #deveui -> (devAddr, monotonic time) of the last key sync
+        self.key_syncs_lock = threading.Lock()
+        #redelivered messages (broker reconnects, QoS redelivery) keep their deduplicationId
+        self.recent = RecentSet(args.dedup_size, args.dedup_ttl)
+        self.debug_count = itertools.count() #messages seen by debug_sampled()
+
+    def event_handlers(self) -> dict:
+        """
+        Uplinks and joins sync the device, status events update battery and margin,
+        other chirpstack events are dropped
+        """
+        return {"up": self.on_message, "join": self.on_join, "status": self.on_status}
 
-    #if execution of this method slows down mqtt client's network loop
-    # consider offloading tasks to seperate thread using 'threading' module
     def on_message(self, client, userdata, message):
-        #log message if debug flag was passed
-        self.log_message(message) if self.args.debug else None
+        """
+        Method to run when an uplink is received. The sync is handed to the dispatcher
+        so the MQTT client's network loop is not blocked by Chirpstack or Django calls
+        """
+        self.submit_sync(message, join=False)
+        return
+
+    def on_join(self, client, userdata, message):
+        """
+        Method to run when a device (re)joins, the sync refreshes the device's keys
+        """
+        self.submit_sync(message, join=True)
+        return
+
+    def on_status(self, client, userdata, message):
+        """
+        Method to run when a device reports its status. Battery level and margin come
+        straight from the payload, the update is handed to the device's dispatcher lane
+        """
+        result = self.parse_message(message)
+        if result is None:
+            return
+        metadata, deviceInfo = result
+        if self.is_duplicate("status", metadata):
+            return
+        battery_level = None if metadata.get("batteryLevelUnavailable") else metadata.get("batteryLevel")
+        self.dispatcher.submit(deviceInfo["devEui"], self.sync_status, deviceInfo["devEui"], battery_level, metadata.get("margin"))
+        return
+
+    def sync_status(self, deveui: str, battery_level: float, margin: int):
+        """
+        Update the device's battery level and margin in django and the manifest.
+        Devices that are not in django yet are left to the uplink sync. Failures are not
+        retried, the next status event or uplink carries the values again
+        battery_level: None if the device did not report it
+        """
+        updates = []
+        if battery_level is not None:
+            updates.append((self.patch_changed, "ld", deveui, {"battery_level": battery_level}, self.d_client.update_ld))
+        if margin is not None:
+            updates.append((self.patch_changed, "lc", deveui, {"margin": margin}, self.d_client.update_lc))
+        if not updates:
+            return
+        try:
+            with self.d_client.deadline(self.args.message_deadline):
+                if not self.d_client.lc_search(deveui):
+                    return
+                self.run_concurrently(updates)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Tracker.sync_status(): status of {deveui} failed: {e}")
+            return
+
+        manifest_data = {"lorawandevice": {"deveui": deveui}}
+        if battery_level is not None:
+            manifest_data["lorawandevice"]["battery_level"] = battery_level
+        if margin is not None:
+            manifest_data["margin"] = margin
+        with self.manifest.lock:
+            self.manifest.reload_if_changed()
+            if self.manifest.ld_search(deveui):
+                self.manifest.update_manifest(manifest_data)
+        return
+
+    def debug_sampled(self) -> bool:
+        """
+        Return True for one of every debug_sample messages so debug logging stays off the hot path
+        """
+        return next(self.debug_count) % max(self.args.debug_sample, 1) == 0
+
+    def is_duplicate(self, event: str, metadata: dict) -> bool:
+        """
+        Return True if the event with the message's deduplicationId was already received
+        event: chirpstack event type, events of an uplink share its deduplicationId
+        """
+        dedup_id = metadata.get("deduplicationId")
+        if dedup_id is None:
+            return False
+        if self.recent.seen((event, dedup_id)):
+            logging.debug(f"Tracker.is_duplicate(): dropped {event} {dedup_id} ({self.recent.hits} duplicates)")
+            return True
+        return False
 
+    def submit_sync(self, message, join: bool):
+        """
+        Parse the message and submit the device's sync to the coalescer
+        join: True if the message is a join event
+        """
         #parse message for metadata and deviceInfo. 
         result = self.parse_message(message)
+
+        #log message if debug flag was passed, the parsed message is shared with the sync
+        if self.args.debug and result is not None and self.debug_sampled():
+            self.log_message(message, result)
+
         if result is not None:
             try:
                 metadata, deviceInfo = result
             except ValueError as e:
-                logging.error(f"Tracker.on_message(): Message did not parse correctly, {e}")
+                logging.error(f"Tracker.submit_sync(): Message did not parse correctly, {e}")
         else:
             return
+        if self.is_duplicate("join" if join else "up", metadata):
+            return
+
+        #only the fields the sync uses are queued, the decoded message is freed here
+        uplink = Uplink.from_message(metadata, join)
+
+        #uplinks from the same device inside the coalesce window collapse into one sync
+        self.coalescer.submit(uplink.deveui, uplink)
+        return
+
+    @staticmethod
+    def merge_uplinks(pending: tuple, new: tuple) -> tuple:
+        """
+        Merge args of a coalesced sync, the latest uplink is synced but a pending join
+        is kept so its key refresh is not lost
+        pending: args of the device's pending sync
+        new: args of the sync replacing it
+        """
+        uplink, = new
+        if pending[0].join and not uplink.join:
+            uplink = dataclasses.replace(uplink, join=True)
+        return (uplink,)
+
+    def queue_sync(self, deveui: str, uplink: Uplink):
+        """
+        Queue the device's sync on the dispatcher, messages from the same 
+        device are synced in order on the same worker. If the device's lane is full
+        the sync is retried later, its deduplicationIds are already marked as seen
+        uplink: the Uplink record of the message
+        """
+        if not self.dispatcher.submit(deveui, self.sync, uplink):
+            logging.warning(f"Tracker.queue_sync(): lane of {deveui} is full, retrying in {self.args.retry_delay}s")
+            self.retry_sync(deveui, uplink)
+        return
+
+    def sync(self, uplink: Uplink):
+        """
+        Run sync_device() within the message deadline. If the API server is too slow
+        or can not be reached the sync fails fast and is retried later
+        uplink: the Uplink record of the message
+        """
+        #a pending retry must not sync values older than this uplink's
+        self.replace_retry(uplink.deveui, uplink)
+        try:
+            with self.d_client.deadline(self.args.message_deadline):
+                self.sync_device(uplink)
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Tracker.sync(): sync of {uplink.deveui} failed, retrying in {self.args.retry_delay}s: {e}")
+            self.retry_sync(uplink.deveui, uplink)
+        return
+
+    def replace_retry(self, deveui: str, uplink: Uplink):
+        """
+        Replace the uplink of the device's pending retry with a newer one,
+        a pending join is kept like merge_uplinks() does
+        """
+        with self.retry_lock:
+            if deveui in self.retry_timers:
+                self.retry_uplinks[deveui], = self.merge_uplinks((self.retry_uplinks[deveui],), (uplink,))
+        return
 
-        #load the node manifest
-        manifest = Manifest(self.args.manifest)
+    def retry_sync(self, deveui: str, uplink: Uplink):
+        """
+        Queue the device's sync again after the retry delay. 
+        A device only has one pending retry, it syncs the device's newest uplink
+        """
+        def retry():
+            with self.retry_lock:
+                self.retry_timers.pop(deveui, None)
+                uplink = self.retry_uplinks.pop(deveui)
+            self.queue_sync(deveui, uplink)
+
+        with self.retry_lock:
+            if deveui in self.retry_timers: #the newer uplink replaces the pending one
+                self.retry_uplinks[deveui], = self.merge_uplinks((self.retry_uplinks[deveui],), (uplink,))
+                return
+            timer = threading.Timer(self.args.retry_delay, retry)
+            timer.daemon = True
+            self.retry_timers[deveui] = timer
+            self.retry_uplinks[deveui] = uplink
+        timer.start()
+        return
+
+    def sync_device(self, uplink: Uplink):
+        """
+        Sync the device's lorawan records in chirpstack with django and the manifest
+        uplink: the Uplink record of the message
+        """
+        #retrieve data from chirpstack, keys only when they could have changed
+        device_resp, deviceprofile_resp, act_resp, key_resp = self.get_chirpstack_data(uplink, self.keys_due(uplink))
 
-        #retrieve data from chirpstack
-        device_resp = self.c_client.get_device(deviceInfo["devEui"])
-        deviceprofile_resp = self.c_client.get_device_profile(deviceInfo["deviceProfileId"])
-        act_resp = self.c_client.get_device_activation(deviceInfo["devEui"])
+        last_seen_at = self.last_seen_at(uplink, device_resp)
 
         #check for lorawan connection in server
-        server_lc_exist = self.d_client.lc_search(deviceInfo["devEui"])
+        server_lc_exist = self.d_client.lc_search(uplink.deveui)
 
         #if lorawan connection exist in django then...
         if server_lc_exist:
-            #update lorawan device, connection, and key                
-            self.update_ld(deviceInfo["devEui"], device_resp)
-            self.update_lc(deviceInfo["devEui"], device_resp, deviceprofile_resp)
-            self.update_lk(deviceInfo["devEui"], act_resp, deviceprofile_resp)
+            #update lorawan device, connection, and key, they target different routers so they run concurrently
+            updates = [
+                (self.update_ld, uplink.deveui, device_resp),
+                (self.update_lc, uplink.deveui, device_resp, deviceprofile_resp, last_seen_at)
+            ]
+            if act_resp is not None:
+                updates.append((self.update_lk, uplink.deveui, act_resp, deviceprofile_resp, key_resp))
+            results = self.run_concurrently(updates)
+            #keys are only due again after django has them, a failed write is retried next uplink
+            if act_resp is not None and results[2]:
+                self.keys_synced(uplink.deveui, act_resp)
         else:
             #if lorawan device exist in django then...
-            if self.d_client.ld_search(deviceInfo["devEui"]):
+            if self.d_client.ld_search(uplink.deveui):
                 # update lorawan device
-                self.update_ld(deviceInfo["devEui"], device_resp) 
+                self.update_ld(uplink.deveui, device_resp) 
             #else lorawan device does not exist in django then...
             else:
                 #TODO: What is a better way to check if sensor hardware exists? 
@@ -70,26 +294,210 @@ class Tracker(MqttClient):
                 #       - right now hw_model is filled as best as the tracker can
                 #       - since we will change it, duplicates will be created
                 hw_model = clean_hw_model(deviceprofile_resp.device_profile.name)
-                # if sensor hardware exist in django then...
-                if self.d_client.sh_search(hw_model):
-                    # get sensor hardware from django
-                    response = self.d_client.get_sh(hw_model)
-                    sh_id = response['json_body'].get('id')
-                #else sensor hardware does not exist in django then...
-                else:
-                    # create a new sensor hardware
-                    sh_id = self.create_sh(deviceprofile_resp)
+                #devices with the same new hw_model share one search and create
+                sh_id = self.flights.do(("sensor_hardware", hw_model), self.get_or_create_sh, hw_model, deviceprofile_resp)
                 # create a new lorawan device
-                self.create_ld(deviceInfo["devEui"], sh_id, device_resp)
+                self.create_ld(uplink.deveui, sh_id, device_resp)
 
             #create a new lorawan connection and key
-            lc_str = self.create_lc(deviceInfo["devEui"], device_resp, deviceprofile_resp)
-            self.create_lk(deviceInfo["devEui"], lc_str, act_resp, deviceprofile_resp)
+            lc_str = self.create_lc(uplink.deveui, device_resp, deviceprofile_resp, last_seen_at)
+            #a new connection always needs its keys
+            if act_resp is None:
+                act_resp, key_resp = self.get_chirpstack_keys(uplink.deveui, deviceprofile_resp)
+            if act_resp is not None and self.create_lk(uplink.deveui, lc_str, act_resp, deviceprofile_resp, key_resp):
+                self.keys_synced(uplink.deveui, act_resp)
 
-        #update manifest
-        self.update_manifest(deviceInfo["devEui"], manifest, device_resp, deviceprofile_resp)
+        #update the node manifest, one worker at a time so updates are not lost
+        with self.manifest.lock:
+            self.manifest.reload_if_changed()
+            self.update_manifest(uplink.deveui, self.manifest, device_resp, deviceprofile_resp, last_seen_at)
         return
     
+    def get_device_profile(self, profile_id: str):
+        """
+        Return the device profile from the profile cache or chirpstack.
+        A stale profile is refreshed in the background if profile_refresh is set, else it is retrieved again
+        profile_id: the device profile's id in chirpstack
+        """
+        deviceprofile_resp, expired = self.profiles.get_stale(profile_id)
+        if deviceprofile_resp is None or (expired and not self.args.profile_refresh):
+            deviceprofile_resp = self.fetch_device_profile(profile_id)
+        elif expired:
+            with self.profiles_lock:
+                refresh = profile_id not in self.profiles_refreshing
+                self.profiles_refreshing.add(profile_id)
+            if refresh:
+                self.executor.submit(self.refresh_device_profile, profile_id)
+        return deviceprofile_resp
+
+    def fetch_device_profile(self, profile_id: str):
+        """
+        Retrieve the device profile from chirpstack into the profile cache,
+        concurrent fetches of the same profile wait on the one in flight
+        """
+        deviceprofile_resp = self.flights.do(("chirpstack", "device_profile", profile_id), self.c_client.get_device_profile, profile_id)
+        self.profiles.set(profile_id, deviceprofile_resp)
+        return deviceprofile_resp
+
+    def refresh_device_profile(self, profile_id: str):
+        """
+        Retrieve the device profile from chirpstack into the profile cache,
+        on failure the stale profile is kept and refreshed on a later uplink
+        """
+        try:
+            self.fetch_device_profile(profile_id)
+        except Exception as e:
+            logging.error(f"Tracker.refresh_device_profile(): refresh of {profile_id} failed: {e}")
+        finally:
+            with self.profiles_lock:
+                self.profiles_refreshing.discard(profile_id)
+        return
+
+    def run_concurrently(self, calls: list) -> list:
+        """
+        Run each (fn, *args) call on the fan-out pool under the caller's django deadline and wait for all of them.
+        Returns the results in order. If calls failed each error is logged and the first one is raised
+        """
+        futures = [self.executor.submit(self.d_client.with_deadline(fn), *args) for fn, *args in calls]
+        wait(futures)
+        errors = []
+        for (fn, *_), f in zip(calls, futures):
+            if f.exception() is not None:
+                logging.error(f"Tracker.run_concurrently(): {getattr(fn, '__name__', fn)}() failed: {f.exception()}")
+                errors.append(f.exception())
+        if errors:
+            raise errors[0]
+        return [f.result() for f in futures]
+
+    def get_chirpstack_data(self, uplink: Uplink, sync_keys: bool = True) -> tuple:
+        """
+        Retrieve the device, device profile and device activation from chirpstack concurrently,
+        the app key is retrieved as soon as the device profile says the device uses OTAA.
+        Returns (device_resp, deviceprofile_resp, act_resp, key_resp). act_resp and key_resp are None
+        if they could not be retrieved, errors retrieving the device or device profile are raised
+        uplink: the Uplink record of the message
+        sync_keys: if False the activation and app key are not retrieved
+        """
+        deveui = uplink.deveui
+        device_resp = self.device_from_payload(uplink)
+        device_f = self.executor.submit(self.c_client.get_device, deveui) if device_resp is None else None
+        act_f = self.executor.submit(self.c_client.get_device_activation, deveui) if sync_keys else None
+        key_f = None
+        try:
+            deviceprofile_resp = self.get_device_profile(uplink.device_profile_id)
+            if sync_keys and deviceprofile_resp.device_profile.supports_otaa:
+                lw_v = deviceprofile_resp.device_profile.mac_version
+                key_f = self.executor.submit(self.c_client.get_device_app_key, deveui, lw_v)
+        finally:
+            #wait for the calls in flight even if the device profile failed
+            wait([f for f in (device_f, act_f, key_f) if f is not None])
+
+        if device_f is not None:
+            device_resp = device_f.result()
+        act_resp, key_resp = self.key_results(deveui, act_f, key_f)
+        return device_resp, deviceprofile_resp, act_resp, key_resp
+
+    def device_from_payload(self, uplink: Uplink):
+        """
+        With last_seen_from_payload, return the device's fields the sync uses in the shape of chirpstack's
+        get_device(): the name from the uplink, battery level and margin from the last synced values, which
+        status events keep up to date. Returns None if get_device() is needed: the option is off,
+        the uplink has no valid time or the battery level or margin was not synced yet
+        uplink: the Uplink record of the message
+        """
+        if not self.args.last_seen_from_payload or not uplink.time:
+            return None
+        try:
+            ISO_to_UTC_str(uplink.time)
+        except ValueError:
+            return None
+        battery_level = self.snapshots.get("ld", uplink.deveui, "battery_level")
+        margin = self.snapshots.get("lc", uplink.deveui, "margin")
+        if battery_level is None or margin is None:
+            return None
+        self.device_lookups_skipped += 1
+        return SimpleNamespace(
+            device=SimpleNamespace(name=uplink.device_name),
+            device_status=SimpleNamespace(battery_level=battery_level, margin=margin)
+        )
+
+    def get_chirpstack_keys(self, deveui: str, deviceprofile_resp) -> tuple:
+        """
+        Retrieve the device activation and, if the device uses OTAA, the app key from chirpstack.
+        Returns (act_resp, key_resp), act_resp is None if the keys could not be retrieved
+        deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        """
+        act_f = self.executor.submit(self.c_client.get_device_activation, deveui)
+        key_f = None
+        if deviceprofile_resp.device_profile.supports_otaa:
+            lw_v = deviceprofile_resp.device_profile.mac_version
+            key_f = self.executor.submit(self.c_client.get_device_app_key, deveui, lw_v)
+        wait([f for f in (act_f, key_f) if f is not None])
+        return self.key_results(deveui, act_f, key_f)
+
+    @staticmethod
+    def key_results(deveui: str, act_f, key_f) -> tuple:
+        """
+        Return (act_resp, key_resp) from the finished activation and app key futures.
+        Errors are logged and act_resp is None so the keys are not synced
+        """
+        if act_f is None:
+            return None, None
+        try:
+            act_resp = act_f.result()
+        except Exception as e:
+            logging.error(f"Tracker.key_results(): get_device_activation({deveui}) failed, keys will not be synced: {e}")
+            return None, None
+        key_resp = None
+        if key_f is not None:
+            try:
+                key_resp = key_f.result()
+            except Exception as e:
+                logging.error(f"Tracker.key_results(): get_device_app_key({deveui}) failed, keys will not be synced: {e}")
+                return None, None
+        return act_resp, key_resp
+
+    def keys_due(self, uplink: Uplink) -> bool:
+        """
+        Return True if the device's keys should be synced. Session keys only change on a join, so keys are
+        synced on a join event, when the uplink's devAddr changed, or once every key_sync_interval seconds
+        uplink: the Uplink record of the message
+        """
+        if uplink.join:
+            return True
+        with self.key_syncs_lock:
+            last = self.key_syncs.get(uplink.deveui)
+        if last is None:
+            return True
+        dev_addr, synced_at = last
+        if uplink.dev_addr and uplink.dev_addr != dev_addr:
+            return True
+        return time.monotonic() - synced_at >= self.args.key_sync_interval
+
+    def keys_synced(self, deveui: str, act_resp):
+        """
+        Record the devAddr the device's keys were synced with
+        act_resp: the output of chirpstack client's get_device_activation()
+        """
+        with self.key_syncs_lock:
+            self.key_syncs[deveui] = (act_resp.device_activation.dev_addr, time.monotonic())
+        return
+
+    def last_seen_at(self, uplink: Uplink, device_resp) -> str:
+        """
+        Return when the device was last seen as '%Y-%m-%dT%H:%M:%SZ'. With last_seen_from_payload
+        it is the uplink's time, else (or if the uplink has no valid time) chirpstack's last_seen_at
+        uplink: the Uplink record of the message, if None chirpstack's last_seen_at is used
+        device_resp: the output of chirpstack client's get_device()
+        """
+        if self.args.last_seen_from_payload and uplink is not None and uplink.time:
+            try:
+                return ISO_to_UTC_str(uplink.time)
+            except ValueError as e:
+                logging.error(f"Tracker.last_seen_at(): {e}")
+        datetime_obj_utc = epoch_to_UTC(device_resp.last_seen_at.seconds, device_resp.last_seen_at.nanos)
+        return datetime_obj_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+
     def update_ld(self, deveui: str, device_resp: dict):
         """
         Update lorawan device using mqtt message, chirpstack client, and django client
@@ -101,7 +509,7 @@ class Tracker(MqttClient):
             "name": dev_name,
             "battery_level": battery_level
         }
-        self.d_client.update_ld(deveui, ld_data)
+        self.patch_changed("ld", deveui, ld_data, self.d_client.update_ld)
 
         return
 
@@ -119,19 +527,21 @@ class Tracker(MqttClient):
             "hardware": sh_id,
             "deveui": deveui
         }
-        self.d_client.create_ld(ld_data)
+        response = self.d_client.create_ld(ld_data)
+        if response['json_body']:
+            self.snapshots.update("ld", deveui, ld_data)
 
         return
 
-    def update_lc(self, deveui: str, device_resp: dict, deviceprofile_resp: dict):
+    def update_lc(self, deveui: str, device_resp: dict, deviceprofile_resp: dict, last_seen_at: str = None):
         """
         Update lorawan connection using mqtt message, chirpstack client, and django client
         device_resp: the output of chirpstack client's get_device()
         deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        last_seen_at: the output of last_seen_at(), if None it is taken from device_resp
         """   
         dev_name = replace_spaces(device_resp.device.name)
-        datetime_obj_utc = epoch_to_UTC(device_resp.last_seen_at.seconds, device_resp.last_seen_at.nanos)        
-        last_seen_at = datetime_obj_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+        last_seen_at = last_seen_at or self.last_seen_at(None, device_resp)
         margin = device_resp.device_status.margin
         expected_uplink = deviceprofile_resp.device_profile.uplink_interval
         con_type = "OTAA" if deviceprofile_resp.device_profile.supports_otaa else "ABP"
@@ -142,20 +552,20 @@ class Tracker(MqttClient):
             "expected_uplink_interval_sec": expected_uplink,
             "connection_type": con_type
         }
-        self.d_client.update_lc(deveui, lc_data)
+        self.patch_changed("lc", deveui, lc_data, self.d_client.update_lc)
 
         return
 
-    def create_lc(self, deveui: str, device_resp: dict, deviceprofile_resp: dict) -> str:
+    def create_lc(self, deveui: str, device_resp: dict, deviceprofile_resp: dict, last_seen_at: str = None) -> str:
         """
         Create a lorawan connection using mqtt message, chirpstack client, and django client.
         Returns the lorawan connection uid in django.
         device_resp: the output of chirpstack client's get_device()
         deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        last_seen_at: the output of last_seen_at(), if None it is taken from device_resp
         """
         dev_name = replace_spaces(device_resp.device.name)
-        datetime_obj_utc = epoch_to_UTC(device_resp.last_seen_at.seconds, device_resp.last_seen_at.nanos)        
-        last_seen_at = datetime_obj_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+        last_seen_at = last_seen_at or self.last_seen_at(None, device_resp)
         margin = device_resp.device_status.margin
         expected_uplink = deviceprofile_resp.device_profile.uplink_interval
         con_type = "OTAA" if deviceprofile_resp.device_profile.supports_otaa else "ABP"
@@ -170,17 +580,19 @@ class Tracker(MqttClient):
         }
         response = self.d_client.create_lc(lc_data)
         if response['json_body']:
+            self.snapshots.update("lc", deveui, lc_data)
             lc_str = self.args.vsn + "-" + dev_name + "-" + deveui
             return lc_str
         else:
             logging.error("Tracker.create_lc(): d_client.create_lc() did not return a valid response")
             return None
         
-    def update_lk(self, deveui: str, act_resp: dict, deviceprofile_resp: dict):
+    def update_lk(self, deveui: str, act_resp: dict, deviceprofile_resp: dict, key_resp: str = None):
         """
-        Update lorawan keys using mqtt message, chirpstack client, and django client
+        Update lorawan keys using mqtt message, chirpstack client, and django client. Returns True if django has the keys
         act_resp: the output of chirpstack client's get_device_activation()
         deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        key_resp: the output of chirpstack client's get_device_app_key(), retrieved if None and the device uses OTAA
         """
         con_type = "OTAA" if deviceprofile_resp.device_profile.supports_otaa else "ABP"
         nwk_key = act_resp.device_activation.nwk_s_enc_key
@@ -193,18 +605,18 @@ class Tracker(MqttClient):
         }
         if con_type == "OTAA":
             lw_v = deviceprofile_resp.device_profile.mac_version
-            key_resp = self.c_client.get_device_app_key(deveui,lw_v)
+            if key_resp is None:
+                key_resp = self.c_client.get_device_app_key(deveui,lw_v)
             lk_data["app_key"] = key_resp
-        self.d_client.update_lk(deveui, lk_data)
+        return self.patch_changed("lk", deveui, lk_data, self.d_client.update_lk)
 
-        return
-
-    def create_lk(self, deveui: str, lc_str: str, act_resp: dict, deviceprofile_resp: dict):
+    def create_lk(self, deveui: str, lc_str: str, act_resp: dict, deviceprofile_resp: dict, key_resp: str = None):
         """
-        Create lorawan keys using mqtt message, chirpstack client, and django client
+        Create lorawan keys using mqtt message, chirpstack client, and django client. Returns True if the keys were created
         lc_str: the unique string of the lorawan connection. Used to reference the lorawan connection record
         act_resp: the output of chirpstack client's get_device_activation()
         deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        key_resp: the output of chirpstack client's get_device_app_key(), retrieved if None and the device uses OTAA
         """
         con_type = "OTAA" if deviceprofile_resp.device_profile.supports_otaa else "ABP"
         nwk_key = act_resp.device_activation.nwk_s_enc_key
@@ -218,11 +630,57 @@ class Tracker(MqttClient):
         }
         if con_type == "OTAA":
             lw_v = deviceprofile_resp.device_profile.mac_version
-            key_resp = self.c_client.get_device_app_key(deveui,lw_v)
+            if key_resp is None:
+                key_resp = self.c_client.get_device_app_key(deveui,lw_v)
             lk_data["app_key"] = key_resp
-        self.d_client.create_lk(lk_data)
+        response = self.d_client.create_lk(deveui, lk_data)
+        if response['json_body']:
+            self.snapshots.update("lk", deveui, lk_data)
+            return True
 
-        return
+        return False
+
+    def patch_changed(self, record: str, deveui: str, data: dict, update_fn):
+        """
+        Call update_fn with only the fields in data that changed since the last sync,
+        the PATCH is skipped if nothing changed. If only LOW_PRIORITY_FIELDS changed the PATCH is low priority,
+        when it is deferred by the rate limit the snapshot is kept so the fields are sent low priority again next sync.
+        The full record is sent next sync only after django rejects the PATCH
+        record: record type the last synced fields are kept under (ex; "ld", "lc", "lk")
+        update_fn: the django client's update method for the record
+        Returns True if the record in django is up to date (nothing changed or the PATCH succeeded)
+        """
+        changed = self.snapshots.diff(record, deveui, data)
+        if not changed:
+            logging.debug(f"Tracker.patch_changed(): {record} for {deveui} did not change, PATCH skipped ({self.snapshots.patches_avoided} avoided)")
+            return True
+        if changed.keys() <= self.LOW_PRIORITY_FIELDS: #a routine refresh, can wait if the rate limit is reached
+            response = update_fn(deveui, changed, low_priority=True)
+        else:
+            response = update_fn(deveui, changed)
+        if response['json_body']:
+            self.snapshots.update(record, deveui, changed)
+            return True
+        if response.get('status_code') == 429: #rate limited, the changed fields are still in the next diff
+            return False
+        #the record in django is unknown, send the full record next time
+        self.snapshots.invalidate(record, deveui)
+        return False
+
+    def get_or_create_sh(self, hw_model: str, deviceprofile_resp: dict) -> int:
+        """
+        Return the id of the sensor hardware in django, creating it if it does not exist
+        hw_model: the sensor hardware's hw_model, the output of clean_hw_model()
+        deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        """
+        # if sensor hardware exist in django then...
+        if self.d_client.sh_search(hw_model):
+            # get sensor hardware from django
+            response = self.d_client.get_sh(hw_model)
+            return response['json_body'].get('id')
+        #else sensor hardware does not exist in django then...
+        # create a new sensor hardware
+        return self.create_sh(deviceprofile_resp)
 
     #TODO: consider using Tanuki to fill out fields like description, manufacturer, etc. in sensor hardware
     def create_sh(self, deviceprofile_resp: dict) -> int:
@@ -247,16 +705,16 @@ class Tracker(MqttClient):
             logging.error("Tracker.create_sh(): d_client.create_sh() did not return a valid response")
             return None
 
-    def update_manifest(self, deveui: str, manifest: Manifest, device_resp: dict, deviceprofile_resp: dict):
+    def update_manifest(self, deveui: str, manifest: Manifest, device_resp: dict, deviceprofile_resp: dict, last_seen_at: str = None):
         """
         Update manifest using mqtt message, chirpstack client, django client, and manifest
         dev_exist: boolean that tells if device exist in manifest
         manifest: Manifest object
         device_resp: the output of chirpstack client's get_device()
         deviceprofile_resp: the output of chirpstack client's get_device_profile()
+        last_seen_at: the output of last_seen_at(), if None it is taken from device_resp
         """
-        datetime_obj_utc = epoch_to_UTC(device_resp.last_seen_at.seconds, device_resp.last_seen_at.nanos)        
-        last_seen_at = datetime_obj_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+        last_seen_at = last_seen_at or self.last_seen_at(None, device_resp)
         margin = device_resp.device_status.margin
         expected_uplink = deviceprofile_resp.device_profile.uplink_interval
         con_type = "OTAA" if deviceprofile_resp.device_profile.supports_otaa else "ABP"
@@ -293,6 +751,63 @@ class Tracker(MqttClient):
         manifest.update_manifest(manifest_data)
         return
 
+    def run(self):
+        """
+        Connect to MQTT broker and stop the coalescer and dispatcher when the network loop exits,
+        on SIGTERM pending work and the manifest are flushed before the process ends
+        """
+        stats_stop = threading.Event()
+        if self.args.stats_interval > 0:
+            threading.Thread(target=self.log_stats_every, args=(stats_stop,), name="tracker-stats", daemon=True).start()
+        try:
+            super().run()
+        finally:
+            stats_stop.set()
+            self.coalescer.stop()
+            with self.retry_lock:
+                for timer in self.retry_timers.values():
+                    timer.cancel()
+            self.dispatcher.stop()
+            self.executor.shutdown()
+            self.manifest.close()
+            self.log_stats()
+            self.d_client.close()
+
+    def log_stats_every(self, stop: threading.Event):
+        """
+        Loop that logs the stats every stats_interval seconds until stop is set
+        """
+        while not stop.wait(self.args.stats_interval):
+            try:
+                self.log_stats()
+            except Exception as e:
+                logging.exception(f"Tracker.log_stats_every(): {e}")
+
+    def log_stats(self):
+        """
+        Log the mqtt, tracker, django client, cache and dedup stats
+        """
+        logging.info(f"Tracker.log_stats(): django connection stats {self.d_client.connection_stats()}")
+        logging.info(f"Tracker.log_stats(): django latency stats {self.d_client.latency_stats()}")
+        #copied in one step, the network loop adds event types while the stats are logged
+        logging.info(f"Tracker.log_stats(): mqtt messages per event {dict(self.events)}, dropped {self.dropped}")
+        logging.info(f"Tracker.log_stats(): uplinks coalesced {self.coalescer.coalesced}")
+        logging.info(f"Tracker.log_stats(): django PATCHes sent {self.snapshots.patches_sent}, avoided {self.snapshots.patches_avoided}")
+        logging.info(f"Tracker.log_stats(): manifest writes {self.manifest.flushes}, saves skipped {self.manifest.saves_skipped}")
+        logging.info(f"Tracker.log_stats(): device profile cache hits {self.profiles.hits}, misses {self.profiles.misses}")
+        logging.info(f"Tracker.log_stats(): chirpstack get_device calls skipped {self.device_lookups_skipped}")
+        logging.info(f"Tracker.log_stats(): duplicate messages dropped {self.recent.hits}")
+        logging.info(
+            f"Tracker.log_stats(): django retries {self.d_client.retry_budget.retries}, "
+            f"skipped by the retry budget {self.d_client.retry_budget.exhausted}"
+        )
+        logging.info(f"Tracker.log_stats(): django circuit breaker stats {self.d_client.breaker.stats()}")
+        logging.info(f"Tracker.log_stats(): django rate limit stats {self.d_client.limit_stats()}")
+        logging.info(f"Tracker.log_stats(): single-flight calls made {self.flights.calls_made}, shared {self.flights.calls_shared}")
+        if self.d_client.outbox is not None:
+            logging.info(f"Tracker.log_stats(): django outbox stats {self.d_client.outbox.stats()}")
+        return
+
 def main(): # pragma: no cover
     parser = argparse.ArgumentParser()
     parser.add_argument("--debug", action="store_true", help="enable debug logs")
@@ -368,6 +883,212 @@ def main(): # pragma: no cover
         default=os.getenv("SENSORHARDWARE_ROUTER"),
         help="API server's Sensor Hardware Router.",
     )
+    parser.add_argument(
+        "--workers",
+        default=os.getenv("TRACKER_WORKERS", 4),
+        help="Number of worker threads that sync devices. If 0, devices are synced in the MQTT network loop",
+        type=int,
+    )
+    parser.add_argument(
+        "--queue-size",
+        default=os.getenv("TRACKER_QUEUE_SIZE", 100),
+        help="Max number of pending messages per worker, messages are dropped when full",
+        type=int,
+    )
+    parser.add_argument(
+        "--coalesce-window",
+        default=os.getenv("TRACKER_COALESCE_WINDOW", 0),
+        help="Seconds to collapse a device's uplinks into one sync. If 0, every uplink is synced",
+        type=float,
+    )
+    parser.add_argument(
+        "--exists-ttl",
+        default=os.getenv("DJANGO_EXISTS_TTL", 3600),
+        help="Seconds to cache that a record exists in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--not-exists-ttl",
+        default=os.getenv("DJANGO_NOT_EXISTS_TTL", 30),
+        help="Seconds to cache that a record does not exist in the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--pool-size",
+        default=os.getenv("DJANGO_POOL_SIZE"),
+        help="Max number of open connections kept to the API server, defaults to 3 x --workers",
+        type=int,
+    )
+    parser.add_argument(
+        "--connect-timeout",
+        default=os.getenv("DJANGO_CONNECT_TIMEOUT", 5),
+        help="Seconds to wait for a connection to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-timeout",
+        default=os.getenv("DJANGO_READ_TIMEOUT", 15),
+        help="Seconds to wait for the API server to respond",
+        type=float,
+    )
+    parser.add_argument(
+        "--message-deadline",
+        default=os.getenv("TRACKER_MESSAGE_DEADLINE", 60),
+        help="Seconds a message's API server calls can take before the sync is retried later",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-delay",
+        default=os.getenv("TRACKER_RETRY_DELAY", 30),
+        help="Seconds to wait before retrying a failed sync",
+        type=float,
+    )
+    parser.add_argument(
+        "--manifest-flush-interval",
+        default=os.getenv("MANIFEST_FLUSH_INTERVAL", 30),
+        help="Min seconds between writes of the node manifest file. If 0, the file is written on every update",
+        type=float,
+    )
+    parser.add_argument(
+        "--manifest-fsync",
+        action="store_true",
+        help="fsync the node manifest file on every write",
+    )
+    parser.add_argument(
+        "--profile-cache-size",
+        default=os.getenv("TRACKER_PROFILE_CACHE_SIZE", 256),
+        help="Max number of device profiles cached",
+        type=int,
+    )
+    parser.add_argument(
+        "--profile-ttl",
+        default=os.getenv("TRACKER_PROFILE_TTL", 600),
+        help="Seconds a cached device profile is used before it is retrieved again",
+        type=float,
+    )
+    parser.add_argument(
+        "--profile-refresh",
+        action="store_true",
+        help="refresh stale device profiles in the background instead of blocking the uplink",
+    )
+    parser.add_argument(
+        "--key-sync-interval",
+        default=os.getenv("TRACKER_KEY_SYNC_INTERVAL", 86400),
+        help="Max seconds between lorawan key syncs of a device that did not rejoin, 0 syncs keys on every uplink",
+        type=float,
+    )
+    parser.add_argument(
+        "--last-seen-from-payload",
+        action="store_true",
+        help="take a connection's last_seen_at from the uplink's time and skip chirpstack's get_device once status events reported the device's battery level and margin",
+    )
+    parser.add_argument(
+        "--dedup-size",
+        default=os.getenv("TRACKER_DEDUP_SIZE", 4096),
+        help="Number of recent deduplicationIds remembered to drop redelivered messages (about 250 bytes each), 0 disables",
+        type=int,
+    )
+    parser.add_argument(
+        "--dedup-ttl",
+        default=os.getenv("TRACKER_DEDUP_TTL", 600),
+        help="Seconds a deduplicationId is remembered",
+        type=float,
+    )
+    parser.add_argument(
+        "--debug-sample",
+        default=os.getenv("TRACKER_DEBUG_SAMPLE", 1),
+        help="With --debug, log one of every N messages received",
+        type=int,
+    )
+    parser.add_argument(
+        "--outbox",
+        default=os.getenv("DJANGO_OUTBOX"),
+        help="SQLite file that keeps API server mutations that could not be sent, if not set they are not kept",
+    )
+    parser.add_argument(
+        "--outbox-interval",
+        default=os.getenv("DJANGO_OUTBOX_INTERVAL", 30),
+        help="Seconds between attempts to send the mutations in the outbox",
+        type=float,
+    )
+    parser.add_argument(
+        "--get-retries",
+        default=os.getenv("DJANGO_GET_RETRIES", 2),
+        help="Times a failed GET to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--patch-retries",
+        default=os.getenv("DJANGO_PATCH_RETRIES", 2),
+        help="Times a failed PATCH to the API server is retried",
+        type=int,
+    )
+    parser.add_argument(
+        "--post-retries",
+        default=os.getenv("DJANGO_POST_RETRIES", 1),
+        help="Times a failed POST to the API server is retried, only when it can not create a duplicate record",
+        type=int,
+    )
+    parser.add_argument(
+        "--retry-base",
+        default=os.getenv("DJANGO_RETRY_BASE", 0.5),
+        help="Min seconds to wait before retrying a call to the API server",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-cap",
+        default=os.getenv("DJANGO_RETRY_CAP", 10),
+        help="Max seconds to wait before retrying a call to the API server, longer Retry-After answers are not retried",
+        type=float,
+    )
+    parser.add_argument(
+        "--retry-budget",
+        default=os.getenv("DJANGO_RETRY_BUDGET", 0.1),
+        help="Retries allowed per call made to the API server, limits retries while the server is down",
+        type=float,
+    )
+    parser.add_argument(
+        "--breaker-threshold",
+        default=os.getenv("DJANGO_BREAKER_THRESHOLD", 5),
+        help="Consecutive failed calls to the API server that stop calling it",
+        type=int,
+    )
+    parser.add_argument(
+        "--breaker-reset",
+        default=os.getenv("DJANGO_BREAKER_RESET", 30),
+        help="Seconds to stop calling the API server before probing it with a single call",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-rate",
+        default=os.getenv("DJANGO_READ_RATE", 5),
+        help="Max GETs per second to the API server, 0 for no limit",
+        type=float,
+    )
+    parser.add_argument(
+        "--read-burst",
+        default=os.getenv("DJANGO_READ_BURST", 10),
+        help="Max GETs sent at once to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--write-rate",
+        default=os.getenv("DJANGO_WRITE_RATE", 2),
+        help="Max POSTs and PATCHes per second to the API server, 0 for no limit. Routine refreshes are deferred when reached",
+        type=float,
+    )
+    parser.add_argument(
+        "--write-burst",
+        default=os.getenv("DJANGO_WRITE_BURST", 5),
+        help="Max POSTs and PATCHes sent at once to the API server",
+        type=int,
+    )
+    parser.add_argument(
+        "--stats-interval",
+        default=os.getenv("TRACKER_STATS_INTERVAL", 300),
+        help="Seconds between logs of the API server, cache and dedup stats, 0 logs them only on shutdown",
+        type=float,
+    )
 
     #get args
     args = parser.parse_args()
@@ -0,0 +1,59 @@
+"""
+Benchmark Manifest lookups at a large count of lorawan connections.
+Compares the deveui index against the linear scan it replaced. Run from the repo root:
+    PYTHONPATH=. python test/bench_manifest.py
+"""
+import timeit
+import argparse
+from unittest.mock import patch
+from app.manifest import Manifest
+
+def linear_ld_search(manifest: Manifest, deveui: str) -> bool:
+    """
+    Manifest.ld_search() before the deveui index
+    """
+    for lc in manifest.dict["lorawanconnections"]:
+        if lc["lorawandevice"]["deveui"] == deveui:
+            return True
+    return False
+
+def linear_index(manifest: Manifest, deveui: str) -> int:
+    """
+    Manifest.update_manifest()'s lookup before the deveui index
+    """
+    return next((i for i, lc in enumerate(manifest.dict["lorawanconnections"])
+                 if lc.get("lorawandevice", {}).get("deveui") == deveui), None)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--connections", default=10000, type=int, help="number of lorawan connections")
+    parser.add_argument("--number", default=1000, type=int, help="lookups per measurement")
+    args = parser.parse_args()
+
+    manifest = Manifest("/nonexistent/node-manifest-v2.json")
+    manifest.dict = {"lorawanconnections": [
+        {
+            "connection_name": f"dev{i}",
+            "connection_type": "OTAA",
+            "lorawandevice": {"deveui": f"{i:016x}", "name": f"dev{i}", "hardware": {"hw_model": "test"}}
+        } for i in range(args.connections)
+    ]}
+    #worst case for the scan: the last connection
+    deveui = f"{args.connections - 1:016x}"
+    update = {"margin": 1, "lorawandevice": {"deveui": deveui, "battery_level": 50}}
+
+    results = {
+        "ld_search (scan)": timeit.timeit(lambda: linear_ld_search(manifest, deveui), number=args.number),
+        "ld_search (index)": timeit.timeit(lambda: manifest.ld_search(deveui), number=args.number),
+        "update lookup (scan)": timeit.timeit(lambda: linear_index(manifest, deveui), number=args.number),
+        "update lookup (index)": timeit.timeit(lambda: manifest.ld_index(deveui), number=args.number),
+    }
+    with patch.object(Manifest, "save_manifest"):
+        results["update_manifest (index)"] = timeit.timeit(lambda: manifest.update_manifest(update), number=args.number)
+
+    print(f"{args.connections} connections, {args.number} lookups")
+    for name, seconds in results.items():
+        print(f"  {name:<25} {seconds / args.number * 1e6:>10.2f} us/op")
+
+if __name__ == "__main__":
+    main()
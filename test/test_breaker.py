@@ -0,0 +1,62 @@
+import unittest
+from unittest.mock import patch
+from app.django_client.breaker import CircuitBreaker
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker("test", threshold=3, reset_timeout=10)
+
+    def test_opens_after_threshold(self):
+        """
+        Test the breaker opens after threshold consecutive failures and a success resets the count
+        """
+        with self.assertLogs(level='WARNING'):
+            self.breaker.failure()
+            self.breaker.failure()
+            self.breaker.success()
+            self.breaker.failure()
+            self.breaker.failure()
+            self.assertTrue(self.breaker.allow())
+            self.breaker.failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.stats()["rejected"], 1)
+
+    @patch("time.monotonic")
+    def test_half_open_probe(self, mock_monotonic):
+        """
+        Test a single probe is allowed once reset_timeout passes, its failure opens the breaker again
+        """
+        mock_monotonic.return_value = 100.0
+        with self.assertLogs(level='WARNING') as log:
+            for _ in range(3):
+                self.breaker.failure()
+            mock_monotonic.return_value = 110.0
+            self.assertTrue(self.breaker.allow())
+            self.assertFalse(self.breaker.allow())
+            self.breaker.failure()
+            self.assertFalse(self.breaker.allow())
+            mock_monotonic.return_value = 120.0
+            self.assertTrue(self.breaker.allow())
+            self.breaker.success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.stats()["transitions"], {"closed": 1, "open": 2, "half_open": 2})
+        self.assertIn("test half_open -> closed", log.output[-1])
+
+    @patch("time.monotonic")
+    def test_release(self, mock_monotonic):
+        """
+        Test a probe that ended without an answer lets another probe through
+        """
+        mock_monotonic.return_value = 100.0
+        with self.assertLogs(level='WARNING'):
+            for _ in range(3):
+                self.breaker.failure()
+            mock_monotonic.return_value = 110.0
+            self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import time
+import threading
+from unittest.mock import Mock, call
+from app.tracker.coalesce import Coalescer
+
+class TestSubmit(unittest.TestCase):
+
+    def test_submit_no_window(self):
+        """
+        Test submit() runs every work right away when the window is 0
+        """
+        fn = Mock()
+        coalescer = Coalescer(0, fn)
+
+        coalescer.submit("mock_dev_eui", 1)
+        coalescer.submit("mock_dev_eui", 2)
+
+        fn.assert_has_calls([call("mock_dev_eui", 1), call("mock_dev_eui", 2)])
+        self.assertIsNone(coalescer.thread)
+
+    def test_submit_coalesce(self):
+        """
+        Test work inside the window collapses into one run with the latest args
+        """
+        done = threading.Event()
+        fn = Mock(side_effect=lambda key, val: done.set() if val == 4 else None)
+        coalescer = Coalescer(0.2, fn)
+
+        for val in range(5):
+            coalescer.submit("mock_dev_eui", val)
+
+        #first work runs right away, the rest waits for the window to close
+        fn.assert_called_once_with("mock_dev_eui", 0)
+        self.assertTrue(done.wait(5))
+        fn.assert_has_calls([call("mock_dev_eui", 0), call("mock_dev_eui", 4)])
+        self.assertEqual(fn.call_count, 2)
+        self.assertEqual(coalescer.submitted, 5)
+        self.assertEqual(coalescer.coalesced, 3)
+        coalescer.stop()
+
+    def test_submit_keys_independent(self):
+        """
+        Test each key has its own window
+        """
+        fn = Mock()
+        coalescer = Coalescer(60, fn)
+
+        coalescer.submit("dev_1", 1)
+        coalescer.submit("dev_2", 2)
+
+        fn.assert_has_calls([call("dev_1", 1), call("dev_2", 2)])
+        coalescer.stop()
+
+    def test_submit_merge(self):
+        """
+        Test merge() decides the args that replace pending work
+        """
+        fn = Mock()
+        merge = Mock(side_effect=lambda pending, new: (pending[0] + new[0],))
+        coalescer = Coalescer(60, fn, merge)
+
+        coalescer.submit("mock_dev_eui", 1)
+        coalescer.submit("mock_dev_eui", 2) #nothing pending yet, not merged
+        coalescer.submit("mock_dev_eui", 3)
+        coalescer.stop()
+
+        merge.assert_called_once_with((2,), (3,))
+        fn.assert_has_calls([call("mock_dev_eui", 1), call("mock_dev_eui", 5)])
+        self.assertEqual(fn.call_count, 2)
+
+    def test_submit_window_closed(self):
+        """
+        Test work after a window closed with nothing pending runs right away
+        """
+        fn = Mock()
+        coalescer = Coalescer(0.05, fn)
+
+        coalescer.submit("mock_dev_eui", 1)
+        time.sleep(0.2)
+        coalescer.submit("mock_dev_eui", 2)
+
+        fn.assert_has_calls([call("mock_dev_eui", 1), call("mock_dev_eui", 2)])
+        self.assertEqual(coalescer.coalesced, 0)
+        coalescer.stop()
+
+class TestStop(unittest.TestCase):
+
+    def test_stop_runs_pending(self):
+        """
+        Test stop() runs the pending work instead of dropping it
+        """
+        fn = Mock()
+        coalescer = Coalescer(60, fn)
+
+        coalescer.submit("mock_dev_eui", 1)
+        coalescer.submit("mock_dev_eui", 2)
+        coalescer.stop()
+
+        fn.assert_has_calls([call("mock_dev_eui", 1), call("mock_dev_eui", 2)])
+        self.assertFalse(coalescer.thread.is_alive())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -52,4 +52,26 @@ class TestEpochToUtc(unittest.TestCase):
         datetime_obj_chicago = UTC_to_Timezone(datetime_obj_utc, 'America/Chicago')
         date_str = datetime_obj_chicago.strftime('%Y-%m-%d %H:%M:%S')
 
-        self.assertEqual(date_str, "2023-07-13 14:19:21")
\ No newline at end of file
+        self.assertEqual(date_str, "2023-07-13 14:19:21")
+
+class TestISOToUTCStr(unittest.TestCase):
+
+    def test_iso_to_utc_str_utc(self):
+        """
+        Test chirpstack's nanosecond UTC timestamps convert to django's format
+        """
+        self.assertEqual(ISO_to_UTC_str("2022-07-18T09:34:15.775023242+00:00"), "2022-07-18T09:34:15Z")
+        self.assertEqual(ISO_to_UTC_str("2022-07-18T09:34:15Z"), "2022-07-18T09:34:15Z")
+
+    def test_iso_to_utc_str_offset(self):
+        """
+        Test timestamps with an offset are converted to UTC
+        """
+        self.assertEqual(ISO_to_UTC_str("2022-07-18T23:34:15.5-05:00"), "2022-07-19T04:34:15Z")
+
+    def test_iso_to_utc_str_invalid(self):
+        """
+        Test a string that is not an ISO 8601 timestamp raises ValueError
+        """
+        with self.assertRaises(ValueError):
+            ISO_to_UTC_str("2022-07-18 09:34:15")
@@ -0,0 +1,103 @@
+import unittest
+import threading
+from unittest.mock import Mock, patch
+from app.tracker.dispatcher import Dispatcher
+
+class TestSubmit(unittest.TestCase):
+
+    def test_submit_no_workers(self):
+        """
+        Test submit() runs the work in the caller's thread when there are no workers
+        """
+        dispatcher = Dispatcher(0, 0)
+        fn = Mock()
+
+        result = dispatcher.submit("mock_dev_eui", fn, "arg")
+
+        self.assertTrue(result)
+        fn.assert_called_once_with("arg")
+
+    def test_submit_same_key_in_order(self):
+        """
+        Test work for the same key runs in the order it was submitted
+        """
+        dispatcher = Dispatcher(4, 100)
+        done = []
+
+        for i in range(50):
+            dispatcher.submit("mock_dev_eui", done.append, i)
+        dispatcher.join()
+        dispatcher.stop()
+
+        self.assertEqual(done, list(range(50)))
+
+    def test_submit_does_not_block(self):
+        """
+        Test a slow key does not block work for keys on other lanes
+        """
+        dispatcher = Dispatcher(2, 100)
+        release = threading.Event()
+        done = threading.Event()
+        slow_key = "slow"
+        #find a key on the other lane
+        fast_key = next(k for k in map(str, range(100)) if dispatcher.lane_for(k) is not dispatcher.lane_for(slow_key))
+
+        dispatcher.submit(slow_key, release.wait)
+        dispatcher.submit(fast_key, done.set)
+
+        self.assertTrue(done.wait(5))
+        release.set()
+        dispatcher.stop()
+
+    @patch("app.tracker.dispatcher.logging.error")
+    def test_submit_lane_full(self, mock_logging_error):
+        """
+        Test work is dropped and logged when the lane is full
+        """
+        dispatcher = Dispatcher(1, 1)
+        release = threading.Event()
+        started = threading.Event()
+
+        dispatcher.submit("mock_dev_eui", lambda: (started.set(), release.wait()))
+        started.wait(5)
+        self.assertTrue(dispatcher.submit("mock_dev_eui", Mock())) #fills the lane
+        result = dispatcher.submit("mock_dev_eui", Mock())
+
+        self.assertFalse(result)
+        mock_logging_error.assert_called_once_with("Dispatcher.submit(): lane for mock_dev_eui is full, work dropped")
+        release.set()
+        dispatcher.stop()
+
+class TestWork(unittest.TestCase):
+
+    def test_work_exception(self):
+        """
+        Test a failing work item is logged and does not stop the worker
+        """
+        dispatcher = Dispatcher(1, 10)
+        fn = Mock()
+
+        with self.assertLogs(level='ERROR') as log:
+            dispatcher.submit("mock_dev_eui", Mock(side_effect=Exception("Simulated error")))
+            dispatcher.submit("mock_dev_eui", fn)
+            dispatcher.join()
+
+        self.assertIn("Dispatcher.work(): Simulated error", log.output[0])
+        fn.assert_called_once()
+        dispatcher.stop()
+
+    def test_stop(self):
+        """
+        Test stop() finishes queued work and stops the workers
+        """
+        dispatcher = Dispatcher(2, 10)
+        fn = Mock()
+
+        dispatcher.submit("mock_dev_eui", fn)
+        dispatcher.stop()
+
+        fn.assert_called_once()
+        self.assertFalse(any(t.is_alive() for t in dispatcher.threads))
+
+if __name__ == "__main__":
+    unittest.main()
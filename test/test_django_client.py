@@ -1,8 +1,13 @@
 import unittest
 import requests
+import time
+import threading
+import os
+import tempfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pytest import mark
 from unittest.mock import Mock, patch, MagicMock
-from app.django_client import DjangoClient, HttpMethod
+from app.django_client import DjangoClient, HttpMethod, DeadlineExceeded, CircuitOpen, TokenBucket
 
 DEV_EUI = "123456789"
 API_INTERFACE = "https://auth.sagecontinuum.org"
@@ -13,6 +18,25 @@ SH_ROUTER = "sensorhardwares/"
 HW_MODEL = "sfmx100"
 VSN = "W030"
 NODE_TOKEN = "999294cef6fc3a95fe14c145612825ef5ae27567"
+EXISTS_TTL = 3600
+NOT_EXISTS_TTL = 30
+POOL_SIZE = 4
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+OUTBOX = None #mutations are not kept
+OUTBOX_INTERVAL = 30
+GET_RETRIES = 0
+PATCH_RETRIES = 0
+POST_RETRIES = 0
+RETRY_BASE = 0.01
+RETRY_CAP = 0.05
+RETRY_BUDGET = 0.1
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30
+READ_RATE = 0 #not limited
+READ_BURST = 10
+WRITE_RATE = 0 #not limited
+WRITE_BURST = 5
 
 class TestDjangoClient(unittest.TestCase):
     def setUp(self):
@@ -24,22 +48,41 @@ class TestDjangoClient(unittest.TestCase):
             lorawan_device_router=LD_ROUTER,
             sensor_hardware_router=SH_ROUTER,
             vsn=VSN,
-            node_token=NODE_TOKEN
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
         )
         self.django_client = DjangoClient(self.args)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_get_lc(self, mock_get):
         """
         Mocks the requests.get method in django client's get_lc method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {
             'id': 1, 
             'node': 'W030', 
@@ -63,14 +106,13 @@ class TestDjangoClient(unittest.TestCase):
         'last_seen_at': '2023-11-03T20:49:42Z', 'margin': '25.00', 
         'expected_uplink_interval_sec': 1, 'connection_type': 'OTAA'})
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     def test_create_lc(self, mock_post):
         """
         Mocks the requests.post method in django client's create_lc method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 201,
             'Custom-Header': 'Mocked-Value',
         }
         create_data = {
@@ -83,6 +125,7 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 201
         mock_response.json.return_value = create_data
         mock_post.return_value = mock_response
 
@@ -93,14 +136,13 @@ class TestDjangoClient(unittest.TestCase):
         mock_post.assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/", headers=self.django_client.auth_header, json=create_data)
         self.assertEqual(result['json_body'], create_data)
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     def test_update_lc(self, mock_patch):
         """
         Mocks the requests.patch method in django client's update_lc method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         data = {
@@ -113,6 +155,7 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = data
         mock_patch.return_value = mock_response
 
@@ -123,7 +166,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_patch.assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/{VSN}/{DEV_EUI}/", headers=self.django_client.auth_header, json=data)
         self.assertEqual(result['json_body'], data)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_get_ld(self, mock_get):
         """
         Mocks the requests.get method in django client's get_ld method to test it
@@ -131,10 +174,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {"deveui":"123456789","device_name":"test","battery_level":"0.01"}
         mock_get.return_value = mock_response
 
@@ -145,14 +188,13 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{DEV_EUI}/", headers=self.django_client.auth_header)
         self.assertEqual(result['json_body'], {"deveui":"123456789","device_name":"test","battery_level":"0.01"})
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     def test_create_ld(self, mock_post):
         """
         Mocks the requests.post method in django client's create_ld method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 201,
             'Custom-Header': 'Mocked-Value',
         }
         create_data = {
@@ -162,6 +204,7 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 201
         mock_response.json.return_value = create_data
         mock_post.return_value = mock_response
 
@@ -172,14 +215,13 @@ class TestDjangoClient(unittest.TestCase):
         mock_post.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/", headers=self.django_client.auth_header, json=create_data)
         self.assertEqual(result['json_body'], create_data)
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     def test_update_ld(self, mock_patch):
         """
         Mocks the requests.patch method in django client's update_ld method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         data = {
@@ -189,6 +231,7 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = data
         mock_patch.return_value = mock_response
 
@@ -199,18 +242,18 @@ class TestDjangoClient(unittest.TestCase):
         mock_patch.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{DEV_EUI}/", headers=self.django_client.auth_header, json=data)
         self.assertEqual(result['json_body'], data)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_get_lk(self, mock_get):
         """
         Mocks the requests.get method in django client's get_lk method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {
             "id":9,
             "lorawan_connection":"W030-test-123456789",
@@ -229,14 +272,13 @@ class TestDjangoClient(unittest.TestCase):
         self.assertEqual(result['json_body'], {"id":9,"lorawan_connection":"W030-test-123456789","app_key":"12345", 
         "network_Key":"12345","app_session_key":"12345","dev_address":"12345"})
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     def test_create_lk(self, mock_post):
         """
         Mocks the requests.post method in django client's create_lk method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 201,
             'Custom-Header': 'Mocked-Value',
         }
         create_data = {        
@@ -248,24 +290,24 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 201
         mock_response.json.return_value = create_data
         mock_post.return_value = mock_response
 
         # Call the method under test
-        result = self.django_client.create_lk(data=create_data)
+        result = self.django_client.create_lk(DEV_EUI, data=create_data)
 
         # Assertions
         mock_post.assert_called_once_with(f"{API_INTERFACE}/lorawankeys/", headers=self.django_client.auth_header, json=create_data)
         self.assertEqual(result['json_body'], create_data)
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     def test_update_lk(self, mock_patch):
         """
         Mocks the requests.patch method in django client's update_lk method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         data = {        
@@ -277,6 +319,7 @@ class TestDjangoClient(unittest.TestCase):
         }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = data
         mock_patch.return_value = mock_response
 
@@ -287,7 +330,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_patch.assert_called_once_with(f"{API_INTERFACE}/lorawankeys/{VSN}/{DEV_EUI}/", headers=self.django_client.auth_header, json=data)
         self.assertEqual(result['json_body'], data)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_get_sh(self, mock_get):
         """
         Mocks the requests.get method in django client's get_sh method to test it
@@ -295,10 +338,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {"hardware": "test","hw_model": HW_MODEL, "description": "test"}
         mock_get.return_value = mock_response
 
@@ -309,19 +352,19 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/{HW_MODEL}/", headers=self.django_client.auth_header)
         self.assertEqual(result['json_body'], {"hardware": "test","hw_model": HW_MODEL, "description": "test"})
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     def test_create_sh(self, mock_post):
         """
         Mocks the requests.post method in django client's create_sh method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 201,
             'Custom-Header': 'Mocked-Value',
         }
         create_data = {"hardware": "test","hw_model": HW_MODEL, "description": "test"}
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 201
         mock_response.json.return_value = create_data
         mock_post.return_value = mock_response
 
@@ -332,19 +375,19 @@ class TestDjangoClient(unittest.TestCase):
         mock_post.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/", headers=self.django_client.auth_header, json=create_data)
         self.assertEqual(result['json_body'], create_data)
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     def test_update_sh(self, mock_patch):
         """
         Mocks the requests.patch method in django client's update_sh method to test it
         """
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         data = {"hardware": "test","hw_model": HW_MODEL, "description": "test"}
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = data
         mock_patch.return_value = mock_response
 
@@ -355,7 +398,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_patch.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/{HW_MODEL}/", headers=self.django_client.auth_header, json=data)
         self.assertEqual(result['json_body'], {"hardware": "test","hw_model": HW_MODEL, "description": "test"})
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_ld_search_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's ld_search method to test when ld is found
@@ -363,10 +406,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {"deveui":"123456789","device_name":"test","battery_level":"0.01"}
         mock_get.return_value = mock_response
 
@@ -377,7 +420,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{DEV_EUI}/", headers=self.django_client.auth_header)
         self.assertTrue(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_ld_search_Not_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's ld_search method to test when ld is not found
@@ -385,10 +428,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 404,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 404
         mock_response.json.return_value = {}
         mock_get.return_value = mock_response
 
@@ -399,7 +442,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{DEV_EUI}/", headers=self.django_client.auth_header)
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_ld_search_Unexpected_status(self, mock_get):
         """
         Mocks the requests.get method in django client's ld_search method to test when Unexpected status code is returned
@@ -407,10 +450,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 500,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 500
         mock_response.json.return_value = {}
         mock_get.return_value = mock_response
 
@@ -429,9 +472,9 @@ class TestDjangoClient(unittest.TestCase):
         mock_call_api.return_value = {
                 'headers': {
                     'Content-Type': 'application/json', 
-                    'status-code': 500,
                     'Custom-Header': 'Mocked-Value',
                 },
+                'status_code': 500,
                 'json_body': None
             }
 
@@ -441,7 +484,7 @@ class TestDjangoClient(unittest.TestCase):
         # Assertions
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_sh_search_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's sh_search method to test when sh is found
@@ -449,10 +492,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {"hardware": "test","hw_model": HW_MODEL, "description": "test"}
         mock_get.return_value = mock_response
 
@@ -463,7 +506,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/{HW_MODEL}/", headers=self.django_client.auth_header)
         self.assertTrue(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_sh_search_Not_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's sh_search method to test when sh is not found
@@ -471,10 +514,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 404,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 404
         mock_response.json.return_value = {"detail":"not found"}
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("not found")
         mock_get.return_value = mock_response
@@ -486,7 +529,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/{HW_MODEL}/", headers=self.django_client.auth_header)
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_sh_search_Unexpected_status(self, mock_get):
         """
         Mocks the requests.get method in django client's sh_search method to test when Unexpected status code is returned
@@ -494,10 +537,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 500,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 500
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP error")
         mock_get.return_value = mock_response
 
@@ -516,9 +559,9 @@ class TestDjangoClient(unittest.TestCase):
         mock_call_api.return_value = {
             'headers': {
                 'Content-Type': 'application/json', 
-                'status-code': 500,
                 'Custom-Header': 'Mocked-Value',
         },
+            'status_code': 500,
             'json_body': None
         }
 
@@ -528,7 +571,7 @@ class TestDjangoClient(unittest.TestCase):
         # Assertions
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_lc_search_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's lc_search method to test when lc is found
@@ -536,10 +579,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 200,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 200
         mock_response.json.return_value = {"connection_name": "test","margin": 2, "connection_type": "OTAA"}
         mock_get.return_value = mock_response
 
@@ -551,7 +594,7 @@ class TestDjangoClient(unittest.TestCase):
         self.assertTrue(result)
 
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_lc_search_Not_found_happy_path(self, mock_get):
         """
         Mocks the requests.get method in django client's lc_search method to test when lc is not found
@@ -559,10 +602,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 404,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 404
         mock_response.json.return_value = {"detail":"not found"}
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("not found")
         mock_get.return_value = mock_response
@@ -574,7 +617,7 @@ class TestDjangoClient(unittest.TestCase):
         mock_get.assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/{VSN}/{DEV_EUI}/", headers=self.django_client.auth_header)
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_lc_search_Unexpected_status(self, mock_get):
         """
         Mocks the requests.get method in django client's lc_search method to test when Unexpected status code is returned
@@ -582,10 +625,10 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 500,
             'Custom-Header': 'Mocked-Value',
         }
         mock_response.headers = headers
+        mock_response.status_code = 500
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP error")
         mock_get.return_value = mock_response
 
@@ -604,9 +647,9 @@ class TestDjangoClient(unittest.TestCase):
         mock_call_api.return_value = {
             'headers': {
                 'Content-Type': 'application/json', 
-                'status-code': 500,
                 'Custom-Header': 'Mocked-Value',
         },
+            'status_code': 500,
             'json_body': None
         }
 
@@ -616,7 +659,7 @@ class TestDjangoClient(unittest.TestCase):
         # Assertions
         self.assertFalse(result)
 
-    @patch("app.django_client.HttpMethod.GET")
+    @patch("requests.Session.get")
     def test_call_api_sad_path(self, mock_get):
         """
         Test DjangoClient.call_api() with a bad response
@@ -624,9 +667,9 @@ class TestDjangoClient(unittest.TestCase):
         mock_response = Mock()
         mock_response.headers = {
                 'Content-Type': 'application/json', 
-                'status-code': 500,
                 'Custom-Header': 'Mocked-Value',
         }
+        mock_response.status_code = 500
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP Error")
         mock_get.return_value = mock_response
 
@@ -639,6 +682,792 @@ class TestDjangoClient(unittest.TestCase):
         # Assert
         self.assertIsNone(result['json_body'])
 
+class TestExistsCache(unittest.TestCase):
+    def setUp(self):
+        self.args = Mock(
+            api_interface=API_INTERFACE,
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    @staticmethod
+    def mock_response(status_code: int, json_body: dict) -> Mock:
+        """
+        Mock a requests response
+        """
+        mock_response = Mock()
+        mock_response.status_code = status_code
+        mock_response.headers = {'Content-Type': 'application/json'}
+        mock_response.json.return_value = json_body
+        return mock_response
+
+    @patch("requests.Session.get")
+    def test_lc_search_found_cached(self, mock_get):
+        """
+        Test lc_search() only calls the api once when the connection is found
+        """
+        mock_get.return_value = self.mock_response(200, {"connection_name": "test"})
+
+        first = self.django_client.lc_search(dev_eui=DEV_EUI)
+        second = self.django_client.lc_search(dev_eui=DEV_EUI)
+
+        mock_get.assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/{VSN}/{DEV_EUI}/", headers=self.django_client.auth_header)
+        self.assertTrue(first)
+        self.assertTrue(second)
+        self.assertEqual(self.django_client.exists.hits, 1)
+
+    @patch("requests.Session.get")
+    def test_ld_search_not_found_cached(self, mock_get):
+        """
+        Test ld_search() caches a 404 for the short ttl, taken from the response's status code
+        """
+        mock_get.return_value = self.mock_response(404, {"detail": "Not found."})
+        mock_get.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError("404 Not Found")
+        self.django_client.not_exists_ttl = 0.05
+
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(self.django_client.ld_search(dev_eui=DEV_EUI))
+        self.assertFalse(self.django_client.ld_search(dev_eui=DEV_EUI))
+        mock_get.assert_called_once()
+
+        #after the ttl the api is called again
+        time.sleep(0.1)
+        with self.assertLogs(level='ERROR'):
+            self.assertFalse(self.django_client.ld_search(dev_eui=DEV_EUI))
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("requests.Session.get")
+    def test_sh_search_unexpected_status_not_cached(self, mock_get):
+        """
+        Test sh_search() does not cache an unexpected status code
+        """
+        mock_get.return_value = self.mock_response(500, {})
+
+        self.django_client.sh_search(hw_model=HW_MODEL)
+        self.django_client.sh_search(hw_model=HW_MODEL)
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch("requests.Session.get")
+    @patch("requests.Session.post")
+    def test_create_fills_cache(self, mock_post, mock_get):
+        """
+        Test a successful create_lc(), create_ld(), and create_sh() answer the searches without a GET
+        """
+        mock_post.return_value = self.mock_response(201, {"id": 1})
+
+        self.django_client.create_lc({"node": VSN, "lorawan_device": DEV_EUI})
+        self.django_client.create_ld({"deveui": DEV_EUI})
+        self.django_client.create_sh({"hw_model": HW_MODEL})
+
+        self.assertTrue(self.django_client.lc_search(dev_eui=DEV_EUI))
+        self.assertTrue(self.django_client.ld_search(dev_eui=DEV_EUI))
+        self.assertTrue(self.django_client.sh_search(hw_model=HW_MODEL))
+        mock_get.assert_not_called()
+
+    @patch("requests.Session.get")
+    @patch("requests.Session.patch")
+    def test_update_not_found_invalidates(self, mock_patch, mock_get):
+        """
+        Test a 404 on update_lc() makes the next lc_search() call the api
+        """
+        mock_get.return_value = self.mock_response(200, {"connection_name": "test"})
+        self.django_client.lc_search(dev_eui=DEV_EUI)
+        mock_response = self.mock_response(404, {"detail": "Not found."})
+        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("404 Not Found")
+        mock_patch.return_value = mock_response
+
+        self.django_client.update_lc(DEV_EUI, {"margin": 1})
+        self.django_client.lc_search(dev_eui=DEV_EUI)
+
+        self.assertEqual(mock_get.call_count, 2)
+
+class TestSession(unittest.TestCase):
+    def setUp(self):
+        #local server that keeps connections alive
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            delay = 0
+            def do_GET(self):
+                time.sleep(self.delay)
+                body = b'{"deveui": "123456789"}'
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        self.handler = Handler
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.args = Mock(
+            api_interface=f"http://127.0.0.1:{self.server.server_address[1]}",
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    def tearDown(self):
+        self.django_client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_create_session(self):
+        """
+        Test the session's adapter uses the configured pool size
+        """
+        self.assertIs(self.django_client.session.get_adapter(API_INTERFACE), self.django_client.adapter)
+        self.assertEqual(self.django_client.adapter._pool_maxsize, POOL_SIZE)
+
+    def test_connection_reused(self):
+        """
+        Test calls to the server reuse the same open connection
+        """
+        for _ in range(5):
+            result = self.django_client.get_ld(DEV_EUI)
+            self.assertEqual(result['json_body'], {"deveui": "123456789"})
+
+        stats = self.django_client.connection_stats()
+
+        self.assertEqual(stats, {"requests": 5, "connections": 1, "reused": 4})
+
+    def test_read_timeout(self):
+        """
+        Test a call to a server that does not respond in time raises a timeout
+        """
+        self.handler.delay = 0.5
+        self.django_client.read_timeout = 0.1
+
+        with self.assertRaises(requests.exceptions.Timeout):
+            self.django_client.get_ld(DEV_EUI)
+
+        self.assertEqual(self.django_client.latency_stats()[f"GET {LD_ROUTER}"]["count"], 1)
+
+    def test_deadline_caps_timeout(self):
+        """
+        Test a call inside a deadline times out when the deadline passes before the read timeout
+        """
+        self.handler.delay = 0.5
+
+        with self.django_client.deadline(0.1):
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.django_client.get_ld(DEV_EUI)
+
+class TestDeadline(unittest.TestCase):
+    def setUp(self):
+        self.args = Mock(
+            api_interface=API_INTERFACE,
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    def test_timeout_no_deadline(self):
+        """
+        Test timeout() returns the configured timeouts outside of a deadline
+        """
+        self.assertEqual(self.django_client.timeout(), (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    def test_timeout_capped_by_deadline(self):
+        """
+        Test timeout() is capped by the time left before the deadline
+        """
+        with self.django_client.deadline(1):
+            connect, read = self.django_client.timeout()
+
+        self.assertLessEqual(connect, 1)
+        self.assertLessEqual(read, 1)
+        self.assertEqual(self.django_client.timeout(), (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+    @patch("requests.Session.get")
+    def test_call_api_deadline_exceeded(self, mock_get):
+        """
+        Test call_api() fails fast without calling the server once the deadline passed
+        """
+        with self.django_client.deadline(0):
+            with self.assertRaises(DeadlineExceeded):
+                self.django_client.get_ld(DEV_EUI)
+
+        mock_get.assert_not_called()
+
+    @patch("requests.Session.get")
+    def test_call_api_records_latency(self, mock_get):
+        """
+        Test call_api() records the latency under the method and router
+        """
+        mock_response = Mock()
+        mock_response.headers = {'Content-Type': 'application/json'}
+        mock_response.json.return_value = {"deveui": DEV_EUI}
+        mock_get.return_value = mock_response
+
+        self.django_client.get_ld(DEV_EUI)
+        self.django_client.get_ld("987654321")
+        self.django_client.get_sh(HW_MODEL)
+
+        stats = self.django_client.latency_stats()
+        self.assertEqual(stats[f"GET {LD_ROUTER}"]["count"], 2)
+        self.assertEqual(stats[f"GET {SH_ROUTER}"]["count"], 1)
+
+    def test_with_deadline_other_thread(self):
+        """
+        Test with_deadline() carries the caller's deadline to calls made in another thread
+        """
+        results = []
+        with self.django_client.deadline(0):
+            fn = self.django_client.with_deadline(self.django_client.timeout)
+        def run():
+            try:
+                fn()
+            except DeadlineExceeded as e:
+                results.append(e)
+            #the thread's own calls are not affected afterwards
+            results.append(self.django_client.timeout())
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+
+        self.assertIsInstance(results[0], DeadlineExceeded)
+        self.assertEqual(results[1], (CONNECT_TIMEOUT, READ_TIMEOUT))
+
+class TestOutboxQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.args = Mock(
+            api_interface=API_INTERFACE,
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=os.path.join(self.tmpdir.name, "outbox.sqlite"),
+            outbox_interval=3600, #drained by the tests
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    def tearDown(self):
+        self.django_client.close()
+        self.tmpdir.cleanup()
+
+    @patch("requests.Session.patch")
+    def test_call_api_queues_unsent(self, mock_patch):
+        """
+        Test a mutation that could not reach the server is queued and the error is still raised
+        """
+        mock_patch.side_effect = requests.exceptions.ConnectionError("network is unreachable")
+
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.django_client.update_ld(DEV_EUI, {"battery_level": 10})
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.django_client.update_ld(DEV_EUI, {"battery_level": 20})
+
+        rows = self.django_client.outbox.peek()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0][2:], ("PATCH", f"{LD_ROUTER}{DEV_EUI}/", {"battery_level": 20}))
+
+    @patch("requests.Session.post")
+    def test_call_api_queues_unavailable(self, mock_post):
+        """
+        Test a create the server could not handle right now is queued under its record
+        """
+        mock_response = Mock(status_code=503, headers={})
+        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("503 Service Unavailable")
+        mock_response.json.side_effect = requests.exceptions.JSONDecodeError("no body", "", 0)
+        mock_post.return_value = mock_response
+
+        with self.assertLogs(level='WARNING'):
+            result = self.django_client.create_ld({"deveui": DEV_EUI, "name": "test"})
+
+        self.assertIsNone(result['json_body'])
+        self.assertEqual(self.django_client.outbox.peek()[0][2:], ("POST", LD_ROUTER, {"deveui": DEV_EUI, "name": "test"}))
+
+    @patch("requests.Session.patch")
+    def test_call_api_supersedes_queued(self, mock_patch):
+        """
+        Test a mutation sent directly removes the older values of its fields queued for the record,
+        so the outbox does not send them after it
+        """
+        ok = Mock(status_code=200, headers={})
+        ok.json.return_value = {"network_Key": "K2"}
+        mock_patch.side_effect = [requests.exceptions.ConnectionError("network is unreachable"), ok]
+
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.django_client.update_lk(DEV_EUI, {"network_Key": "K1", "dev_address": "a"})
+        self.django_client.update_lk(DEV_EUI, {"network_Key": "K2"})
+
+        rows = self.django_client.outbox.peek()
+        self.assertEqual(rows[0][2:], ("PATCH", f"{LK_ROUTER}{VSN}/{DEV_EUI}/", {"dev_address": "a"}))
+
+    @patch("requests.Session.patch")
+    def test_low_priority_deferred(self, mock_patch):
+        """
+        Test a low priority update is deferred to the outbox when the write rate limit is reached
+        while other updates wait for it
+        """
+        self.django_client.write_limit = TokenBucket(rate=10, burst=1)
+        self.django_client.write_limit.acquire()
+        mock_patch.return_value = Mock(status_code=200, headers={})
+        mock_patch.return_value.json.return_value = {"name": "test"}
+
+        with self.assertLogs(level='WARNING'):
+            result = self.django_client.update_lc(DEV_EUI, {"last_seen_at": "2024-01-01T00:00:00Z"}, low_priority=True)
+        self.assertEqual(result['status_code'], 429)
+        self.assertIsNone(result['json_body'])
+        mock_patch.assert_not_called()
+        self.assertEqual(self.django_client.outbox.peek()[0][2:], ("PATCH", f"{LC_ROUTER}{VSN}/{DEV_EUI}/", {"last_seen_at": "2024-01-01T00:00:00Z"}))
+
+        result = self.django_client.update_ld(DEV_EUI, {"name": "test"})
+        self.assertEqual(result['json_body'], {"name": "test"})
+        stats = self.django_client.limit_stats()["write"]
+        self.assertEqual((stats["granted"], stats["denied"]), (2, 1))
+
+    @patch("requests.Session.patch")
+    @patch("requests.Session.post")
+    def test_drain_outbox(self, mock_post, mock_patch):
+        """
+        Test drain_outbox() sends the queued mutations in order, drops rejected ones
+        and stops when the server is unreachable
+        """
+        self.django_client.outbox.put("POST", f"{LD_ROUTER}1/", LD_ROUTER, {"deveui": "1"})
+        self.django_client.outbox.put("PATCH", f"{LD_ROUTER}2/", f"{LD_ROUTER}2/", {"name": "b"})
+        self.django_client.outbox.put("PATCH", f"{LD_ROUTER}3/", f"{LD_ROUTER}3/", {"name": "c"})
+        created = Mock(status_code=201, headers={})
+        created.json.return_value = {"deveui": "1"}
+        rejected = Mock(status_code=400, headers={})
+        rejected.raise_for_status.side_effect = requests.exceptions.HTTPError("400 Bad Request")
+        rejected.json.return_value = {"name": ["invalid"]}
+        mock_post.return_value = created
+        mock_patch.side_effect = [rejected, requests.exceptions.ConnectionError("network is unreachable")]
+
+        with self.assertLogs(level='WARNING'):
+            sent = self.django_client.drain_outbox()
+
+        stats = self.django_client.outbox.stats()
+        self.assertEqual(sent, 1)
+        self.assertEqual(stats["pending"], 1)
+        self.assertEqual(stats["drained"], 1)
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(self.django_client.outbox.peek()[0][3], f"{LD_ROUTER}3/")
+
+    def test_drain_outbox_superseded_after_peek(self):
+        """
+        Test drain_outbox() does not send queued values that a direct send superseded after they were peeked
+        """
+        record = f"{LK_ROUTER}{VSN}/{DEV_EUI}/"
+        self.django_client.outbox.put("PATCH", record, record, {"app_key": "OLD"})
+        sent = []
+        def send(method, endpoint, data=None):
+            sent.append((method.value, endpoint, data))
+            response = Mock(status_code=200, headers={})
+            response.json.return_value = data
+            return response
+        peek = self.django_client.outbox.peek
+        def peek_then_send_newer():
+            rows = peek()
+            self.django_client.update_lk(DEV_EUI, {"app_key": "NEW"})
+            return rows
+
+        with patch.object(self.django_client, "send", side_effect=send), \
+            patch.object(self.django_client.outbox, "peek", side_effect=peek_then_send_newer):
+            self.assertEqual(self.django_client.drain_outbox(), 0)
+
+        self.assertEqual(sent, [("PATCH", record, {"app_key": "NEW"})])
+        self.assertEqual(len(self.django_client.outbox), 0)
+
+    def test_drain_outbox_orders_direct_send(self):
+        """
+        Test a direct send of a record waits for the drain sending its queued values, so the newer values go last
+        """
+        record = f"{LK_ROUTER}{VSN}/{DEV_EUI}/"
+        self.django_client.outbox.put("PATCH", record, record, {"app_key": "OLD"})
+        sent = []
+        drain_sending = threading.Event()
+        def send(method, endpoint, data=None):
+            if data == {"app_key": "OLD"}:
+                drain_sending.set()
+                time.sleep(0.1) #the direct send is started meanwhile
+            sent.append((method.value, endpoint, data))
+            response = Mock(status_code=200, headers={})
+            response.json.return_value = data
+            return response
+        def send_newer():
+            drain_sending.wait()
+            self.django_client.update_lk(DEV_EUI, {"app_key": "NEW"})
+        direct = threading.Thread(target=send_newer)
+
+        with patch.object(self.django_client, "send", side_effect=send):
+            direct.start()
+            self.django_client.drain_outbox()
+            direct.join()
+
+        self.assertEqual(sent, [("PATCH", record, {"app_key": "OLD"}), ("PATCH", record, {"app_key": "NEW"})])
+        self.assertEqual(len(self.django_client.outbox), 0)
+
+class TestRetry(unittest.TestCase):
+    def setUp(self):
+        self.args = Mock(
+            api_interface=API_INTERFACE,
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=2,
+            patch_retries=2,
+            post_retries=1,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    def response(self, status_code: int, headers: dict = None, body: dict = None) -> Mock:
+        """
+        Mock a server response
+        """
+        response = Mock(status_code=status_code, headers=headers or {}, ok=status_code < 400)
+        if status_code >= 400:
+            response.raise_for_status.side_effect = requests.exceptions.HTTPError(f"{status_code} Error")
+            response.json.side_effect = requests.exceptions.JSONDecodeError("no body", "", 0)
+        else:
+            response.json.return_value = body
+        return response
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_get_retried(self, mock_get, mock_sleep):
+        """
+        Test a GET is retried after a timeout and an unavailable server, waiting between attempts
+        """
+        mock_get.side_effect = [
+            requests.exceptions.ReadTimeout("read timed out"),
+            self.response(502),
+            self.response(200, body={"deveui": DEV_EUI})
+        ]
+
+        with self.assertLogs(level='WARNING'):
+            result = self.django_client.get_ld(DEV_EUI)
+
+        self.assertEqual(result['json_body'], {"deveui": DEV_EUI})
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+        for call in mock_sleep.call_args_list:
+            self.assertTrue(RETRY_BASE <= call.args[0] <= RETRY_CAP)
+
+    @patch("time.sleep")
+    @patch("requests.Session.patch")
+    def test_retries_exhausted(self, mock_patch, mock_sleep):
+        """
+        Test a connection error is raised once the method's retries are used up
+        """
+        mock_patch.side_effect = requests.exceptions.ConnectionError("network is unreachable")
+
+        with self.assertLogs(level='WARNING'):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.django_client.update_ld(DEV_EUI, {"battery_level": 10})
+
+        self.assertEqual(mock_patch.call_count, 3)
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_retry_after(self, mock_get, mock_sleep):
+        """
+        Test Retry-After is honored and a wait longer than retry_cap is not retried
+        """
+        mock_get.side_effect = [self.response(429, {"Retry-After": "0.02"}), self.response(200, body={})]
+        self.django_client.get_ld(DEV_EUI)
+        mock_sleep.assert_called_once_with(0.02)
+
+        mock_get.side_effect = [self.response(503, {"Retry-After": "120"})]
+        with self.assertLogs(level='ERROR'):
+            result = self.django_client.get_ld(DEV_EUI)
+        self.assertEqual(result['status_code'], 503)
+        mock_sleep.assert_called_once()
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_retry_within_deadline(self, mock_get, mock_sleep):
+        """
+        Test a call is not retried if waiting would pass the thread's deadline
+        """
+        mock_get.side_effect = requests.exceptions.ReadTimeout("read timed out")
+
+        with self.django_client.deadline(RETRY_BASE / 2):
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.django_client.get_ld(DEV_EUI)
+
+        mock_get.assert_called_once()
+        mock_sleep.assert_not_called()
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    def test_retry_budget(self, mock_get, mock_sleep):
+        """
+        Test retries stop once the retry budget is spent
+        """
+        self.django_client.retry_budget.tokens = 1
+        self.django_client.retry_budget.min_per_sec = 0
+        mock_get.side_effect = requests.exceptions.ReadTimeout("read timed out")
+
+        with self.assertLogs(level='WARNING') as log:
+            with self.assertRaises(requests.exceptions.ReadTimeout):
+                self.django_client.get_ld(DEV_EUI)
+
+        self.assertEqual(mock_get.call_count, 2)
+        self.assertEqual(self.django_client.retry_budget.exhausted, 1)
+        self.assertIn("retry budget spent", log.output[-1])
+
+    @patch("time.sleep")
+    @patch("requests.Session.post")
+    def test_post_retried_when_unsent(self, mock_post, mock_sleep):
+        """
+        Test a POST the server surely did not handle is retried
+        """
+        mock_post.side_effect = [
+            requests.exceptions.ConnectTimeout("connect timed out"),
+            self.response(201, body={"deveui": DEV_EUI})
+        ]
+
+        with self.assertLogs(level='WARNING'):
+            result = self.django_client.create_ld({"deveui": DEV_EUI})
+
+        self.assertEqual(result['json_body'], {"deveui": DEV_EUI})
+        self.assertEqual(mock_post.call_count, 2)
+
+    @patch("time.sleep")
+    @patch("requests.Session.get")
+    @patch("requests.Session.post")
+    def test_post_guarded(self, mock_post, mock_get, mock_sleep):
+        """
+        Test a POST that failed without a clear answer is retried only if its record does not exist
+        and answers with the record if the POST created it
+        """
+        mock_post.side_effect = [
+            requests.exceptions.ReadTimeout("read timed out"),
+            self.response(201, body={"deveui": DEV_EUI})
+        ]
+        mock_get.return_value = self.response(404)
+        with self.assertLogs(level='WARNING'):
+            result = self.django_client.create_ld({"deveui": DEV_EUI})
+        self.assertEqual(mock_post.call_count, 2)
+        mock_get.assert_called_once()
+        self.assertEqual(mock_get.call_args.args[0], f"{API_INTERFACE}/{LD_ROUTER}{DEV_EUI}/")
+        self.assertEqual(result['json_body'], {"deveui": DEV_EUI})
+
+        mock_post.reset_mock()
+        mock_get.reset_mock()
+        mock_post.side_effect = [requests.exceptions.ReadTimeout("read timed out")]
+        mock_get.return_value = self.response(200, body={"lorawan_connection": "W030-test-123456789"})
+        result = self.django_client.create_lk(DEV_EUI, {"lorawan_connection": "W030-test-123456789"})
+        mock_post.assert_called_once()
+        self.assertEqual(mock_get.call_args.args[0], f"{API_INTERFACE}/{LK_ROUTER}{VSN}/{DEV_EUI}/")
+        self.assertEqual(result['json_body'], {"lorawan_connection": "W030-test-123456789"})
+
+        mock_post.reset_mock()
+        mock_post.side_effect = [self.response(504)]
+        mock_get.return_value = self.response(200, body={"deveui": DEV_EUI})
+        result = self.django_client.create_ld({"deveui": DEV_EUI})
+        mock_post.assert_called_once()
+        self.assertEqual(result['json_body'], {"deveui": DEV_EUI})
+
+        mock_post.reset_mock()
+        mock_post.side_effect = [requests.exceptions.ReadTimeout("read timed out")]
+        mock_get.side_effect = requests.exceptions.ConnectionError("network is unreachable")
+        with self.assertRaises(requests.exceptions.ReadTimeout):
+            self.django_client.create_ld({"deveui": DEV_EUI})
+        mock_post.assert_called_once()
+
+    @patch("requests.Session.get")
+    def test_get_single_flight(self, mock_get):
+        """
+        Test concurrent sh_search() and get_sh() calls for a hardware that is not cached share one GET
+        """
+        release = threading.Event()
+        response = self.response(200, body={"id": 1, "hw_model": HW_MODEL})
+        def get(*args, **kwargs):
+            release.wait(5)
+            return response
+        mock_get.side_effect = get
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.django_client.sh_search(HW_MODEL))) for _ in range(2)]
+        threads.append(threading.Thread(target=lambda: results.append(self.django_client.get_sh(HW_MODEL)['json_body'])))
+
+        for thread in threads:
+            thread.start()
+        while self.django_client.flights.calls_shared < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        mock_get.assert_called_once()
+        self.assertEqual(sorted(results, key=str), [True, True, {"id": 1, "hw_model": HW_MODEL}])
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.args = Mock(
+            api_interface=API_INTERFACE,
+            lorawan_connection_router=LC_ROUTER,
+            lorawan_key_router=LK_ROUTER,
+            lorawan_device_router=LD_ROUTER,
+            sensor_hardware_router=SH_ROUTER,
+            vsn=VSN,
+            node_token=NODE_TOKEN,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=2,
+            breaker_reset=60,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST
+        )
+        self.django_client = DjangoClient(self.args)
+
+    @patch("time.monotonic")
+    @patch("requests.Session.get")
+    def test_call_api_breaker(self, mock_get, mock_monotonic):
+        """
+        Test calls fail fast once the breaker opens and a successful probe closes it
+        """
+        mock_monotonic.return_value = 100.0
+        mock_get.side_effect = requests.exceptions.ConnectionError("network is unreachable")
+        with self.assertLogs(level='WARNING') as log:
+            for _ in range(2):
+                with self.assertRaises(requests.exceptions.ConnectionError):
+                    self.django_client.get_ld(DEV_EUI)
+        self.assertIn("closed -> open", log.output[-1])
+
+        with self.assertRaises(CircuitOpen):
+            self.django_client.get_ld(DEV_EUI)
+        self.assertEqual(mock_get.call_count, 2)
+
+        mock_monotonic.return_value = 160.0
+        mock_get.side_effect = None
+        mock_get.return_value = Mock(status_code=200, headers={})
+        mock_get.return_value.json.return_value = {"deveui": DEV_EUI}
+        with self.assertLogs(level='WARNING') as log:
+            self.django_client.get_ld(DEV_EUI)
+        self.assertIn("open -> half_open", log.output[0])
+        self.assertIn("half_open -> closed", log.output[1])
+        stats = self.django_client.breaker.stats()
+        self.assertEqual(stats["state"], "closed")
+        self.assertEqual(stats["rejected"], 1)
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -1,6 +1,10 @@
 import unittest
 import json
 import copy
+import os
+import errno
+import time
+import tempfile
 from pytest import mark
 from app.manifest import Manifest
 from tools.manifest import ManifestTemplate
@@ -47,11 +51,16 @@ class TestlLoadManifest(unittest.TestCase):
 
 class TestSaveManifest(unittest.TestCase):
     def setUp(self):
-        self.filepath = MANIFEST_FILEPATH
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, "node-manifest-v2.json")
+        with open(self.filepath, 'w') as f:
+            json.dump({"key": "old value"}, f)
         self.manifest = Manifest(self.filepath)
 
-    @patch('app.manifest.json.dump')
-    def test_save_manifest_happy_path(self, mock_json_dump):
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_save_manifest_happy_path(self):
         """
         Test saving the manifest file successfully
         """
@@ -59,39 +68,255 @@ class TestSaveManifest(unittest.TestCase):
         expected_json_content = {"key": "value"}
         self.manifest.dict = expected_json_content
 
-        # Mocking
-        with patch("builtins.open", mock_open()) as mock_open_instance:
-            with patch("app.manifest.logging.error") as mock_logging_error:
-                
-                # Call the method under test
-                self.manifest.save_manifest()
+        with patch("app.manifest.logging.error") as mock_logging_error:
+
+            # Call the method under test
+            self.manifest.save_manifest()
 
-                # Assert
-                mock_json_dump.assert_called_once_with(self.manifest.dict, mock_open_instance(), indent=3)
-                mock_logging_error.assert_not_called()
+            # Assert
+            mock_logging_error.assert_not_called()
+        with open(self.filepath) as f:
+            self.assertEqual(json.load(f), expected_json_content)
+        self.assertEqual(os.listdir(self.tmpdir.name), ["node-manifest-v2.json"]) #temp file was renamed
+        self.assertFalse(self.manifest.dirty)
 
     @patch('app.manifest.json.dump')
     def test_save_manifest_exception_handling(self, mock_json_dump):
         """
-        Test the exception handling
+        Test the exception handling, a failed write leaves the old manifest
         """
         # Arrange
         expected_json_content = {"key": "value"}
         self.manifest.dict = expected_json_content
 
-        # Mocking
-        with patch("builtins.open", mock_open()) as mock_open_instance:
-            with patch("app.manifest.logging.error") as mock_logging_error:
-                
-                # Simulate an exception during the save process
-                mock_json_dump.side_effect = Exception("Simulated error")
+        with patch("app.manifest.logging.error") as mock_logging_error:
+
+            # Simulate an exception during the save process
+            mock_json_dump.side_effect = Exception("Simulated error")
+
+            # Act
+            self.manifest.save_manifest()
+
+            # Assert
+            mock_logging_error.assert_called_once_with("Manifest.save_manifest(): Simulated error")
+        with open(self.filepath) as f:
+            self.assertEqual(json.load(f), {"key": "old value"})
+        self.assertEqual(os.listdir(self.tmpdir.name), ["node-manifest-v2.json"]) #temp file was removed
+
+    def test_save_manifest_fsync(self):
+        """
+        Test the manifest file is fsynced when fsync is on
+        """
+        manifest = Manifest(self.filepath, fsync=True)
+
+        with patch("app.manifest.os.fsync") as mock_fsync:
+            manifest.save_manifest()
+
+        mock_fsync.assert_called_once()
+
+    def test_save_manifest_keeps_mode(self):
+        """
+        Test the saved manifest keeps the file's permissions
+        """
+        os.chmod(self.filepath, 0o644)
+        manifest = Manifest(self.filepath)
+
+        manifest.save_manifest()
+
+        self.assertEqual(os.stat(self.filepath).st_mode & 0o777, 0o644)
 
-                # Act
+    def test_save_manifest_single_file_mount(self):
+        """
+        Test the manifest is written in place when it can not be replaced (ex; k8s hostPath file mount)
+        """
+        self.manifest.dict = {"key": "value"}
+
+        with patch("app.manifest.os.replace", side_effect=OSError(errno.EBUSY, "Device or resource busy")):
+            with self.assertLogs(level='WARNING') as log:
                 self.manifest.save_manifest()
+                self.manifest.dict = {"key": "value2"}
+                self.manifest.save_manifest()
+
+        with open(self.filepath) as f:
+            self.assertEqual(json.load(f), {"key": "value2"})
+        self.assertEqual(os.listdir(self.tmpdir.name), ["node-manifest-v2.json"])
+        #the fallback is only logged once
+        self.assertEqual(len(log.output), 1)
+        self.assertIn("writing it in place", log.output[0])
+
+class TestScheduleSave(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, "node-manifest-v2.json")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_schedule_save_no_interval(self):
+        """
+        Test every schedule_save() writes the file when the flush interval is 0
+        """
+        manifest = Manifest(self.filepath)
+
+        with patch("app.manifest.Manifest.save_manifest") as mock_save_manifest:
+            manifest.schedule_save()
+            manifest.schedule_save()
+
+        self.assertEqual(mock_save_manifest.call_count, 2)
+
+    def test_schedule_save_coalesced(self):
+        """
+        Test saves inside the flush interval are written once when it ends
+        """
+        manifest = Manifest(self.filepath, flush_interval=0.2)
+
+        manifest.dict = {"key": 1}
+        manifest.schedule_save() #written right away
+        for i in range(2, 6):
+            manifest.dict = {"key": i}
+            manifest.schedule_save()
+
+        self.assertEqual(manifest.flushes, 1)
+        self.assertTrue(manifest.dirty)
+        time.sleep(0.5)
+        self.assertEqual(manifest.flushes, 2)
+        self.assertFalse(manifest.dirty)
+        with open(self.filepath) as f:
+            self.assertEqual(json.load(f), {"key": 5})
+
+    def test_close_flushes(self):
+        """
+        Test close() writes the unsaved changes and cancels the scheduled save
+        """
+        manifest = Manifest(self.filepath, flush_interval=60)
+        manifest.schedule_save()
+        manifest.dict = {"key": "value"}
+        manifest.schedule_save()
+
+        manifest.close()
+
+        self.assertEqual(manifest.flushes, 2)
+        self.assertIsNone(manifest.flush_timer)
+        with open(self.filepath) as f:
+            self.assertEqual(json.load(f), {"key": "value"})
+
+class TestReloadIfChanged(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, "node-manifest-v2.json")
+        self.write({"vsn": "W001"})
+        self.manifest = Manifest(self.filepath)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, content):
+        """
+        Write content to the manifest file like an external process would
+        """
+        with open(self.filepath, 'w') as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+
+    def test_reload_if_changed_no_change(self):
+        """
+        Test the file is not read again when it did not change
+        """
+        with patch("app.manifest.Manifest.load_manifest") as mock_load_manifest:
+            result = self.manifest.reload_if_changed()
+
+        self.assertFalse(result)
+        mock_load_manifest.assert_not_called()
+
+    def test_reload_if_changed_external_edit(self):
+        """
+        Test the manifest is reloaded when the file was edited by another process
+        """
+        self.write({"vsn": "W002", "lorawanconnections": []})
+
+        result = self.manifest.reload_if_changed()
+
+        self.assertTrue(result)
+        self.assertEqual(self.manifest.dict, {"vsn": "W002", "lorawanconnections": []})
+
+    def test_reload_if_changed_own_save(self):
+        """
+        Test the manifest's own save is not treated as a change
+        """
+        self.manifest.dict["vsn"] = "W003"
+        self.manifest.save_manifest()
+
+        self.assertFalse(self.manifest.reload_if_changed())
+
+    def test_reload_if_changed_partial_write(self):
+        """
+        Test the loaded manifest is kept when the file is mid write
+        """
+        self.write('{"vsn": "W0')
+
+        with patch("app.manifest.logging.error") as mock_logging_error:
+            result = self.manifest.reload_if_changed()
+
+        self.assertFalse(result)
+        self.assertEqual(self.manifest.dict, {"vsn": "W001"})
+        mock_logging_error.assert_called_once()
+
+    def test_reload_if_changed_keeps_pending(self):
+        """
+        Test changes that are not written to the file yet are applied to the reloaded manifest
+        """
+        self.manifest.flush_interval = 60
+        self.manifest.last_flush = time.monotonic()
+        self.manifest.update_manifest({
+            "connection_type": "OTAA",
+            "margin": 5,
+            "lorawandevice": {"deveui": "7d1f5420e81235c1", "name": "dev", "hardware": {"hw_model": "test"}}
+        })
+        self.write({"vsn": "W002"})
+
+        self.assertTrue(self.manifest.reload_if_changed())
+
+        self.assertEqual(self.manifest.dict["vsn"], "W002")
+        self.assertEqual(self.manifest.dict["lorawanconnections"][0]["margin"], 5)
+        self.assertTrue(self.manifest.dirty)
+        self.manifest.close()
+
+    def test_flush_keeps_external_edit(self):
+        """
+        Test a deferred flush keeps the edits another process made to the file since it was loaded
+        """
+        self.manifest.flush_interval = 60
+        self.manifest.last_flush = time.monotonic()
+        self.manifest.update_manifest({
+            "connection_type": "OTAA",
+            "margin": 5,
+            "lorawandevice": {"deveui": "7d1f5420e81235c1", "name": "dev", "hardware": {"hw_model": "test"}}
+        })
+        self.write({"vsn": "W002", "key": "external"})
+
+        self.manifest.close()
+
+        with open(self.filepath) as f:
+            saved = json.load(f)
+        self.assertEqual(saved["key"], "external")
+        self.assertEqual(saved["lorawanconnections"][0]["margin"], 5)
+        self.assertEqual(self.manifest.pending, {})
+
+    def test_flush_partial_write(self):
+        """
+        Test a flush does not overwrite a file that is mid write, it is tried again later
+        """
+        self.manifest.dict["vsn"] = "W003"
+        self.manifest.dirty = True
+        self.write('{"vsn": "W0')
 
-                # Assert
-                mock_json_dump.assert_called_once_with(self.manifest.dict, mock_open_instance(), indent=3)
-                mock_logging_error.assert_called_once_with("Manifest.save_manifest(): Simulated error")
+        with patch("app.manifest.logging.error"):
+            self.manifest.flush()
+
+        with open(self.filepath) as f:
+            self.assertEqual(f.read(), '{"vsn": "W0')
+        self.assertTrue(self.manifest.dirty)
+        self.assertIsNotNone(self.manifest.flush_timer)
+        self.manifest.flush_timer.cancel()
 
 class TestLcCheck(unittest.TestCase):
     def setUp(self):
@@ -204,6 +429,72 @@ class TestLdSearch(unittest.TestCase):
 
         self.assertFalse(self.manifest.ld_search(deveui))
 
+class TestLdIndex(unittest.TestCase):
+    def setUp(self):
+        self.filepath = MANIFEST_FILEPATH
+        self.manifest = Manifest(self.filepath)
+        self.manifest.dict = ManifestTemplate().sample
+
+    @staticmethod
+    def new_lc(deveui: str) -> dict:
+        """
+        Return a minimal lorawan connection for deveui
+        """
+        return {
+            "connection_type": "OTAA",
+            "lorawandevice": {"deveui": deveui, "name": "test", "hardware": {"hw_model": "test"}}
+        }
+
+    def test_ld_index_found(self):
+        """
+        Test ld_index() returns the position of the deveui's connection
+        """
+        lcs = self.manifest.dict["lorawanconnections"]
+
+        for i, lc in enumerate(lcs):
+            self.assertEqual(self.manifest.ld_index(lc["lorawandevice"]["deveui"]), i)
+        self.assertIsNone(self.manifest.ld_index("not_a_deveui"))
+
+    def test_ld_index_no_lorawan_connections(self):
+        """
+        Test ld_index() returns None when there is no lorawanconnections array
+        """
+        del self.manifest.dict["lorawanconnections"]
+
+        self.assertIsNone(self.manifest.ld_index("7d1f5420e81235c1"))
+
+    def test_ld_index_after_append(self):
+        """
+        Test the index is kept correct when update_manifest() appends a connection
+        """
+        with patch("app.manifest.Manifest.save_manifest"):
+            self.manifest.update_manifest(self.new_lc("12345678912345a3"))
+
+        self.assertEqual(self.manifest.ld_index("12345678912345a3"), len(self.manifest.dict["lorawanconnections"]) - 1)
+
+    def test_ld_index_after_dict_replaced(self):
+        """
+        Test the index is rebuilt when the manifest dict is replaced (ex; reload)
+        """
+        self.manifest.ld_index("7d1f5420e81235c1")
+
+        self.manifest.dict = {"lorawanconnections": [self.new_lc("12345678912345a3")]}
+
+        self.assertIsNone(self.manifest.ld_index("7d1f5420e81235c1"))
+        self.assertEqual(self.manifest.ld_index("12345678912345a3"), 0)
+
+    def test_ld_index_after_external_reorder(self):
+        """
+        Test the index is rebuilt when the connections were reordered outside of Manifest
+        """
+        lcs = self.manifest.dict["lorawanconnections"]
+        first = lcs[0]["lorawandevice"]["deveui"]
+        self.manifest.ld_index(first)
+
+        lcs.reverse()
+
+        self.assertEqual(self.manifest.ld_index(first), len(lcs) - 1)
+
 class TestIsValidJson(unittest.TestCase):
     def setUp(self):
         self.filepath = MANIFEST_FILEPATH
@@ -795,5 +1086,62 @@ class TestUpdateManifest(unittest.TestCase):
         #Assert lorawan connection was not inserted to dict
         self.assertTrue(len(self.manifest.dict["lorawanconnections"]) == 0)
 
+    @patch("app.manifest.Manifest.schedule_save")
+    def test_update_manifest_no_change(self, mock_schedule_save):
+        """
+        Test the manifest is not saved when the update does not change any value
+        """
+        # Arrange
+        existing = copy.deepcopy(self.manifest.dict["lorawanconnections"][0])
+
+        self.manifest.update_manifest(existing)
+
+        # Assert
+        mock_schedule_save.assert_not_called()
+        self.assertEqual(self.manifest.saves_skipped, 1)
+
+    @patch("app.manifest.Manifest.schedule_save")
+    def test_update_manifest_nested_change(self, mock_schedule_save):
+        """
+        Test the manifest is saved when only a nested value changed
+        """
+        # Arrange
+        new_data = {
+            "lorawandevice": {
+                "deveui": self.manifest.dict["lorawanconnections"][0]["lorawandevice"]["deveui"],
+                "battery_level": 1234
+            }
+        }
+
+        self.manifest.update_manifest(new_data)
+
+        # Assert
+        mock_schedule_save.assert_called_once()
+        self.assertEqual(self.manifest.saves_skipped, 0)
+        self.assertEqual(self.manifest.dict["lorawanconnections"][0]["lorawandevice"]["battery_level"], 1234)
+
+class TestUpdateDictRec(unittest.TestCase):
+    def setUp(self):
+        self.manifest = Manifest(MANIFEST_FILEPATH)
+
+    def test_update_dict_rec_changed(self):
+        """
+        Test update_dict_rec() returns true when a value changed or was added
+        """
+        current = {"a": 1, "b": {"c": 2}}
+
+        self.assertTrue(self.manifest.update_dict_rec(current, {"b": {"c": 3}}))
+        self.assertTrue(self.manifest.update_dict_rec(current, {"d": None}))
+        self.assertEqual(current, {"a": 1, "b": {"c": 3}, "d": None})
+
+    def test_update_dict_rec_unchanged(self):
+        """
+        Test update_dict_rec() returns false when every value is already stored
+        """
+        current = {"a": 1, "b": {"c": 2}}
+
+        self.assertFalse(self.manifest.update_dict_rec(current, {"a": 1, "b": {"c": 2}}))
+        self.assertEqual(current, {"a": 1, "b": {"c": 2}})
+
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -1,4 +1,6 @@
 import unittest
+import json
+import signal
 from pytest import mark
 from unittest.mock import Mock, patch, MagicMock
 from app.mqtt_client import *
@@ -191,6 +193,55 @@ class TestOnMessage(unittest.TestCase):
             self.assertIn("Signal Performance:", log.output[1])
 
 
+class TestRouteMessage(unittest.TestCase):
+
+    def setUp(self):
+        # Mock the MqttClient instance
+        mock_args = Mock()
+        self.mqtt_client = MqttClient(mock_args)
+        self.mqtt_client.handlers = {"up": Mock()}
+        #Mock the message
+        self.Message = Mock()
+        self.Message.payload = f'{MESSAGE}'.encode("utf-8")
+
+    def test_parse_topic(self):
+        """
+        Test parse_topic() splits a chirpstack event topic and rejects other topics
+        """
+        topic = MqttClient.parse_topic("application/17c82e96/device/0101010101010101/event/up")
+
+        self.assertEqual(topic, {"app": "17c82e96", "deveui": "0101010101010101", "event": "up"})
+        self.assertIsNone(MqttClient.parse_topic("application/17c82e96/device/0101010101010101/command/down"))
+        self.assertIsNone(MqttClient.parse_topic("gateway/0016c001f153a14c/event/up"))
+
+    def test_route_message_handler(self):
+        """
+        Test route_message() calls the handler of the message's event type
+        """
+        client = Mock()
+        userdata = Mock()
+        self.Message.topic = "application/17c82e96/device/0101010101010101/event/up"
+
+        self.mqtt_client.route_message(client, userdata, self.Message)
+
+        self.mqtt_client.handlers["up"].assert_called_once_with(client, userdata, self.Message)
+        self.assertEqual(self.mqtt_client.events, {"up": 1})
+
+    def test_route_message_dropped(self):
+        """
+        Test route_message() drops events without a handler before decoding the payload
+        """
+        self.Message.topic = "application/17c82e96/device/0101010101010101/event/log"
+        self.Message.payload = Mock()
+
+        self.mqtt_client.route_message(Mock(), Mock(), self.Message)
+        self.Message.topic = "not/a/chirpstack/topic"
+        self.mqtt_client.route_message(Mock(), Mock(), self.Message)
+
+        self.mqtt_client.handlers["up"].assert_not_called()
+        self.Message.payload.decode.assert_not_called()
+        self.assertEqual(self.mqtt_client.dropped, 2)
+
 class TestLogMessage(unittest.TestCase):
 
     def setUp(self):
@@ -294,6 +345,28 @@ class TestMqttClientRun(unittest.TestCase):
         # Assert that the loop_forever method was called
         mock_loop_forever.assert_called_once()
 
+    @patch('app.mqtt_client.mqtt.Client')
+    def test_run_sigterm(self, mock_mqtt_client):
+        """
+        Test SIGTERM during run() disconnects from the broker so run() returns, and the handler is removed after
+        """
+        mock_args = Mock(mqtt_server_ip='mock_ip', mqtt_server_port=1883, mqtt_subscribe_topic='mock_topic', vsn='mock_vsn')
+        mqtt_client = MqttClient(mock_args)
+        previous = signal.getsignal(signal.SIGTERM)
+        handlers = []
+        def loop_forever():
+            handlers.append(signal.getsignal(signal.SIGTERM))
+            handlers[0](signal.SIGTERM, None)
+        mock_mqtt_client.return_value.loop_forever.side_effect = loop_forever
+
+        with self.assertLogs(level='INFO') as log:
+            mqtt_client.run()
+
+        self.assertEqual(handlers, [mqtt_client.stop])
+        mock_mqtt_client.return_value.disconnect.assert_called_once()
+        self.assertIn("stopping on signal", log.output[-1])
+        self.assertEqual(signal.getsignal(signal.SIGTERM), previous)
+
 class TestGetDevice(unittest.TestCase):
 
     def test_get_device_valid_input(self):
@@ -342,6 +415,40 @@ class TestGetDevice(unittest.TestCase):
         with self.assertRaises(KeyError):
             Get_device(message_dict)
 
+class TestUplink(unittest.TestCase):
+
+    def test_uplink_from_message(self):
+        """
+        Test Uplink.from_message() keeps only the fields the tracker uses
+        """
+        # Call the from_message method with the sample message
+        uplink = Uplink.from_message(json.loads(MESSAGE), join=True)
+
+        # Assert that the record is as expected
+        self.assertEqual(
+            uplink,
+            Uplink(
+                deveui="0101010101010101",
+                device_name="Test device",
+                device_profile_id="14855bf7-d10d-4aee-b618-ebfcb64dc7ad",
+                dev_addr="00189440",
+                time="2022-07-18T09:34:15.775023242+00:00",
+                join=True
+            )
+        )
+        self.assertFalse(hasattr(uplink, "__dict__"))
+        with self.assertRaises(AttributeError):
+            uplink.deveui = "0202020202020202"
+
+    def test_uplink_from_message_missing_device_info(self):
+        """
+        Test Uplink.from_message() raises like Get_device() when deviceInfo is missing or incomplete
+        """
+        with self.assertRaises(TypeError):
+            Uplink.from_message({'test':{}})
+        with self.assertRaises(KeyError):
+            Uplink.from_message({'deviceInfo': {}})
+
 class TestGetSignalPerformanceValues(unittest.TestCase):
     def test_get_signal_performance_values_valid_input(self):
         """
@@ -0,0 +1,91 @@
+import unittest
+import os
+import tempfile
+from app.django_client import Outbox
+
+class TestOutbox(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, "outbox.sqlite")
+        self.outbox = Outbox(self.filepath)
+
+    def tearDown(self):
+        self.outbox.close()
+        self.tmpdir.cleanup()
+
+    def test_put_merges_record(self):
+        """
+        Test mutations of the same record and method are merged into one row, newer fields win
+        """
+        self.outbox.put("PATCH", "lorawandevices/123/", "lorawandevices/123/", {"name": "a", "battery_level": 10})
+        self.outbox.put("PATCH", "lorawandevices/123/", "lorawandevices/123/", {"battery_level": 20})
+
+        rows = self.outbox.peek()
+
+        self.assertEqual(len(self.outbox), 1)
+        self.assertEqual(rows[0][2:], ("PATCH", "lorawandevices/123/", {"name": "a", "battery_level": 20}))
+        self.assertEqual(self.outbox.queued, 2)
+
+    def test_supersede(self):
+        """
+        Test fields sent directly are removed from the record's queued mutations and a sent POST removes the queued POST
+        """
+        self.outbox.put("PATCH", "lorawankeys/W030/1/", "lorawankeys/W030/1/", {"network_Key": "K1", "dev_address": "a"})
+        self.outbox.put("PATCH", "lorawankeys/W030/2/", "lorawankeys/W030/2/", {"network_Key": "K1"})
+        self.outbox.put("POST", "lorawandevices/3/", "lorawandevices/", {"deveui": "3", "name": "a"})
+        seq, version = self.outbox.peek()[0][:2]
+
+        self.assertEqual(self.outbox.supersede("PATCH", "lorawankeys/W030/1/", {"network_Key": "K2"}), 1)
+        self.assertEqual(self.outbox.supersede("PATCH", "lorawankeys/W030/1/", {"app_key": "K2"}), 0)
+        self.assertEqual(self.outbox.supersede("POST", "lorawandevices/3/", {"deveui": "3"}), 1)
+
+        rows = self.outbox.peek()
+        self.assertEqual([row[2:] for row in rows], [
+            ("PATCH", "lorawankeys/W030/1/", {"dev_address": "a"}),
+            ("PATCH", "lorawankeys/W030/2/", {"network_Key": "K1"})
+        ])
+        self.assertFalse(self.outbox.remove(seq, version)) #changed since it was peeked
+        self.assertEqual(self.outbox.stats()["superseded"], 2)
+
+    def test_peek_order(self):
+        """
+        Test a merged row keeps its place so a create stays ahead of later records
+        """
+        self.outbox.put("POST", "lorawandevices/1/", "lorawandevices/", {"deveui": "1"})
+        self.outbox.put("POST", "lorawandevices/2/", "lorawandevices/", {"deveui": "2"})
+        self.outbox.put("POST", "lorawandevices/1/", "lorawandevices/", {"name": "a"})
+
+        rows = self.outbox.peek()
+
+        self.assertEqual([row[4]["deveui"] for row in rows], ["1", "2"])
+
+    def test_remove_version(self):
+        """
+        Test a row is only removed if no fields were merged into it since it was read
+        """
+        self.outbox.put("PATCH", "lorawandevices/123/", "lorawandevices/123/", {"battery_level": 10})
+        seq, version, *_ = self.outbox.peek()[0]
+        self.outbox.put("PATCH", "lorawandevices/123/", "lorawandevices/123/", {"battery_level": 20})
+
+        self.assertFalse(self.outbox.remove(seq, version))
+        seq, version, *_ = self.outbox.peek()[0]
+        self.assertTrue(self.outbox.remove(seq, version))
+        self.assertEqual(len(self.outbox), 0)
+        self.assertEqual(self.outbox.stats()["drained"], 1)
+
+    def test_survives_restart(self):
+        """
+        Test queued mutations are still there after the database is reopened
+        """
+        self.outbox.put("PATCH", "lorawandevices/123/", "lorawandevices/123/", {"battery_level": 10})
+        self.outbox.close()
+
+        self.outbox = Outbox(self.filepath)
+
+        self.assertEqual(self.outbox.peek()[0][4], {"battery_level": 10})
+        journal_mode = self.outbox.conn.execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(journal_mode, "wal")
+
+if __name__ == "__main__":
+    unittest.main()
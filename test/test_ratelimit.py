@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import patch
+from app.django_client.ratelimit import TokenBucket
+
+class TestTokenBucket(unittest.TestCase):
+    @patch("time.monotonic")
+    def test_burst_and_refill(self, mock_monotonic):
+        """
+        Test burst calls are granted at once and tokens refill at rate
+        """
+        mock_monotonic.return_value = 100.0
+        bucket = TokenBucket(rate=2, burst=3)
+        for _ in range(3):
+            self.assertTrue(bucket.acquire(0))
+        self.assertFalse(bucket.acquire(0))
+        mock_monotonic.return_value = 100.5
+        self.assertTrue(bucket.acquire(0))
+        self.assertFalse(bucket.acquire(0))
+        mock_monotonic.return_value = 110.0
+        for _ in range(3):
+            self.assertTrue(bucket.acquire(0))
+        self.assertFalse(bucket.acquire(0))
+        self.assertEqual(bucket.stats(), {"granted": 7, "throttled": 0, "denied": 3})
+
+    @patch("time.sleep")
+    @patch("time.monotonic")
+    def test_wait(self, mock_monotonic, mock_sleep):
+        """
+        Test acquire() waits for the next token when it comes within wait seconds
+        """
+        mock_monotonic.return_value = 100.0
+        mock_sleep.side_effect = lambda seconds: setattr(mock_monotonic, "return_value", mock_monotonic.return_value + seconds)
+        bucket = TokenBucket(rate=4, burst=1)
+        self.assertTrue(bucket.acquire())
+        self.assertFalse(bucket.acquire(0.1))
+        self.assertTrue(bucket.acquire(0.5))
+        mock_sleep.assert_called_once_with(0.25)
+        self.assertEqual(bucket.stats(), {"granted": 2, "throttled": 1, "denied": 1})
+
+    def test_unlimited(self):
+        """
+        Test a rate of 0 does not limit calls
+        """
+        bucket = TokenBucket(rate=0, burst=1)
+        for _ in range(100):
+            self.assertTrue(bucket.acquire(0))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+import time
+from app.cache import RecentSet
+
+class TestRecentSet(unittest.TestCase):
+
+    def test_seen(self):
+        """
+        Test a key is only seen after it was added and hits/misses are counted
+        """
+        recent = RecentSet(4)
+
+        self.assertFalse(recent.seen("a"))
+        self.assertTrue(recent.seen("a"))
+        self.assertFalse(recent.seen("b"))
+        self.assertEqual(recent.hits, 1)
+        self.assertEqual(recent.misses, 2)
+
+    def test_ring_full(self):
+        """
+        Test the oldest key is forgotten when the ring is full
+        """
+        recent = RecentSet(2)
+        recent.seen("a")
+        recent.seen("b")
+        recent.seen("c")
+
+        self.assertEqual(len(recent), 2)
+        self.assertFalse(recent.seen("a"))
+        self.assertTrue(recent.seen("c"))
+
+    def test_ttl(self):
+        """
+        Test a key is forgotten after the ttl
+        """
+        recent = RecentSet(4, ttl=0.05)
+        recent.seen("a")
+        time.sleep(0.1)
+
+        self.assertFalse(recent.seen("a"))
+        self.assertTrue(recent.seen("a"))
+        self.assertLessEqual(len(recent), 4)
+
+    def test_disabled(self):
+        """
+        Test nothing is remembered when maxsize is 0
+        """
+        recent = RecentSet(0)
+        recent.seen("a")
+
+        self.assertFalse(recent.seen("a"))
+        self.assertEqual(len(recent), 0)
+
+if __name__ == "__main__":
+    unittest.main()
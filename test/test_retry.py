@@ -0,0 +1,70 @@
+import unittest
+import time
+from email.utils import formatdate
+from unittest.mock import patch
+from app.django_client.retry import decorrelated_jitter, parse_retry_after, RetryBudget
+
+class TestDecorrelatedJitter(unittest.TestCase):
+    def test_bounds(self):
+        """
+        Test the backoff stays between base and cap and grows from the previous backoff
+        """
+        backoff = 0.0
+        for _ in range(100):
+            backoff = decorrelated_jitter(backoff, 0.5, 10)
+            self.assertTrue(0.5 <= backoff <= 10)
+        with patch("random.uniform", side_effect=lambda a, b: b):
+            self.assertEqual(decorrelated_jitter(0.0, 0.5, 10), 0.5)
+            self.assertEqual(decorrelated_jitter(2, 0.5, 10), 6)
+            self.assertEqual(decorrelated_jitter(6, 0.5, 10), 10)
+
+class TestParseRetryAfter(unittest.TestCase):
+    def test_parse(self):
+        """
+        Test Retry-After given in seconds, as an HTTP date, missing or invalid
+        """
+        self.assertEqual(parse_retry_after("3"), 3.0)
+        self.assertAlmostEqual(parse_retry_after(formatdate(time.time() + 30, usegmt=True)), 30, delta=2)
+        self.assertEqual(parse_retry_after(formatdate(time.time() - 30, usegmt=True)), 0.0)
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after("soon"))
+
+class TestRetryBudget(unittest.TestCase):
+    def test_withdraw(self):
+        """
+        Test retries are limited to the saved up tokens and calls deposit a ratio of a retry
+        """
+        budget = RetryBudget(ratio=0.5, min_per_sec=0, max_tokens=2)
+        self.assertTrue(budget.withdraw())
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertFalse(budget.withdraw())
+        budget.deposit()
+        self.assertTrue(budget.withdraw())
+        self.assertEqual(budget.retries, 3)
+        self.assertEqual(budget.exhausted, 2)
+
+    def test_max_tokens(self):
+        """
+        Test deposits do not save up more than max_tokens
+        """
+        budget = RetryBudget(ratio=1, min_per_sec=0, max_tokens=2)
+        for _ in range(10):
+            budget.deposit()
+        self.assertEqual(budget.tokens, 2)
+
+    @patch("time.monotonic")
+    def test_min_per_sec(self, mock_monotonic):
+        """
+        Test the budget refills over time without calls
+        """
+        mock_monotonic.return_value = 100.0
+        budget = RetryBudget(ratio=0, min_per_sec=1, max_tokens=1)
+        self.assertTrue(budget.withdraw())
+        self.assertFalse(budget.withdraw())
+        mock_monotonic.return_value = 101.0
+        self.assertTrue(budget.withdraw())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import threading
+import time
+from app.cache import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    def setUp(self):
+        self.flights = SingleFlight()
+
+    def test_do(self):
+        """
+        Test do() returns the call's result and calls made one after another are not shared
+        """
+        self.assertEqual(self.flights.do("a", lambda x: x * 2, 2), 4)
+        self.assertEqual(self.flights.do("a", lambda x: x * 3, 2), 6)
+        self.assertEqual(self.flights.calls_made, 2)
+        self.assertEqual(self.flights.calls_shared, 0)
+        self.assertEqual(len(self.flights), 0)
+
+    def test_concurrent(self):
+        """
+        Test concurrent calls for the same key wait on the one in flight and calls for other keys do not
+        """
+        release = threading.Event()
+        calls = []
+        def fn(key):
+            calls.append(key)
+            release.wait(5)
+            return key.upper()
+
+        results = []
+        threads = [threading.Thread(target=lambda k=k: results.append(self.flights.do(k, fn, k))) for k in ["a", "a", "a", "b"]]
+        for thread in threads:
+            thread.start()
+        while self.flights.calls_made + self.flights.calls_shared < 4:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(calls), ["a", "b"])
+        self.assertEqual(sorted(results), ["A", "A", "A", "B"])
+        self.assertEqual(self.flights.calls_shared, 2)
+
+    def test_exception_shared(self):
+        """
+        Test the exception of the call in flight is raised to the calls waiting on it
+        """
+        started = threading.Event()
+        release = threading.Event()
+        def fn():
+            started.set()
+            release.wait(5)
+            raise ValueError("failed")
+
+        errors = []
+        def call():
+            try:
+                self.flights.do("a", fn)
+            except ValueError as e:
+                errors.append(e)
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(5)
+        waiter = threading.Thread(target=call)
+        waiter.start()
+        while self.flights.calls_shared < 1:
+            time.sleep(0.001)
+        release.set()
+        leader.join()
+        waiter.join()
+
+        self.assertEqual(len(errors), 2)
+        self.assertIs(errors[0], errors[1])
+        self.assertEqual(len(self.flights), 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from app.tracker.snapshot import Snapshots
+
+class TestDiff(unittest.TestCase):
+    def setUp(self):
+        self.snapshots = Snapshots()
+        self.data = {"name": "mock_device", "battery_level": 90}
+
+    def test_diff_no_snapshot(self):
+        """
+        Test diff() returns all fields when the record was never synced
+        """
+        result = self.snapshots.diff("ld", "mock_dev_eui", self.data)
+
+        self.assertEqual(result, self.data)
+        self.assertEqual(self.snapshots.patches_sent, 1)
+
+    def test_diff_changed_fields(self):
+        """
+        Test diff() only returns the fields that changed
+        """
+        self.snapshots.update("ld", "mock_dev_eui", self.data)
+
+        result = self.snapshots.diff("ld", "mock_dev_eui", {"name": "mock_device", "battery_level": 80})
+
+        self.assertEqual(result, {"battery_level": 80})
+
+    def test_diff_no_change(self):
+        """
+        Test diff() returns an empty dict and counts the avoided PATCH when nothing changed
+        """
+        self.snapshots.update("ld", "mock_dev_eui", self.data)
+
+        result = self.snapshots.diff("ld", "mock_dev_eui", dict(self.data))
+
+        self.assertEqual(result, {})
+        self.assertEqual(self.snapshots.patches_avoided, 1)
+        self.assertEqual(self.snapshots.patches_sent, 0)
+
+    def test_diff_record_types_independent(self):
+        """
+        Test records of different types for the same deveui are kept apart
+        """
+        self.snapshots.update("ld", "mock_dev_eui", self.data)
+
+        result = self.snapshots.diff("lc", "mock_dev_eui", self.data)
+
+        self.assertEqual(result, self.data)
+
+class TestGet(unittest.TestCase):
+
+    def test_get(self):
+        """
+        Test get() returns a field's last synced value and None for fields that were not synced
+        """
+        snapshots = Snapshots()
+        snapshots.update("ld", "mock_dev_eui", {"battery_level": 90})
+
+        self.assertEqual(snapshots.get("ld", "mock_dev_eui", "battery_level"), 90)
+        self.assertIsNone(snapshots.get("ld", "mock_dev_eui", "name"))
+        self.assertIsNone(snapshots.get("lc", "mock_dev_eui", "margin"))
+
+class TestInvalidate(unittest.TestCase):
+
+    def test_invalidate(self):
+        """
+        Test invalidate() makes the next diff return the full record
+        """
+        snapshots = Snapshots()
+        data = {"name": "mock_device", "battery_level": 90}
+        snapshots.update("ld", "mock_dev_eui", data)
+
+        snapshots.invalidate("ld", "mock_dev_eui")
+
+        self.assertEqual(snapshots.diff("ld", "mock_dev_eui", data), data)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,14 +1,20 @@
 import unittest
 import requests
+import time
+import threading
 import copy
+import json
+import dataclasses
 from pytest import mark
 from unittest.mock import Mock, patch, MagicMock
 from chirpstack_api_wrapper import *
-from app.django_client import DjangoClient, HttpMethod
+from app.django_client import DjangoClient, HttpMethod, DeadlineExceeded
 from app.tracker import Tracker
 from app.tracker.parse import *
 from app.tracker.convert_date import *
 from app.manifest import Manifest
+from app.cache import RecentSet
+from app.mqtt_client import Uplink
 from tools.manifest import ManifestTemplate
 from tools.chirpstack import MessageTemplate, Mock_ChirpstackClient_Methods
 
@@ -23,6 +29,49 @@ CHIRPSTACK_API_INTERFACE = "wes-chirpstack-server:8080"
 CHIRPSTACK_ACT_EMAIL = "test"
 CHIRPSTACK_ACT_PASSWORD = "test"
 MANIFEST_FILEPATH = '/etc/waggle/node-manifest-v2.json'
+WORKERS = 0 #sync in the caller's thread
+QUEUE_SIZE = 0
+COALESCE_WINDOW = 0 #sync every uplink
+EXISTS_TTL = 3600
+NOT_EXISTS_TTL = 30
+POOL_SIZE = 4
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+MESSAGE_DEADLINE = 60
+RETRY_DELAY = 30
+MANIFEST_FLUSH_INTERVAL = 0 #write on every update
+MANIFEST_FSYNC = False
+PROFILE_CACHE_SIZE = 256
+PROFILE_TTL = 600
+PROFILE_REFRESH = False
+KEY_SYNC_INTERVAL = 0 #sync keys on every uplink
+LAST_SEEN_FROM_PAYLOAD = False
+DEDUP_SIZE = 0 #every test message reuses the sample's deduplicationId
+DEDUP_TTL = 600
+DEBUG_SAMPLE = 1 #log every message
+OUTBOX = None #mutations are not kept
+OUTBOX_INTERVAL = 30
+GET_RETRIES = 0
+PATCH_RETRIES = 0
+POST_RETRIES = 0
+RETRY_BASE = 0.01
+RETRY_CAP = 0.05
+RETRY_BUDGET = 0.1
+BREAKER_THRESHOLD = 5
+BREAKER_RESET = 30
+READ_RATE = 0 #not limited
+READ_BURST = 10
+WRITE_RATE = 0 #not limited
+WRITE_BURST = 5
+STATS_INTERVAL = 0 #only on shutdown
+UPLINK = Uplink(
+    deveui="0101010101010101",
+    device_name="Test device",
+    device_profile_id="14855bf7-d10d-4aee-b618-ebfcb64dc7ad",
+    dev_addr="00189440",
+    time="2022-07-18T09:34:15.775023242+00:00",
+    join=False
+)
 
 class TestUpdateLd(unittest.TestCase):
 
@@ -38,14 +87,50 @@ class TestUpdateLd(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient.get_device() return value
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
     def test_update_ld_happy_path(self, mock_insecure_channel, mock_device_service_stub, mock_django_patch):
@@ -82,6 +167,98 @@ class TestUpdateLd(unittest.TestCase):
         # Assertions
         mock_django_patch.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{mock_dev_eui}/", headers=self.tracker.d_client.auth_header, json=data)
 
+    @patch("requests.Session.patch")
+    @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
+    @patch('chirpstack_api_wrapper.grpc.insecure_channel')
+    def test_update_ld_no_change(self, mock_insecure_channel, mock_device_service_stub, mock_django_patch):
+        """
+        Skip the PATCH when the lorawan device did not change since the last sync
+        """
+        # Mock the DeviceServiceStub
+        mock_device_service_stub.return_value.Get.return_value = self.mock_chirp_methods.get_device_ret_val
+        chirpstack_client = ChirpstackClient(self.args.chirpstack_account_email,self.args.chirpstack_account_password,self.args.chirpstack_api_interface)
+        mock_dev_eui = "mock_dev_eui"
+        device_resp = chirpstack_client.get_device(mock_dev_eui)
+
+        # Call the action in testing twice with the same data
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+
+        # Assertions
+        mock_django_patch.assert_called_once()
+        self.assertEqual(self.tracker.snapshots.patches_sent, 1)
+        self.assertEqual(self.tracker.snapshots.patches_avoided, 1)
+
+    @patch("requests.Session.patch")
+    @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
+    @patch('chirpstack_api_wrapper.grpc.insecure_channel')
+    def test_update_ld_changed_fields(self, mock_insecure_channel, mock_device_service_stub, mock_django_patch):
+        """
+        Only PATCH the lorawan device fields that changed since the last sync
+        """
+        # Mock the DeviceServiceStub
+        mock_device_service_stub.return_value.Get.return_value = self.mock_chirp_methods.get_device_ret_val
+        chirpstack_client = ChirpstackClient(self.args.chirpstack_account_email,self.args.chirpstack_account_password,self.args.chirpstack_api_interface)
+        mock_dev_eui = "mock_dev_eui"
+        device_resp = chirpstack_client.get_device(mock_dev_eui)
+
+        # Call the action in testing, the second time with a new battery level
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+        device_resp.device_status.battery_level = 50
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+
+        # Assertions
+        self.assertEqual(mock_django_patch.call_count, 2)
+        mock_django_patch.assert_called_with(f"{API_INTERFACE}/lorawandevices/{mock_dev_eui}/", headers=self.tracker.d_client.auth_header, json={"battery_level": 50})
+
+    @patch("requests.Session.patch")
+    @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
+    @patch('chirpstack_api_wrapper.grpc.insecure_channel')
+    def test_update_ld_failed_patch(self, mock_insecure_channel, mock_device_service_stub, mock_django_patch):
+        """
+        Send the full lorawan device again after a PATCH failed
+        """
+        # Mock the DeviceServiceStub
+        mock_device_service_stub.return_value.Get.return_value = self.mock_chirp_methods.get_device_ret_val
+        chirpstack_client = ChirpstackClient(self.args.chirpstack_account_email,self.args.chirpstack_account_password,self.args.chirpstack_api_interface)
+        mock_dev_eui = "mock_dev_eui"
+        device_resp = chirpstack_client.get_device(mock_dev_eui)
+        data = {
+            "name": replace_spaces(self.mock_chirp_methods.get_device_ret_val.device.name),
+            "battery_level": self.mock_chirp_methods.get_device_ret_val.device_status.battery_level
+        }
+        # Mock a failed PATCH
+        mock_response = MagicMock()
+        mock_response.headers = {}
+        mock_response.status_code = 500
+        mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP Error")
+        mock_django_patch.return_value = mock_response
+
+        # Call the action in testing twice with the same data
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+        self.tracker.update_ld(mock_dev_eui, device_resp)
+
+        # Assertions
+        self.assertEqual(mock_django_patch.call_count, 2)
+        mock_django_patch.assert_called_with(f"{API_INTERFACE}/lorawandevices/{mock_dev_eui}/", headers=self.tracker.d_client.auth_header, json=data)
+
+    @patch("requests.Session.patch")
+    def test_update_ld_from_payload(self, mock_django_patch):
+        """
+        Rename the lorawan device from the uplink's device name when get_device is skipped
+        """
+        self.tracker.args.last_seen_from_payload = True
+        mock_dev_eui = "mock_dev_eui"
+        self.tracker.snapshots.update("ld", mock_dev_eui, {"name": "Test_device", "battery_level": 90})
+        self.tracker.snapshots.update("lc", mock_dev_eui, {"margin": 7})
+        uplink = dataclasses.replace(UPLINK, deveui=mock_dev_eui, device_name="Renamed  device")
+
+        # Call the action in testing
+        self.tracker.update_ld(mock_dev_eui, self.tracker.device_from_payload(uplink))
+
+        # Assertions
+        mock_django_patch.assert_called_once_with(f"{API_INTERFACE}/lorawandevices/{mock_dev_eui}/", headers=self.tracker.d_client.auth_header, json={"name": "Renamed_device"})
+
 class TestCreateLd(unittest.TestCase):
 
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -96,14 +273,50 @@ class TestCreateLd(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient.get_device() return value
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
     def test_create_ld_happy_path(self, mock_insecure_channel, mock_device_service_stub, mock_django_post):
@@ -159,14 +372,50 @@ class TestUpdateLc(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient method return values
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -237,14 +486,50 @@ class TestCreateLc(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient method return values
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -304,7 +589,7 @@ class TestCreateLc(unittest.TestCase):
         mock_django_post.assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/", headers=self.tracker.d_client.auth_header, json=data)
         self.assertEqual(lc_uid, VSN + "-" + replace_spaces(device_resp.device.name) + "-" + mock_dev_eui)
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -316,9 +601,9 @@ class TestCreateLc(unittest.TestCase):
         mock_response = Mock()
         mock_response.headers = {
                 'Content-Type': 'application/json', 
-                'status-code': 404,
                 'Custom-Header': 'Mocked-Value',
         }
+        mock_response.status_code = 404
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP Error")
         mock_django_post.return_value = mock_response
 
@@ -392,14 +677,50 @@ class TestUpdateLk(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient method return values
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -452,7 +773,7 @@ class TestUpdateLk(unittest.TestCase):
         # Assertions
         mock_django_patch.assert_called_once_with(f"{API_INTERFACE}/lorawankeys/{VSN}/{mock_dev_eui}/", headers=self.tracker.d_client.auth_header, json=data)
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -521,14 +842,50 @@ class TestCreateLk(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient method return values
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -583,7 +940,7 @@ class TestCreateLk(unittest.TestCase):
         # Assertions
         mock_django_post.assert_called_once_with(f"{API_INTERFACE}/lorawankeys/", headers=self.tracker.d_client.auth_header, json=data)
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
@@ -654,14 +1011,50 @@ class TestCreateSh(unittest.TestCase):
             node_token=NODE_TOKEN,
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
-            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD
+            chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up tracker
         self.tracker = Tracker(self.args)
         #mock ChirpstackClient method return values
         self.mock_chirp_methods = Mock_ChirpstackClient_Methods('mock_dev_eui')
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
     def test_create_sh_happy_path(self, mock_insecure_channel, mock_device_profile_service_stub, mock_django_post):
@@ -672,7 +1065,6 @@ class TestCreateSh(unittest.TestCase):
         #mock response of requests.post method
         headers = {
             'Content-Type': 'application/json', 
-            'status-code': 201,
             'Custom-Header': 'Mocked-Value',
         }
         response_data = {
@@ -684,6 +1076,7 @@ class TestCreateSh(unittest.TestCase):
             }
         mock_response = Mock()
         mock_response.headers = headers
+        mock_response.status_code = 201
         mock_response.json.return_value = response_data
         mock_django_post.return_value = mock_response
 
@@ -720,7 +1113,7 @@ class TestCreateSh(unittest.TestCase):
         mock_django_post.assert_called_once_with(f"{API_INTERFACE}/sensorhardwares/", headers=self.tracker.d_client.auth_header, json=data)
         self.assertEqual(sh_uid, response_data["id"])
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.grpc.insecure_channel')
     def test_create_sh_no_response(self, mock_insecure_channel, mock_device_profile_service_stub, mock_django_post):
@@ -731,9 +1124,9 @@ class TestCreateSh(unittest.TestCase):
         mock_response = Mock()
         mock_response.headers = {
                 'Content-Type': 'application/json', 
-                'status-code': 400,
                 'Custom-Header': 'Mocked-Value',
         }
+        mock_response.status_code = 400
         mock_response.raise_for_status.side_effect = requests.exceptions.HTTPError("HTTP Error")
         mock_django_post.return_value = mock_response
 
@@ -790,7 +1183,42 @@ class TestUpdateManifest(unittest.TestCase):
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
             chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
-            manifest=MANIFEST_FILEPATH
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up manifest
         self.manifest = Manifest(self.args.manifest)
@@ -954,13 +1382,49 @@ class TestOnMessage(unittest.TestCase):
             chirpstack_api_interface=CHIRPSTACK_API_INTERFACE,
             chirpstack_account_email=CHIRPSTACK_ACT_EMAIL,
             chirpstack_account_password=CHIRPSTACK_ACT_PASSWORD,
-            manifest=MANIFEST_FILEPATH
+            manifest=MANIFEST_FILEPATH,
+            workers=WORKERS,
+            queue_size=QUEUE_SIZE,
+            coalesce_window=COALESCE_WINDOW,
+            exists_ttl=EXISTS_TTL,
+            not_exists_ttl=NOT_EXISTS_TTL,
+            pool_size=POOL_SIZE,
+            connect_timeout=CONNECT_TIMEOUT,
+            read_timeout=READ_TIMEOUT,
+            message_deadline=MESSAGE_DEADLINE,
+            retry_delay=RETRY_DELAY,
+            manifest_flush_interval=MANIFEST_FLUSH_INTERVAL,
+            manifest_fsync=MANIFEST_FSYNC,
+            profile_cache_size=PROFILE_CACHE_SIZE,
+            profile_ttl=PROFILE_TTL,
+            profile_refresh=PROFILE_REFRESH,
+            key_sync_interval=KEY_SYNC_INTERVAL,
+            last_seen_from_payload=LAST_SEEN_FROM_PAYLOAD,
+            dedup_size=DEDUP_SIZE,
+            dedup_ttl=DEDUP_TTL,
+            debug_sample=DEBUG_SAMPLE,
+            outbox=OUTBOX,
+            outbox_interval=OUTBOX_INTERVAL,
+            get_retries=GET_RETRIES,
+            patch_retries=PATCH_RETRIES,
+            post_retries=POST_RETRIES,
+            retry_base=RETRY_BASE,
+            retry_cap=RETRY_CAP,
+            retry_budget=RETRY_BUDGET,
+            breaker_threshold=BREAKER_THRESHOLD,
+            breaker_reset=BREAKER_RESET,
+            read_rate=READ_RATE,
+            read_burst=READ_BURST,
+            write_rate=WRITE_RATE,
+            write_burst=WRITE_BURST,
+            stats_interval=STATS_INTERVAL
         )
         #set up manifest
         self.manifest = Manifest(self.args.manifest)
         self.manifest.dict = ManifestTemplate().sample
         #set up tracker
         self.tracker = Tracker(self.args)
+        self.tracker.manifest = self.manifest
         #get Chripstack message sample
         self.MESSAGE = MessageTemplate().sample
         #mock ChirpstackClient method return values
@@ -989,9 +1453,9 @@ class TestOnMessage(unittest.TestCase):
                 self.tracker.on_message(client, userdata, ChirpMessage)
                 self.assertEqual(len(log.output), 1)
                 self.assertEqual(len(log.records), 1)
-                self.assertIn(f"Tracker.on_message(): Message did not parse correctly, {ve}", log.output[0])
+                self.assertIn(f"Tracker.submit_sync(): Message did not parse correctly, {ve}", log.output[0])
 
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.patch")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
     @patch('app.manifest.Manifest.load_manifest')
@@ -1086,8 +1550,8 @@ class TestOnMessage(unittest.TestCase):
         patch_calls[2].assert_called_once_with(f"{API_INTERFACE}/lorawankeys/{VSN}/{deveui}/", headers=self.tracker.d_client.auth_header, json=update_lk_data)
         self.assertTrue(self.manifest.dict["lorawanconnections"][0] == update_manifest_data) #self.manifest.dict["lorawanconnections"][0] is 7d1f5420e81235c1 device
 
-    @patch("app.django_client.HttpMethod.POST")
-    @patch("app.django_client.HttpMethod.PATCH")
+    @patch("requests.Session.post")
+    @patch("requests.Session.patch")
     @patch("app.django_client.DjangoClient.ld_search")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
     @patch('chirpstack_api_wrapper.api.DeviceServiceStub')
@@ -1184,7 +1648,7 @@ class TestOnMessage(unittest.TestCase):
         post_calls[1].assert_called_once_with(f"{API_INTERFACE}/lorawankeys/", headers=self.tracker.d_client.auth_header, json=create_lk_data)
         self.assertTrue(self.manifest.dict["lorawanconnections"][-1] == update_manifest_data)
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch("app.django_client.DjangoClient.get_sh")
     @patch("app.django_client.DjangoClient.sh_search")
     @patch("app.django_client.DjangoClient.ld_search")
@@ -1289,7 +1753,7 @@ class TestOnMessage(unittest.TestCase):
         self.assertTrue(self.manifest.dict["lorawanconnections"][-1] == update_manifest_data)
 
 
-    @patch("app.django_client.HttpMethod.POST")
+    @patch("requests.Session.post")
     @patch("app.django_client.DjangoClient.sh_search")
     @patch("app.django_client.DjangoClient.ld_search")
     @patch('chirpstack_api_wrapper.api.DeviceProfileServiceStub')
@@ -1396,4 +1860,691 @@ class TestOnMessage(unittest.TestCase):
         post_calls[1].assert_called_once_with( f"{API_INTERFACE}/lorawandevices/", headers=self.tracker.d_client.auth_header, json=create_ld_data)
         post_calls[2].assert_called_once_with(f"{API_INTERFACE}/lorawanconnections/", headers=self.tracker.d_client.auth_header, json=create_lc_data)
         post_calls[3].assert_called_once_with(f"{API_INTERFACE}/lorawankeys/", headers=self.tracker.d_client.auth_header, json=create_lk_data)
-        self.assertTrue(self.manifest.dict["lorawanconnections"][-1] == update_manifest_data)
\ No newline at end of file
+        self.assertTrue(self.manifest.dict["lorawanconnections"][-1] == update_manifest_data)
+
+    @patch('app.tracker.Tracker.sync_device')
+    def test_on_message_dispatch(self, mock_sync_device):
+        """
+        Test on_message() hands the device sync to the dispatcher instead of running it
+        """
+        #Arrange
+        ChirpMessage = Mock()
+        ChirpMessage.payload = f'{self.MESSAGE}'.encode("utf-8")
+        ChirpMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/up"
+        self.tracker.dispatcher = Mock()
+
+        #call the action in testing
+        self.tracker.on_message(Mock(), Mock(), ChirpMessage)
+
+        # Assertions
+        self.tracker.dispatcher.submit.assert_called_once_with(UPLINK.deveui, self.tracker.sync, UPLINK)
+        mock_sync_device.assert_not_called()
+
+    @patch('app.tracker.Tracker.retry_sync')
+    @patch('app.tracker.Tracker.sync_device')
+    def test_sync_deadline_exceeded(self, mock_sync_device, mock_retry_sync):
+        """
+        Test sync() hands the device to the retry path when the deadline is exceeded
+        """
+        #Arrange
+        mock_sync_device.side_effect = DeadlineExceeded("DjangoClient.timeout(): deadline exceeded")
+
+        #call the action in testing
+        with self.assertLogs(level='ERROR'):
+            self.tracker.sync(UPLINK)
+
+        # Assertions
+        mock_sync_device.assert_called_once_with(UPLINK)
+        mock_retry_sync.assert_called_once_with(UPLINK.deveui, UPLINK)
+
+    @patch('app.tracker.Tracker.retry_sync')
+    def test_queue_sync_lane_full(self, mock_retry_sync):
+        """
+        Test queue_sync() retries the sync instead of dropping it when the device's lane is full
+        """
+        #Arrange
+        self.tracker.dispatcher = Mock()
+        self.tracker.dispatcher.submit.side_effect = [True, False]
+
+        #call the action in testing and Assertions
+        self.tracker.queue_sync(UPLINK.deveui, UPLINK)
+        mock_retry_sync.assert_not_called()
+        with self.assertLogs(level='WARNING'):
+            self.tracker.queue_sync(UPLINK.deveui, UPLINK)
+        mock_retry_sync.assert_called_once_with(UPLINK.deveui, UPLINK)
+
+    @patch('app.tracker.Tracker.queue_sync')
+    def test_retry_sync(self, mock_queue_sync):
+        """
+        Test retry_sync() queues the sync again after the delay and only once per device
+        """
+        #Arrange
+        self.tracker.args.retry_delay = 0.05
+
+        #call the action in testing
+        self.tracker.retry_sync(UPLINK.deveui, UPLINK)
+        self.tracker.retry_sync(UPLINK.deveui, UPLINK)
+        time.sleep(0.2)
+
+        # Assertions
+        mock_queue_sync.assert_called_once_with(UPLINK.deveui, UPLINK)
+        self.assertEqual(self.tracker.retry_timers, {})
+
+    @patch('chirpstack_api_wrapper.grpc.insecure_channel')
+    def test_pool_size_default(self, mock_insecure_channel):
+        """
+        Test the django connection pool is sized for the fan-out of every worker when no pool size is set
+        """
+        #Arrange
+        self.args.pool_size = None
+        self.args.workers = 2
+
+        #call the action in testing
+        tracker = Tracker(self.args)
+        tracker.dispatcher.stop()
+
+        # Assertions
+        self.assertEqual(self.args.pool_size, 6)
+        self.assertEqual(tracker.d_client.adapter._pool_maxsize, 6)
+        self.assertEqual(tracker.executor._max_workers, 6)
+
+    @patch('app.tracker.Tracker.queue_sync')
+    @patch('app.tracker.Tracker.sync_device')
+    def test_retry_sync_newest_uplink(self, mock_sync_device, mock_queue_sync):
+        """
+        Test a pending retry syncs the device's newest uplink instead of the one that failed,
+        whether the newer sync failed or not, and keeps the failed uplink's join
+        """
+        #Arrange
+        self.tracker.args.retry_delay = 0.05
+        join = dataclasses.replace(UPLINK, join=True, time="2023-01-01T00:00:00Z")
+        up = dataclasses.replace(UPLINK, join=False, time="2023-01-01T00:00:05Z")
+
+        for newer_result in [None, DeadlineExceeded("DjangoClient.timeout(): deadline exceeded")]:
+            with self.subTest(newer_result=newer_result):
+                mock_queue_sync.reset_mock()
+                mock_sync_device.side_effect = [DeadlineExceeded("DjangoClient.timeout(): deadline exceeded"), newer_result]
+
+                #call the action in testing
+                with self.assertLogs(level='ERROR'):
+                    self.tracker.sync(join)
+                    self.tracker.sync(up)
+                time.sleep(0.2)
+
+                # Assertions
+                mock_queue_sync.assert_called_once()
+                deveui, retried = mock_queue_sync.call_args[0]
+                self.assertEqual(deveui, UPLINK.deveui)
+                self.assertEqual(retried.time, up.time)
+                self.assertTrue(retried.join)
+                self.assertEqual(self.tracker.retry_uplinks, {})
+
+    def test_get_chirpstack_data_concurrent(self):
+        """
+        Test get_chirpstack_data() makes the chirpstack calls concurrently instead of one after another
+        """
+        #Arrange
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui", device_profile_id="mock_profile_id")
+        def slow(ret_val):
+            def fn(*args):
+                time.sleep(0.1)
+                return ret_val
+            return fn
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device.side_effect = slow(self.mock_chirp_methods.get_device_ret_val)
+        self.tracker.c_client.get_device_profile.side_effect = slow(self.mock_chirp_methods.get_device_profile_ret_val)
+        self.tracker.c_client.get_device_activation.side_effect = slow(self.mock_chirp_methods.get_device_activation_ret_val)
+        self.tracker.c_client.get_device_app_key.side_effect = slow(self.mock_chirp_methods.get_device_app_key_ret_val)
+
+        #call the action in testing
+        start = time.monotonic()
+        result = self.tracker.get_chirpstack_data(uplink)
+        elapsed = time.monotonic() - start
+
+        # Assertions
+        self.assertEqual(result, (
+            self.mock_chirp_methods.get_device_ret_val,
+            self.mock_chirp_methods.get_device_profile_ret_val,
+            self.mock_chirp_methods.get_device_activation_ret_val,
+            self.mock_chirp_methods.get_device_app_key_ret_val
+        ))
+        #the app key waits on the device profile, the rest overlap: ~0.2s instead of ~0.4s
+        self.assertLess(elapsed, 0.35)
+
+    def test_get_chirpstack_data_partial_failure(self):
+        """
+        Test get_chirpstack_data() keeps the device data when only the activation fails
+        and raises when the device can not be retrieved
+        """
+        #Arrange
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui", device_profile_id="mock_profile_id")
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device.return_value = self.mock_chirp_methods.get_device_ret_val
+        self.tracker.c_client.get_device_profile.return_value = self.mock_chirp_methods.get_device_profile_ret_val
+        self.tracker.c_client.get_device_activation.side_effect = Exception("activation not found")
+        self.tracker.c_client.get_device_app_key.return_value = self.mock_chirp_methods.get_device_app_key_ret_val
+
+        #call the action in testing
+        with self.assertLogs(level='ERROR'):
+            device_resp, deviceprofile_resp, act_resp, key_resp = self.tracker.get_chirpstack_data(uplink)
+        self.tracker.c_client.get_device.side_effect = Exception("device not found")
+
+        # Assertions
+        self.assertEqual(device_resp, self.mock_chirp_methods.get_device_ret_val)
+        self.assertIsNone(act_resp)
+        with self.assertRaises(Exception):
+            self.tracker.get_chirpstack_data(uplink)
+
+    def test_get_chirpstack_data_from_payload(self):
+        """
+        Test get_chirpstack_data() skips get_device() with last_seen_from_payload once the device's
+        battery level and margin are known, and calls it otherwise
+        """
+        #Arrange
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui", device_profile_id="mock_profile_id")
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device.return_value = self.mock_chirp_methods.get_device_ret_val
+        self.tracker.c_client.get_device_profile.return_value = self.mock_chirp_methods.get_device_profile_ret_val
+        self.tracker.args.last_seen_from_payload = True
+
+        #call the action in testing and Assertions
+        #no status values synced yet
+        device_resp, _, _, _ = self.tracker.get_chirpstack_data(uplink, False)
+        self.assertEqual(device_resp, self.mock_chirp_methods.get_device_ret_val)
+        #status values synced
+        self.tracker.snapshots.update("ld", "mock_dev_eui", {"battery_level": 90})
+        self.tracker.snapshots.update("lc", "mock_dev_eui", {"margin": 7})
+        device_resp, _, _, _ = self.tracker.get_chirpstack_data(uplink, False)
+        self.assertEqual(self.tracker.c_client.get_device.call_count, 1)
+        self.assertEqual(device_resp.device.name, "Test device")
+        self.assertEqual(device_resp.device_status.battery_level, 90)
+        self.assertEqual(device_resp.device_status.margin, 7)
+        self.assertEqual(self.tracker.device_lookups_skipped, 1)
+        #the uplink has no valid time
+        self.tracker.get_chirpstack_data(dataclasses.replace(uplink, time="not a time"), False)
+        self.assertEqual(self.tracker.c_client.get_device.call_count, 2)
+        #the option is off
+        self.tracker.args.last_seen_from_payload = False
+        self.tracker.get_chirpstack_data(uplink, False)
+        self.assertEqual(self.tracker.c_client.get_device.call_count, 3)
+
+    def test_run_concurrently(self):
+        """
+        Test run_concurrently() runs the calls at the same time and returns their results in order
+        """
+        #Arrange
+        def slow(ret_val):
+            time.sleep(0.1)
+            return ret_val
+
+        #call the action in testing
+        start = time.monotonic()
+        result = self.tracker.run_concurrently([(slow, "ld"), (slow, "lc"), (slow, "lk")])
+        elapsed = time.monotonic() - start
+
+        # Assertions
+        self.assertEqual(result, ["ld", "lc", "lk"])
+        self.assertLess(elapsed, 0.25)
+
+    def test_run_concurrently_errors(self):
+        """
+        Test run_concurrently() lets every call finish, logs each error and raises the first one
+        """
+        #Arrange
+        done = Mock()
+        def fail(msg):
+            raise requests.exceptions.HTTPError(msg)
+
+        #call the action in testing
+        with self.assertLogs(level='ERROR') as logs:
+            with self.assertRaises(requests.exceptions.HTTPError) as cm:
+                self.tracker.run_concurrently([(fail, "ld failed"), (done, "lc"), (fail, "lk failed")])
+
+        # Assertions
+        self.assertEqual(str(cm.exception), "ld failed")
+        self.assertEqual(len(logs.output), 2)
+        done.assert_called_once_with("lc")
+
+    def test_get_device_profile_cached(self):
+        """
+        Test get_device_profile() retrieves a profile from chirpstack once while it is fresh
+        """
+        #Arrange
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device_profile.return_value = self.mock_chirp_methods.get_device_profile_ret_val
+
+        #call the action in testing
+        first = self.tracker.get_device_profile("mock_profile_id")
+        second = self.tracker.get_device_profile("mock_profile_id")
+
+        # Assertions
+        self.tracker.c_client.get_device_profile.assert_called_once_with("mock_profile_id")
+        self.assertIs(first, second)
+        self.assertEqual(self.tracker.profiles.hits, 1)
+        self.assertEqual(self.tracker.profiles.misses, 1)
+
+    def test_get_device_profile_stale(self):
+        """
+        Test get_device_profile() blocks on a stale profile unless profile_refresh is set,
+        then the stale profile is returned and refreshed in the background
+        """
+        #Arrange
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device_profile.side_effect = ["v1", "v2", "v3"]
+        self.tracker.profiles.ttl = 0.05
+
+        #call the action in testing
+        self.assertEqual(self.tracker.get_device_profile("mock_profile_id"), "v1")
+        time.sleep(0.1)
+        self.assertEqual(self.tracker.get_device_profile("mock_profile_id"), "v2")
+        self.tracker.args.profile_refresh = True
+        time.sleep(0.1)
+        self.assertEqual(self.tracker.get_device_profile("mock_profile_id"), "v2")
+        self.tracker.executor.shutdown()
+
+        # Assertions
+        self.assertEqual(self.tracker.get_device_profile("mock_profile_id"), "v3")
+        self.assertEqual(self.tracker.c_client.get_device_profile.call_count, 3)
+        self.assertEqual(self.tracker.profiles_refreshing, set())
+
+    def test_get_device_profile_single_flight(self):
+        """
+        Test concurrent get_device_profile() calls for a profile that is not cached retrieve it from chirpstack once
+        """
+        #Arrange
+        release = threading.Event()
+        def get_device_profile(profile_id):
+            release.wait(5)
+            return self.mock_chirp_methods.get_device_profile_ret_val
+        self.tracker.c_client = Mock()
+        self.tracker.c_client.get_device_profile.side_effect = get_device_profile
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.tracker.get_device_profile("mock_profile_id"))) for _ in range(3)]
+
+        #call the action in testing
+        for thread in threads:
+            thread.start()
+        while self.tracker.flights.calls_shared < 2:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # Assertions
+        self.tracker.c_client.get_device_profile.assert_called_once_with("mock_profile_id")
+        self.assertEqual(results, [self.mock_chirp_methods.get_device_profile_ret_val] * 3)
+        self.assertIs(self.tracker.flights, self.tracker.d_client.flights)
+
+    @patch('app.tracker.Tracker.last_seen_at')
+    @patch('app.tracker.Tracker.update_manifest')
+    @patch('app.tracker.Tracker.create_lk')
+    @patch('app.tracker.Tracker.create_lc')
+    @patch('app.tracker.Tracker.create_ld')
+    @patch('app.tracker.Tracker.get_chirpstack_data')
+    def test_sync_device_sh_single_flight(self, mock_get_chirpstack_data, mock_create_ld, mock_create_lc, mock_create_lk, mock_update_manifest, mock_last_seen_at):
+        """
+        Test two new devices with the same new hw_model syncing at once create the sensor hardware once
+        """
+        #Arrange
+        release = threading.Event()
+        def create_sh(data):
+            release.wait(5)
+            return {"headers": {}, "status_code": 201, "json_body": {"id": 1}}
+        mock_get_chirpstack_data.return_value = (Mock(), self.mock_chirp_methods.get_device_profile_ret_val, Mock(), "mock_key")
+        mock_create_lk.return_value = False
+        self.tracker.d_client = Mock()
+        self.tracker.d_client.lc_search.return_value = False
+        self.tracker.d_client.ld_search.return_value = False
+        self.tracker.d_client.sh_search.return_value = False
+        self.tracker.d_client.create_sh.side_effect = create_sh
+        uplinks = [dataclasses.replace(UPLINK, deveui=deveui) for deveui in ("mock_dev_eui_1", "mock_dev_eui_2")]
+        threads = [threading.Thread(target=self.tracker.sync_device, args=(uplink,)) for uplink in uplinks]
+
+        #call the action in testing
+        for thread in threads:
+            thread.start()
+        while self.tracker.flights.calls_shared < 1:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        # Assertions
+        self.tracker.d_client.create_sh.assert_called_once()
+        mock_create_ld.assert_any_call("mock_dev_eui_1", 1, mock_get_chirpstack_data.return_value[0])
+        mock_create_ld.assert_any_call("mock_dev_eui_2", 1, mock_get_chirpstack_data.return_value[0])
+
+    def test_keys_due(self):
+        """
+        Test keys_due() only asks for a key sync on a join, a devAddr change or after the safety interval
+        """
+        #Arrange
+        self.tracker.args.key_sync_interval = 3600
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui")
+        act_resp = Mock()
+        act_resp.device_activation.dev_addr = "00189440"
+
+        #call the action in testing and Assertions
+        self.assertTrue(self.tracker.keys_due(uplink))
+        self.tracker.keys_synced("mock_dev_eui", act_resp)
+        self.assertFalse(self.tracker.keys_due(uplink))
+        self.assertFalse(self.tracker.keys_due(dataclasses.replace(uplink, dev_addr=None)))
+        self.assertTrue(self.tracker.keys_due(dataclasses.replace(uplink, dev_addr="01fa3a4b")))
+        self.assertTrue(self.tracker.keys_due(dataclasses.replace(uplink, join=True)))
+        self.tracker.args.key_sync_interval = 0
+        self.assertTrue(self.tracker.keys_due(uplink))
+
+    @patch('app.tracker.Tracker.last_seen_at')
+    @patch('app.tracker.Tracker.update_manifest')
+    @patch('app.tracker.Tracker.run_concurrently')
+    @patch('app.tracker.Tracker.get_chirpstack_data')
+    def test_sync_device_skips_keys(self, mock_get_chirpstack_data, mock_run_concurrently, mock_update_manifest, mock_last_seen_at):
+        """
+        Test sync_device() does not retrieve or update keys when they are not due
+        """
+        #Arrange
+        self.tracker.args.key_sync_interval = 3600
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui", device_profile_id="mock_profile_id")
+        act_resp = Mock()
+        act_resp.device_activation.dev_addr = "00189440"
+        self.tracker.keys_synced("mock_dev_eui", act_resp)
+        mock_get_chirpstack_data.return_value = (Mock(), Mock(), None, None)
+        self.tracker.d_client = Mock()
+        self.tracker.d_client.lc_search.return_value = True
+
+        #call the action in testing
+        self.tracker.sync_device(uplink)
+
+        # Assertions
+        mock_get_chirpstack_data.assert_called_once_with(uplink, False)
+        updates = [call[0] for call in mock_run_concurrently.call_args[0][0]]
+        self.assertEqual(updates, [self.tracker.update_ld, self.tracker.update_lc])
+
+    @patch('app.tracker.Tracker.last_seen_at')
+    @patch('app.tracker.Tracker.update_manifest')
+    @patch('app.tracker.Tracker.create_lk')
+    @patch('app.tracker.Tracker.create_lc')
+    @patch('app.tracker.Tracker.update_ld')
+    @patch('app.tracker.Tracker.run_concurrently')
+    @patch('app.tracker.Tracker.get_chirpstack_data')
+    def test_sync_device_keys_failed(self, mock_get_chirpstack_data, mock_run_concurrently, mock_update_ld, mock_create_lc, mock_create_lk, mock_update_manifest, mock_last_seen_at):
+        """
+        Test sync_device() only records the key sync when django has the keys
+        """
+        #Arrange
+        self.tracker.args.key_sync_interval = 3600
+        uplink = dataclasses.replace(UPLINK, deveui="mock_dev_eui", device_profile_id="mock_profile_id")
+        act_resp = Mock()
+        act_resp.device_activation.dev_addr = "00189440"
+        mock_get_chirpstack_data.return_value = (Mock(), Mock(), act_resp, "mock_key")
+        self.tracker.d_client = Mock()
+
+        #call the action in testing and Assertions
+        #update_lk failed
+        self.tracker.d_client.lc_search.return_value = True
+        mock_run_concurrently.return_value = [None, None, False]
+        self.tracker.sync_device(uplink)
+        self.assertTrue(self.tracker.keys_due(uplink))
+        #create_lk failed
+        self.tracker.d_client.lc_search.return_value = False
+        mock_create_lk.return_value = False
+        self.tracker.sync_device(uplink)
+        mock_create_lk.assert_called_once()
+        self.assertTrue(self.tracker.keys_due(uplink))
+        #update_lk succeeded or the keys did not change
+        self.tracker.d_client.lc_search.return_value = True
+        mock_run_concurrently.return_value = [None, None, True]
+        self.tracker.sync_device(uplink)
+        self.assertFalse(self.tracker.keys_due(uplink))
+
+    def test_merge_uplinks(self):
+        """
+        Test merge_uplinks() keeps the latest uplink but not at the cost of a pending join
+        """
+        #Arrange
+        join = dataclasses.replace(UPLINK, join=True, time="2023-01-01T00:00:00Z")
+        up = dataclasses.replace(UPLINK, join=False, time="2023-01-01T00:00:05Z")
+
+        #call the action in testing and Assertions
+        merged, = self.tracker.merge_uplinks((join,), (up,))
+        self.assertTrue(merged.join)
+        self.assertEqual(merged.time, up.time)
+        self.assertIs(self.tracker.merge_uplinks((up,), (join,))[0], join)
+        self.assertIs(self.tracker.merge_uplinks((up,), (up,))[0], up)
+        self.assertIs(self.tracker.coalescer.merge, self.tracker.merge_uplinks)
+
+    @patch('app.tracker.tracker.MqttClient.run')
+    def test_run_logs_stats(self, mock_run):
+        """
+        Test run() logs the stats every stats_interval seconds and once more on shutdown
+        """
+        #Arrange
+        self.tracker.args.stats_interval = 0.01
+        self.tracker.log_stats = Mock()
+        def network_loop():
+            while self.tracker.log_stats.call_count < 2:
+                time.sleep(0.001)
+        mock_run.side_effect = network_loop
+        self.tracker.d_client = Mock()
+
+        #call the action in testing
+        self.tracker.run()
+        count = self.tracker.log_stats.call_count
+        time.sleep(0.05)
+
+        # Assertions
+        self.assertGreaterEqual(count, 3)
+        self.assertEqual(self.tracker.log_stats.call_count, count) #stopped with the network loop
+        self.tracker.d_client.close.assert_called_once()
+
+    def test_log_stats(self):
+        """
+        Test log_stats() logs the mqtt, tracker, breaker, rate limit and outbox stats
+        """
+        #Arrange
+        self.tracker.snapshots.diff("lc", "mock_dev_eui", {"margin": 5})
+        LogMessage = Mock()
+        LogMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/log"
+        self.tracker.route_message(Mock(), Mock(), LogMessage)
+
+        #call the action in testing
+        with self.assertLogs(level='INFO') as log:
+            self.tracker.log_stats()
+
+        # Assertions
+        output = "\n".join(log.output)
+        self.assertIn("mqtt messages per event {}, dropped 1", output)
+        self.assertIn("uplinks coalesced 0", output)
+        self.assertIn("django PATCHes sent 1, avoided 0", output)
+        self.assertIn("manifest writes 0, saves skipped 0", output)
+        self.assertIn("chirpstack get_device calls skipped 0", output)
+        self.assertIn("circuit breaker stats", output)
+        self.assertIn("rate limit stats", output)
+        self.assertNotIn("outbox stats", output) #no outbox configured
+
+    @patch('app.tracker.Tracker.sync_device')
+    def test_route_message_join(self, mock_sync_device):
+        """
+        Test a join event is routed to on_join() and asks for a key sync, other events are dropped
+        """
+        #Arrange
+        ChirpMessage = Mock()
+        ChirpMessage.payload = f'{self.MESSAGE}'.encode("utf-8")
+        ChirpMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/join"
+        self.tracker.dispatcher = Mock()
+        LogMessage = Mock()
+        LogMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/log"
+
+        #call the action in testing
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+        self.tracker.route_message(Mock(), Mock(), LogMessage)
+
+        # Assertions
+        self.tracker.dispatcher.submit.assert_called_once()
+        uplink = self.tracker.dispatcher.submit.call_args[0][2]
+        self.assertTrue(uplink.join)
+        self.assertEqual(self.tracker.dropped, 1)
+
+    def test_on_status(self):
+        """
+        Test on_status() hands the battery level and margin from the payload to the dispatcher
+        """
+        #Arrange
+        status = json.loads(self.MESSAGE)
+        status.update({"margin": 7, "externalPowerSource": False, "batteryLevelUnavailable": False, "batteryLevel": 75.5})
+        ChirpMessage = Mock()
+        ChirpMessage.payload = json.dumps(status).encode("utf-8")
+        ChirpMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/status"
+        self.tracker.dispatcher = Mock()
+
+        #call the action in testing
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+        status["batteryLevelUnavailable"] = True
+        ChirpMessage.payload = json.dumps(status).encode("utf-8")
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+
+        # Assertions
+        self.tracker.dispatcher.submit.assert_any_call("0101010101010101", self.tracker.sync_status, "0101010101010101", 75.5, 7)
+        self.tracker.dispatcher.submit.assert_called_with("0101010101010101", self.tracker.sync_status, "0101010101010101", None, 7)
+
+    def test_sync_status(self):
+        """
+        Test sync_status() patches only the changed battery level and margin and updates the manifest
+        """
+        #Arrange
+        deveui = self.manifest.dict["lorawanconnections"][0]["lorawandevice"]["deveui"]
+        self.tracker.d_client.lc_search = Mock(return_value=True)
+        self.tracker.d_client.update_ld = Mock(return_value={"json_body": {"battery_level": 80}})
+        self.tracker.d_client.update_lc = Mock(return_value={"json_body": {"margin": 5}})
+
+        #call the action in testing
+        with patch.object(Manifest, "save_manifest"):
+            self.tracker.sync_status(deveui, 80, 5)
+            self.tracker.sync_status(deveui, 80, 6)
+
+        # Assertions
+        self.tracker.d_client.update_ld.assert_called_once_with(deveui, {"battery_level": 80}, low_priority=True)
+        self.assertEqual(self.tracker.d_client.update_lc.call_count, 2)
+        self.tracker.d_client.update_lc.assert_called_with(deveui, {"margin": 6}, low_priority=True)
+        lc = self.manifest.dict["lorawanconnections"][self.manifest.ld_index(deveui)]
+        self.assertEqual(lc["margin"], 6)
+        self.assertEqual(lc["lorawandevice"]["battery_level"], 80)
+
+    def test_patch_changed_priority(self):
+        """
+        Test patch_changed() marks a PATCH of only routine refresh fields as low priority
+        and keeps the snapshot when it is deferred, so the next diff stays low priority
+        """
+        #Arrange
+        deferred = {"headers": {}, "status_code": 429, "json_body": None}
+        ok = {"headers": {}, "status_code": 200, "json_body": {"id": 1}}
+        update_fn = Mock(side_effect=[ok, deferred, ok, ok])
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "a"}, update_fn)
+
+        #call the action in testing
+        result = self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "c"}, update_fn)
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "d", "margin": 5}, update_fn)
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "e", "last_seen_at": "d", "margin": 5}, update_fn)
+
+        # Assertions
+        self.assertFalse(result)
+        update_fn.assert_any_call("mock_dev_eui", {"last_seen_at": "c"}, low_priority=True)
+        update_fn.assert_any_call("mock_dev_eui", {"last_seen_at": "d", "margin": 5}, low_priority=True)
+        update_fn.assert_called_with("mock_dev_eui", {"connection_name": "e"})
+
+    def test_patch_changed_rejected(self):
+        """
+        Test patch_changed() sends the full record next time django rejects the PATCH
+        """
+        #Arrange
+        rejected = {"headers": {}, "status_code": 404, "json_body": None}
+        ok = {"headers": {}, "status_code": 200, "json_body": {"id": 1}}
+        update_fn = Mock(side_effect=[ok, rejected, ok])
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "a"}, update_fn)
+
+        #call the action in testing
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "c"}, update_fn)
+        self.tracker.patch_changed("lc", "mock_dev_eui", {"connection_name": "b", "last_seen_at": "c"}, update_fn)
+
+        # Assertions
+        update_fn.assert_called_with("mock_dev_eui", {"connection_name": "b", "last_seen_at": "c"})
+
+    def test_sync_status_unknown_device(self):
+        """
+        Test sync_status() leaves devices that are not in django to the uplink sync
+        """
+        #Arrange
+        self.tracker.d_client.lc_search = Mock(return_value=False)
+        self.tracker.d_client.update_ld = Mock()
+        self.tracker.d_client.update_lc = Mock()
+
+        #call the action in testing
+        self.tracker.sync_status("mock_dev_eui", 80, 5)
+
+        # Assertions
+        self.tracker.d_client.update_ld.assert_not_called()
+        self.tracker.d_client.update_lc.assert_not_called()
+        self.assertIsNone(self.manifest.ld_index("mock_dev_eui"))
+
+    def test_last_seen_at(self):
+        """
+        Test last_seen_at() takes the uplink's time only with last_seen_from_payload,
+        and falls back to chirpstack's last_seen_at when the time is missing or invalid
+        """
+        #Arrange
+        device_resp = self.mock_chirp_methods.get_device_ret_val
+        datetime_obj_utc = epoch_to_UTC(device_resp.last_seen_at.seconds, device_resp.last_seen_at.nanos)
+        chirpstack_last_seen_at = datetime_obj_utc.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        #call the action in testing and Assertions
+        self.assertEqual(self.tracker.last_seen_at(UPLINK, device_resp), chirpstack_last_seen_at)
+        self.tracker.args.last_seen_from_payload = True
+        self.assertEqual(self.tracker.last_seen_at(UPLINK, device_resp), "2022-07-18T09:34:15Z")
+        self.assertEqual(self.tracker.last_seen_at(None, device_resp), chirpstack_last_seen_at)
+        self.assertEqual(self.tracker.last_seen_at(dataclasses.replace(UPLINK, time=None), device_resp), chirpstack_last_seen_at)
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(self.tracker.last_seen_at(dataclasses.replace(UPLINK, time="yesterday"), device_resp), chirpstack_last_seen_at)
+
+    def test_submit_sync_duplicate(self):
+        """
+        Test a redelivered uplink with a deduplicationId that was already received is dropped
+        """
+        #Arrange
+        self.tracker.recent = RecentSet(16, 600)
+        ChirpMessage = Mock()
+        ChirpMessage.payload = f'{self.MESSAGE}'.encode("utf-8")
+        ChirpMessage.topic = "application/17c82e96-be03-4f38-aef3-f83d48582d97/device/0101010101010101/event/up"
+        self.tracker.dispatcher = Mock()
+
+        #call the action in testing
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+        ChirpMessage.topic = ChirpMessage.topic.replace("/event/up", "/event/join")
+        self.tracker.route_message(Mock(), Mock(), ChirpMessage)
+
+        # Assertions
+        self.assertEqual(self.tracker.dispatcher.submit.call_count, 2)
+        self.assertEqual(self.tracker.recent.hits, 1)
+
+    @patch('app.mqtt_client.parse.json.loads', wraps=json.loads)
+    def test_submit_sync_parse_once(self, mock_loads):
+        """
+        Test a message is only decoded once when it is logged for debugging and synced,
+        and only one of every debug_sample messages is logged
+        """
+        #Arrange
+        self.tracker.args.debug = True
+        self.tracker.args.debug_sample = 2
+        ChirpMessage = Mock()
+        ChirpMessage.payload = f'{self.MESSAGE}'.encode("utf-8")
+        self.tracker.dispatcher = Mock()
+
+        #call the action in testing
+        with self.assertLogs(level='DEBUG') as logs:
+            self.tracker.on_message(Mock(), Mock(), ChirpMessage)
+            self.tracker.on_message(Mock(), Mock(), ChirpMessage)
+
+        # Assertions
+        self.assertEqual(mock_loads.call_count, 2)
+        self.assertEqual(len([line for line in logs.output if "LORAWAN Message received" in line]), 1)
+        self.assertEqual(self.tracker.dispatcher.submit.call_count, 2)
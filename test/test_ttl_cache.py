@@ -0,0 +1,105 @@
+import unittest
+import time
+from app.cache import TTLCache
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_get_set(self):
+        """
+        Test a value that was set is returned and hits/misses are counted
+        """
+        cache = TTLCache()
+
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", "value")
+
+        self.assertEqual(cache.get("key"), "value")
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 1)
+
+    def test_get_default(self):
+        """
+        Test get() returns default for a missing key
+        """
+        cache = TTLCache()
+
+        self.assertEqual(cache.get("key", "default"), "default")
+
+    def test_falsy_values(self):
+        """
+        Test falsy values are cached
+        """
+        cache = TTLCache()
+        cache.set("key", False)
+
+        self.assertIs(cache.get("key"), False)
+        self.assertIn("key", cache)
+
+    def test_ttl_expires(self):
+        """
+        Test an entry expires after the cache's ttl
+        """
+        cache = TTLCache(ttl=0.05)
+        cache.set("key", "value")
+
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get("key"))
+        self.assertNotIn("key", cache)
+
+    def test_ttl_override(self):
+        """
+        Test the ttl passed to set() overrides the cache's ttl
+        """
+        cache = TTLCache(ttl=0.05)
+        cache.set("key", "value", ttl=60)
+
+        time.sleep(0.1)
+
+        self.assertEqual(cache.get("key"), "value")
+
+    def test_maxsize_evicts_lru(self):
+        """
+        Test the least recently used entry is evicted when the cache is full
+        """
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a") #b is now the least recently used
+        cache.set("c", 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+
+    def test_get_stale(self):
+        """
+        Test get_stale() returns an expired entry instead of removing it
+        """
+        cache = TTLCache(ttl=0.05)
+        cache.set("key", "value")
+
+        self.assertEqual(cache.get_stale("key"), ("value", False))
+        time.sleep(0.1)
+        self.assertEqual(cache.get_stale("key"), ("value", True))
+        self.assertEqual(cache.get_stale("missing", "default"), ("default", True))
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cache.misses, 2)
+        self.assertEqual(len(cache), 1)
+
+    def test_pop_clear(self):
+        """
+        Test pop() and clear() remove entries
+        """
+        cache = TTLCache()
+        cache.set("a", 1)
+        cache.set("b", 2)
+
+        self.assertEqual(cache.pop("a"), 1)
+        self.assertIsNone(cache.pop("a"))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+
+if __name__ == "__main__":
+    unittest.main()